@@ -2,14 +2,16 @@
 import streamlit as st
 import pandas as pd
 import yaml
-from yaml.loader import SafeLoader
-import streamlit_authenticator as stauth
-# from datetime import datetime # Non più usata direttamente qui
+from utils.auth import get_authenticator, get_ruolo_utente # config.yaml in cache per processo
+from datetime import date # Riferimento per il controllo (non bloccante) sull'età da CF
 from utils.db import init_db, log_activity # log_activity può essere utile
 from utils.common_utils import (
-    sanitize_filename_component, convert_df_to_excel_bytes, generate_timestamp_filename,
-    parse_excel_currency, validate_rif_pa_format,
-    run_detailed_validations # Importa la nuova funzione di validazione centralizzata
+    sanitize_filename_component, convert_df_to_excel_bytes, generate_timestamp_filename, validate_rif_pa_format,
+    pagina_esiti, # Messaggi degli esiti composti solo per la pagina mostrata
+)
+from utils.validation_rules import get_regole, fmt_limite
+from utils.paste_validation import (
+    NOMI_COLONNE_PASTED_DATA, split_righe_incollate, validate_righe_incrementale, validate_richiedente_df,
 )
 import os
 from io import StringIO
@@ -20,20 +22,14 @@ from io import StringIO
 st.set_page_config(page_title="Comunicazione Spese Centri Estivi", layout="wide", initial_sidebar_state="expanded")
 
 # --- Costanti ---
-NOMI_COLONNE_PASTED_DATA = [
-    'numero_mandato','data_mandato','comune_titolare_mandato','importo_mandato',
-    'comune_centro_estivo','centro_estivo','genitore_cognome_nome','bambino_cognome_nome',
-    'codice_fiscale_bambino','valore_contributo_fse','altri_contributi',
-    'quota_retta_destinatario','totale_retta','numero_settimane_frequenza',
-    'controlli_formali_dichiarati' # Colonna 15
-]
+# NOMI_COLONNE_PASTED_DATA (le 15 colonne incollate dal richiedente) è in utils/paste_validation.py
 
 COLONNE_OUTPUT_FINALE_SIFER = [
     'rif_pa', 'cup', 'distretto', 'comune_capofila', 'numero_mandato', 'data_mandato', 
     'comune_titolare_mandato', 'importo_mandato', 'comune_centro_estivo', 'centro_estivo', 
     'genitore_cognome_nome', 'bambino_cognome_nome', 'codice_fiscale_bambino', # CF pulito e validato
     'valore_contributo_fse', 'altri_contributi', 'quota_retta_destinatario', 'totale_retta', 
-    'numero_settimane_frequenza', 'controlli_formali' # Questo sarà il 5% calcolato
+    'numero_settimane_frequenza', 'controlli_formali' # Questa sarà la percentuale (regola controlli_formali) calcolata
 ]
 
 # --- Funzioni UI ---
@@ -41,8 +37,7 @@ def display_login_form():
     """Visualizza il form di login e gestisce l'autenticazione."""
     st.subheader("🔑 Accesso Utente")
     try:
-        with open('config.yaml') as file:
-            config_data = yaml.load(file, Loader=SafeLoader)
+        authenticator = get_authenticator() # config.yaml letto e parsato solo se cambiato (utils/auth.py)
     except FileNotFoundError:
         st.error("🚨 Errore critico: File 'config.yaml' non trovato. L'applicazione non può avviarsi.")
         log_activity("System", "CONFIG_ERROR", "config.yaml not found")
@@ -55,29 +50,13 @@ def display_login_form():
         st.session_state['authentication_status'] = None
         st.stop()
         return None
-    except Exception as e: # Cattura altre eccezioni durante il caricamento
-        st.error(f"🚨 Errore critico nel caricamento di config.yaml: {e}")
-        log_activity("System", "CONFIG_LOAD_ERROR", str(e))
-        st.session_state['authentication_status'] = None
-        st.stop()
-        return None
-
-    try:
-        authenticator = stauth.Authenticate(
-            config_data['credentials'],
-            config_data['cookie']['name'],
-            config_data['cookie']['key'],
-            config_data['cookie']['expiry_days'],
-            # preauthorized=config_data.get('preauthorized', {}) # Opzionale per preautorizzazioni
-        )
-        st.session_state['authenticator'] = authenticator
     except KeyError as e:
         st.error(f"🚨 Errore nella configurazione di autenticazione: chiave '{e}' mancante in 'config.yaml'.")
         log_activity("System", "AUTH_INIT_CONFIG_KEY_ERROR", str(e))
         st.session_state['authentication_status'] = None
         st.stop()
         return None
-    except Exception as e: # Altri errori durante l'init di Authenticate
+    except Exception as e: # Altri errori nel caricamento di config.yaml o durante l'init di Authenticate
         st.error(f"🚨 Errore durante l'inizializzazione del sistema di autenticazione: {e}")
         log_activity("System", "AUTH_INIT_ERROR", str(e))
         st.session_state['authentication_status'] = None
@@ -106,8 +85,7 @@ def display_login_form():
     if authentication_status is True:
         st.session_state.update({'name': name, 'username': username})
         try:
-            user_config = config_data['credentials']['usernames'].get(username, {})
-            st.session_state['user_role'] = user_config.get('role', 'user') # Default a 'user' se ruolo non specificato
+            st.session_state['user_role'] = get_ruolo_utente(username) # Default a 'user' se ruolo non specificato
             log_activity(username, "LOGIN_SUCCESS", f"Role: {st.session_state['user_role']}")
         except KeyError: # Dovrebbe essere già gestito da .get, ma per sicurezza
             st.session_state['user_role'] = 'user' # Fallback sicuro
@@ -123,6 +101,62 @@ def display_login_form():
     return authentication_status
 
 
+def prepara_export_richiedente(df_check: pd.DataFrame, metadati: dict) -> dict:
+    """
+    Dati normalizzati per SIFER e quadro di controllo dai dati validati del richiedente:
+    anteprima, CSV ed Excel dei dati, quadro (per la visualizzazione), CSV ed Excel del quadro.
+    """
+    df_validated_output = df_check.copy()
+    # Aggiungi metadati al DataFrame di output
+    for key, value in metadati.items():
+        df_validated_output[key] = value
+    
+    # Calcola la colonna finale 'controlli_formali' come percentuale del FSE (verità ultima per l'export),
+    # con la percentuale della regola di validazione
+    percentuale_cf = get_regole()['parametri']['controlli_formali']['percentuale']
+    etichetta_cf = f"{fmt_limite(percentuale_cf * 100)}% di A" # Le voci del quadro riportano la percentuale configurata
+    df_validated_output['controlli_formali'] = round(df_validated_output['valore_contributo_fse'] * percentuale_cf, 2)
+    
+    # Gestisci colonne CF: usa quella pulita e rinominala
+    if 'codice_fiscale_bambino' in df_validated_output.columns: # Colonna originale
+         df_validated_output.drop(columns=['codice_fiscale_bambino'], inplace=True, errors='ignore')
+    if 'codice_fiscale_bambino_pulito' in df_validated_output.columns:
+        df_validated_output.rename(columns={'codice_fiscale_bambino_pulito': 'codice_fiscale_bambino'}, inplace=True)
+
+    # Seleziona e ordina colonne per l'output finale SIFER
+    df_output_sifer = df_validated_output[[col for col in COLONNE_OUTPUT_FINALE_SIFER if col in df_validated_output.columns]].copy()
+
+    # Anteprima ed export CSV con le date come GG/MM/AAAA (stessa conversione)
+    df_export_csv = df_output_sifer.copy()
+    if 'data_mandato' in df_export_csv.columns:
+        df_export_csv['data_mandato'] = pd.to_datetime(df_export_csv['data_mandato'], errors='coerce').dt.strftime('%d/%m/%Y').fillna('')
+
+    tot_A_fse = df_output_sifer['valore_contributo_fse'].sum()
+    tot_controlli_formali_calc = df_output_sifer['controlli_formali'].sum() # Usa colonna ricalcolata
+    tot_C_quota_dest = df_output_sifer['quota_retta_destinatario'].sum()
+    tot_contrib_complessivo_per_qc = tot_A_fse + tot_controlli_formali_calc # A + percentuale di A
+
+    quadro_data = {
+        "Voce": ["Totale costi diretti (A - Contributo FSE)", 
+                 f"Quota costi indiretti ({etichetta_cf} - calcolata)", 
+                 f"Contributo complessivo erogabile (A + {etichetta_cf})", 
+                 "Totale quote a carico del destinatario (C)"],
+        "Valore (€)": [tot_A_fse, tot_controlli_formali_calc, tot_contrib_complessivo_per_qc, tot_C_quota_dest]
+    }
+    df_qc = pd.DataFrame(quadro_data)
+    df_qc_display = df_qc.copy()
+    df_qc_display["Valore (€)"] = df_qc_display["Valore (€)"].apply(lambda x: f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")) # Formattazione IT
+
+    return {
+        'anteprima': df_export_csv,
+        'csv': df_export_csv.to_csv(index=False, sep=';', decimal=',', encoding='utf-8-sig').encode('utf-8-sig'),
+        'excel': convert_df_to_excel_bytes(df_output_sifer), # Passa il df con oggetti date per Excel
+        'quadro_display': df_qc_display,
+        'quadro_csv': df_qc.to_csv(index=False, sep=';', decimal=',', encoding='utf-8-sig').encode('utf-8-sig'),
+        'quadro_excel': convert_df_to_excel_bytes(df_qc),
+    }
+
+
 def render_richiedente_form(username_param: str):
     """Visualizza e gestisce il form per l'utente Richiedente."""
     st.title("📝 Comunicazione Spesa Centri Estivi (Verifica e Download)")
@@ -197,52 +231,45 @@ def render_richiedente_form(username_param: str):
         try:
             log_activity(username_param, "PASTE_DATA_PROCESSING_RICHIEDENTE", f"Lunghezza dati: {len(pasted_data)} chars")
             
-            data_io = StringIO(pasted_data)
-            df_pasted_raw = pd.read_csv(data_io, sep='\t', header=None, dtype=str, na_filter=False)
-
-            if df_pasted_raw.shape[1] != len(NOMI_COLONNE_PASTED_DATA):
-                results_container.error(f"🚨 Errore: Incollate {df_pasted_raw.shape[1]} colonne, attese {len(NOMI_COLONNE_PASTED_DATA)}. Controlla la selezione da Excel.")
-                st.stop()
+            # Solo le righe nuove o modificate dall'esecuzione precedente sono parsate e validate
+            # (cache per contenuto di riga in sessione); read_csv completo se il testo lo richiede
+            righe_incollate = split_righe_incollate(pasted_data, len(NOMI_COLONNE_PASTED_DATA))
+            if righe_incollate is not None:
+                df_check, esiti_rich, has_blocking_errors_rich, formato_date_rich = validate_righe_incrementale(
+                    righe_incollate, NOMI_COLONNE_PASTED_DATA, st.session_state.rich_cache_righe,
+                    age_reference_date=date.today() # Segnala (senza bloccare) età insolite per un centro estivo
+                )
+            else:
+                data_io = StringIO(pasted_data)
+                df_pasted_raw = pd.read_csv(data_io, sep='\t', header=None, dtype=str, na_filter=False)
 
-            df_pasted_raw.columns = NOMI_COLONNE_PASTED_DATA
-            df_check = df_pasted_raw.copy()
+                if df_pasted_raw.shape[1] != len(NOMI_COLONNE_PASTED_DATA):
+                    results_container.error(f"🚨 Errore: Incollate {df_pasted_raw.shape[1]} colonne, attese {len(NOMI_COLONNE_PASTED_DATA)}. Controlla la selezione da Excel.")
+                    st.stop()
 
-            # --- Pre-processing e Parsing Tipi ---
-            df_check['codice_fiscale_bambino_pulito'] = df_check['codice_fiscale_bambino'].astype(str).str.upper().str.strip()
-            
-            df_check['data_mandato_originale'] = df_check['data_mandato'] # Conserva originale per messaggi
-            df_check['data_mandato'] = pd.to_datetime(df_check['data_mandato_originale'], errors='coerce', dayfirst=True).dt.date
-
-            currency_cols_to_parse = ['importo_mandato','valore_contributo_fse','altri_contributi','quota_retta_destinatario','totale_retta','controlli_formali_dichiarati']
-            for col in currency_cols_to_parse:
-                if col in df_check.columns:
-                    df_check[col] = df_check[col].apply(parse_excel_currency)
-                else: # Dovrebbe essere presente se NOMI_COLONNE_PASTED_DATA è corretto
-                    results_container.warning(f"Attenzione: colonna valuta attesa '{col}' non trovata nei dati incollati. Sarà trattata come 0.")
-                    df_check[col] = 0.0
-
-
-            df_check['numero_settimane_frequenza'] = df_check['numero_settimane_frequenza'].apply(
-                lambda x: int(float(str(x).replace(',','.'))) if pd.notna(x) and str(x).strip().replace('.','',1).replace(',','.',1).isdigit() else 0
-            )
-            # --- Fine Pre-processing ---
-
-            # --- Esegui Validazioni Dettagliate ---
-            df_validation_results, has_blocking_errors_rich = run_detailed_validations(
-                df_to_validate=df_check,
-                cf_col_clean='codice_fiscale_bambino_pulito',
-                original_date_col='data_mandato_originale',
-                parsed_date_col='data_mandato',
-                declared_formal_controls_col='controlli_formali_dichiarati',
-                row_offset_for_messages=1 # Per il richiedente, le righe sono 1-based dall'incollato
-            )
+                df_pasted_raw.columns = NOMI_COLONNE_PASTED_DATA
+                df_check, esiti_rich, has_blocking_errors_rich, formato_date_rich = validate_richiedente_df(
+                    df_pasted_raw, age_reference_date=date.today()
+                )
             
             results_container.subheader("3. Risultati della Verifica Dati")
-            cols_order_results = ['Riga','Bambino','Esito CF','Esito Data Mandato','Esito D=A+B+C','Esito Regole Contr.FSE','Esito Contr.Formali 5%', "Verifica Max 300€ FSE per Bambino (batch)", 'Errori Bloccanti']
+            results_container.caption(f"📅 Formato date di mandato rilevato: {formato_date_rich}" if formato_date_rich else "📅 Nessuna data di mandato riconosciuta nei dati incollati.")
+            cols_order_results = ['Riga','Bambino','Esito CF','Esito Data Mandato','Esito D=A+B+C','Esito Regole Contr.FSE','Esito Contr.Formali', "Verifica Cap FSE per Bambino (batch)", 'Errori Bloccanti']
+            # In sessione ci sono solo gli esiti compatti: i messaggi sono composti per la pagina mostrata
+            solo_errori_rich = results_container.checkbox("Mostra solo le righe con errori bloccanti", key="rich_solo_errori")
+            df_validation_results, n_righe_esiti_rich, n_pagine_rich = pagina_esiti(
+                esiti_rich, solo_errori=solo_errori_rich, pagina=st.session_state.get('rich_pagina_esiti', 1))
+            if n_pagine_rich > 1:
+                if st.session_state.get('rich_pagina_esiti', 1) > n_pagine_rich: # Es. dopo aver attivato il filtro
+                    st.session_state['rich_pagina_esiti'] = n_pagine_rich
+                results_container.number_input(f"Pagina dei risultati (di {n_pagine_rich}, {n_righe_esiti_rich} righe)",
+                                               min_value=1, max_value=n_pagine_rich, step=1, key="rich_pagina_esiti")
             # Assicurati che tutte le colonne esistano in df_validation_results prima di provare a ordinarle/visualizzarle
             actual_cols_to_display = [col for col in cols_order_results if col in df_validation_results.columns]
             if not df_validation_results.empty:
                  results_container.dataframe(df_validation_results[actual_cols_to_display], use_container_width=True, hide_index=True)
+            elif solo_errori_rich:
+                 results_container.info("Nessuna riga con errori bloccanti.")
             else:
                  results_container.info("Nessun risultato di validazione da mostrare (potrebbe essere un batch vuoto o un errore precedente).")
 
@@ -250,71 +277,34 @@ def render_richiedente_form(username_param: str):
             if not has_blocking_errors_rich:
                 results_container.success("✅ Tutte le verifiche preliminari sono OK. Puoi procedere a scaricare i dati.")
                 log_activity(username_param, "VALIDATION_SUCCESS_RICHIEDENTE", f"N. righe: {len(df_check)}")
-                
-                df_validated_output = df_check.copy()
-                # Aggiungi metadati al DataFrame di output
-                for key, value in st.session_state.doc_metadati_richiedente.items():
-                    df_validated_output[key] = value
-                
-                # Calcola la colonna finale 'controlli_formali' come 5% del FSE (verità ultima per l'export)
-                df_validated_output['controlli_formali'] = round(df_validated_output['valore_contributo_fse'] * 0.05, 2)
-                
-                # Gestisci colonne CF: usa quella pulita e rinominala
-                if 'codice_fiscale_bambino' in df_validated_output.columns: # Colonna originale
-                     df_validated_output.drop(columns=['codice_fiscale_bambino'], inplace=True, errors='ignore')
-                if 'codice_fiscale_bambino_pulito' in df_validated_output.columns:
-                    df_validated_output.rename(columns={'codice_fiscale_bambino_pulito': 'codice_fiscale_bambino'}, inplace=True)
 
-                # Seleziona e ordina colonne per l'output finale SIFER
-                df_output_sifer = df_validated_output[[col for col in COLONNE_OUTPUT_FINALE_SIFER if col in df_validated_output.columns]].copy()
+                # File di download e quadro ricostruiti solo se cambiano incollato o dati generali
+                # (non ai rerun per expander e click sui download)
+                chiave_export = (pasted_data, tuple(st.session_state.doc_metadati_richiedente.items()))
+                export_cache = st.session_state.get('rich_export_cache')
+                if export_cache is None or export_cache[0] != chiave_export:
+                    export_cache = (chiave_export, prepara_export_richiedente(df_check, st.session_state.doc_metadati_richiedente))
+                    st.session_state['rich_export_cache'] = export_cache
+                export = export_cache[1]
+                rif_pa_s = sanitize_filename_component(st.session_state.doc_metadati_richiedente.get('rif_pa',''))
 
                 with results_container.expander("⬇️ 4. Anteprima Dati Normalizzati e Download", expanded=True):
-                    df_display_anteprima = df_output_sifer.copy()
-                    if 'data_mandato' in df_display_anteprima.columns:
-                        df_display_anteprima['data_mandato'] = pd.to_datetime(df_display_anteprima['data_mandato'], errors='coerce').dt.strftime('%d/%m/%Y').fillna('')
-                    st.dataframe(df_display_anteprima, use_container_width=True, hide_index=True)
+                    st.dataframe(export['anteprima'], use_container_width=True, hide_index=True)
 
-                    rif_pa_s = sanitize_filename_component(st.session_state.doc_metadati_richiedente.get('rif_pa',''))
-                    
-                    df_export_csv = df_output_sifer.copy()
-                    if 'data_mandato' in df_export_csv.columns:
-                        df_export_csv['data_mandato'] = pd.to_datetime(df_export_csv['data_mandato'], errors='coerce').dt.strftime('%d/%m/%Y').fillna('')
-                    
-                    csv_output_bytes = df_export_csv.to_csv(index=False, sep=';', decimal=',', encoding='utf-8-sig').encode('utf-8-sig')
                     fn_csv = generate_timestamp_filename(type_prefix="datiSIFER", rif_pa_sanitized=rif_pa_s) + ".csv"
-                    st.download_button(label="📥 Scarica CSV per SIFER", data=csv_output_bytes, file_name=fn_csv, mime='text/csv', key="rich_dl_csv")
+                    st.download_button(label="📥 Scarica CSV per SIFER", data=export['csv'], file_name=fn_csv, mime='text/csv', key="rich_dl_csv")
                     
-                    excel_output_bytes = convert_df_to_excel_bytes(df_output_sifer) # Passa il df con oggetti date per Excel
                     fn_excel = generate_timestamp_filename(type_prefix="datiSIFER_Excel", rif_pa_sanitized=rif_pa_s) + ".xlsx"
-                    st.download_button(label="📄 Scarica Excel", data=excel_output_bytes, file_name=fn_excel, mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key="rich_dl_excel")
+                    st.download_button(label="📄 Scarica Excel", data=export['excel'], file_name=fn_excel, mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key="rich_dl_excel")
 
                 with results_container.expander("📊 5. Quadro di Controllo (Calcolato)", expanded=True):
-                    tot_A_fse = df_output_sifer['valore_contributo_fse'].sum()
-                    tot_controlli_formali_calc = df_output_sifer['controlli_formali'].sum() # Usa colonna ricalcolata
-                    # tot_B_altri_contrib = df_output_sifer['altri_contributi'].sum() # Non richiesto nel quadro fornito
-                    tot_C_quota_dest = df_output_sifer['quota_retta_destinatario'].sum()
-                    tot_contrib_complessivo_per_qc = tot_A_fse + tot_controlli_formali_calc # A + 5% di A
-
-                    quadro_data = {
-                        "Voce": ["Totale costi diretti (A - Contributo FSE)", 
-                                 "Quota costi indiretti (5% di A - calcolata)", 
-                                 "Contributo complessivo erogabile (A + 5% di A)", 
-                                 "Totale quote a carico del destinatario (C)"],
-                        "Valore (€)": [tot_A_fse, tot_controlli_formali_calc, tot_contrib_complessivo_per_qc, tot_C_quota_dest]
-                    }
-                    df_qc = pd.DataFrame(quadro_data)
-                    
-                    df_qc_display = df_qc.copy()
-                    df_qc_display["Valore (€)"] = df_qc_display["Valore (€)"].apply(lambda x: f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")) # Formattazione IT
-                    st.dataframe(df_qc_display, hide_index=True, use_container_width=True)
+                    st.dataframe(export['quadro_display'], hide_index=True, use_container_width=True)
 
-                    csv_qc_bytes = df_qc.to_csv(index=False, sep=';', decimal=',', encoding='utf-8-sig').encode('utf-8-sig')
                     fn_qc_csv = generate_timestamp_filename(type_prefix="QuadroControllo", rif_pa_sanitized=rif_pa_s, include_seconds=False) + ".csv"
-                    st.download_button(label="📥 Scarica Quadro CSV", data=csv_qc_bytes, file_name=fn_qc_csv, mime='text/csv', key="rich_qc_csv")
+                    st.download_button(label="📥 Scarica Quadro CSV", data=export['quadro_csv'], file_name=fn_qc_csv, mime='text/csv', key="rich_qc_csv")
 
-                    excel_qc_bytes = convert_df_to_excel_bytes(df_qc)
                     fn_qc_excel = generate_timestamp_filename(type_prefix="QuadroControllo_Excel", rif_pa_sanitized=rif_pa_s, include_seconds=False) + ".xlsx"
-                    st.download_button(label="📄 Scarica Quadro Excel", data=excel_qc_bytes, file_name=fn_qc_excel, mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key="rich_qc_excel")
+                    st.download_button(label="📄 Scarica Quadro Excel", data=export['quadro_excel'], file_name=fn_qc_excel, mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key="rich_qc_excel")
             
             elif df_validation_results.empty and not pasted_data.strip(): # Se non ci sono dati incollati ma pasted_data non è vuoto (es. solo spazi)
                 results_container.info("Nessun dato valido incollato da elaborare.")
@@ -339,7 +329,11 @@ def main_app_router():
     user_role = st.session_state.get('user_role', 'user') # Default a 'user'
     username = st.session_state.get('username', 'N/D')
     name = st.session_state.get('name', 'Utente')
-    authenticator_obj = st.session_state.get('authenticator')
+    try:
+        authenticator_obj = get_authenticator() # Ricreato solo se config.yaml è cambiato
+    except Exception as e:
+        log_activity(username, "AUTH_INIT_ERROR", str(e))
+        authenticator_obj = None
 
     if not authenticator_obj: # Controllo critico
         st.error("🚨 Sessione di autenticazione non valida o scaduta. Effettua nuovamente il login.")
@@ -386,9 +380,11 @@ if __name__ == "__main__":
     # Deve avvenire prima di qualsiasi tentativo di accesso a queste chiavi
     default_session_keys = {
         'authentication_status': None, 'name': None, 'username': None, 
-        'authenticator': None, 'user_role': None,
+        'authenticator': None, 'authenticator_versione': None, 'user_role': None,
         'doc_metadati_richiedente': {'rif_pa': '', 'cup': '', 'distretto': '', 'comune_capofila': ''},
         'metadati_confermati_richiedente': False,
+        'rich_cache_righe': {}, # Cache per riga dell'incollato del richiedente (utils/paste_validation.py)
+        'rich_export_cache': None, # (incollato + dati generali, file di download e quadro già generati)
         # Aggiungere qui altre chiavi di session_state globali o per altre pagine se necessario,
         # ma è meglio inizializzare le chiavi specifiche della pagina all'interno della pagina stessa
         # o usare prefissi per evitare conflitti.
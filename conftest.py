@@ -0,0 +1,34 @@
+#cartella/conftest.py
+"""
+Configurazione comune dei test (python -m pytest -q dalla cartella del progetto).
+Questo file, nella radice, mette la radice nel sys.path (import di utils.* e tests.*).
+utils.db crea la cartella 'database' (log di attività e DB) nella cartella corrente all'import:
+i test girano in una cartella temporanea, con il file delle regole del progetto.
+"""
+import os
+import tempfile
+
+import pytest
+
+RADICE_PROGETTO = os.path.dirname(os.path.abspath(__file__))
+
+
+def pytest_configure(config):
+    from utils import validation_rules
+    validation_rules.REGOLE_FILE = os.path.join(RADICE_PROGETTO, validation_rules.REGOLE_FILE)
+    os.chdir(tempfile.mkdtemp(prefix='centri_estivi_test_'))
+
+
+@pytest.fixture
+def db_temporaneo(tmp_path, monkeypatch):
+    """Database vuoto (schema e trigger di init_db) in una cartella temporanea, al posto di database/spese.db."""
+    from utils import db
+    db.flush_activity_log()
+    db.close_all_db_connections()
+    monkeypatch.setattr(db, 'DATABASE_PATH', str(tmp_path / 'spese.db'))
+    db.init_db()
+    yield db
+    db.flush_activity_log() # Gli eventi in coda vanno scritti nel DB temporaneo, non nel successivo
+    db.close_all_db_connections()
+
+#cartella/conftest.py
@@ -1,29 +1,23 @@
 #cartella/pages/01_Gestione_Dati_Controllore.py
 import streamlit as st
+from utils.auth import get_authenticator
 import pandas as pd
-from utils.db import add_multiple_spese, log_activity, check_rif_pa_exists
+from utils.db import add_multiple_spese, add_spese_a_blocchi, log_activity, check_rif_pa_exists, get_fse_totali_per_cf
 from utils.common_utils import (
     # sanitize_filename_component, convert_df_to_excel_bytes, generate_timestamp_filename, # Non usati qui
-    parse_excel_currency, validate_rif_pa_format,
-    run_detailed_validations # Importa la funzione di validazione centralizzata
+    validate_rif_pa_format,
+    prepara_df_per_db, # Colonne e valori finali per add_multiple_spese
+    pagina_esiti # Messaggi degli esiti composti solo per la pagina mostrata
 )
-import uuid # Per generare id_trasmissione
+from utils.validation_rules import get_regole, fmt_limite # Limiti configurati mostrati nelle etichette
+from utils.validation_pipeline import valida_contenuto # Lettura e validazione con cache per contenuto del file
+from utils.stream_validation import (validate_controllore_csv_streaming, STREAMING_SOGLIA_BYTES, STREAMING_MAX_RIGHE_ERRORE,
+                                    CSV_CONTROLLORE_KWARGS, iter_blocchi_per_db)
+from datetime import date
+import uuid
 
 st.set_page_config(page_title="Gestione Dati Controllore", layout="wide")
 
-# --- Costanti Specifiche Pagina ---
-DB_COLS_ATTESE = [
-    'id_trasmissione', 'rif_pa', 'cup', 'distretto', 'comune_capofila', 
-    'numero_mandato', 'data_mandato', 'comune_titolare_mandato', 'importo_mandato',
-    'comune_centro_estivo', 'centro_estivo', 'genitore_cognome_nome', 
-    'bambino_cognome_nome', 'codice_fiscale_bambino', 'valore_contributo_fse', 
-    'altri_contributi', 'quota_retta_destinatario', 'totale_retta', 
-    'numero_settimane_frequenza', 'controlli_formali' # Calcolati e finali
-]
-# Colonne che potrebbero essere nel CSV e che non vanno direttamente nel DB o sono trasformate
-COLS_DA_RIMUOVERE_PER_DB = ['cf_pulito', 'data_mandato_originale_csv']
-
-
 # --- Autenticazione e Controllo Ruolo (Standard per Pagine Interne) ---
 if not st.session_state.get('authentication_status', False):
     st.warning("Devi effettuare il login per accedere a questa pagina.")
@@ -34,7 +28,11 @@ if not st.session_state.get('authentication_status', False):
 USER_ROLE_CTRL = st.session_state.get('user_role')
 USERNAME_CTRL = st.session_state.get('username')
 NAME_CTRL = st.session_state.get('name')
-AUTHENTICATOR_CTRL = st.session_state.get('authenticator')
+try:
+    AUTHENTICATOR_CTRL = get_authenticator() # Condiviso con il login (utils/auth.py), ricreato solo se config.yaml cambia
+except Exception as e_auth:
+    log_activity(USERNAME_CTRL, "AUTH_INIT_ERROR", str(e_auth))
+    AUTHENTICATOR_CTRL = None
 
 if not AUTHENTICATOR_CTRL: # Ulteriore controllo di sessione valida
     st.error("🚨 Errore di sessione (Authenticator non trovato). Riprova il login.")
@@ -77,26 +75,46 @@ if uploaded_file_ctrl is not None:
         # Nuovo file caricato, resetta stati precedenti
         st.session_state.ctrl_df_loaded_validated = None # DataFrame dopo parsing e validazione iniziale
         st.session_state.ctrl_df_ready_for_db = None    # DataFrame pronto per il salvataggio
-        st.session_state.ctrl_validation_results_df = None # Risultati della validazione
+        st.session_state.ctrl_validation_results_df = None # Risultati della validazione a blocchi (solo righe con errori)
+        st.session_state.ctrl_esiti_validazione = None     # Esiti compatti della validazione (file non a blocchi)
         st.session_state.ctrl_has_blocking_errors = True   # Default a True finché non validato
         st.session_state.ctrl_current_rif_pa_info = None  # Info sul Rif PA corrente
+        st.session_state.ctrl_streaming_summary = None    # Riepilogo della validazione a blocchi (file grandi)
         st.session_state.ctrl_last_uploaded_filename = uploaded_file_ctrl.name
 elif st.session_state.get('ctrl_last_uploaded_filename') is not None: # File rimosso
     st.session_state.ctrl_df_loaded_validated = None
     st.session_state.ctrl_df_ready_for_db = None
     st.session_state.ctrl_validation_results_df = None
+    st.session_state.ctrl_esiti_validazione = None
     st.session_state.ctrl_has_blocking_errors = True
     st.session_state.ctrl_current_rif_pa_info = None
+    st.session_state.ctrl_streaming_summary = None
     st.session_state.ctrl_last_uploaded_filename = None
 
 results_display_area = st.container() # Per mostrare risultati e pulsanti
 
-if uploaded_file_ctrl is not None and st.session_state.get('ctrl_df_loaded_validated') is None:
+if (uploaded_file_ctrl is not None and st.session_state.get('ctrl_df_loaded_validated') is None
+        and st.session_state.get('ctrl_streaming_summary') is None):
     with results_display_area: # Processa e mostra risultati dentro quest'area
         with st.spinner("Elaborazione file CSV in corso..."):
             try:
-                df_from_csv = pd.read_csv(uploaded_file_ctrl, sep=';', decimal=',', na_filter=False, dtype=str)
-                log_activity(USERNAME_CTRL, "FILE_UPLOADED_CONTROLLER", f"File: {uploaded_file_ctrl.name}, Righe: {len(df_from_csv)}")
+                # File molto grandi: validazione a blocchi, senza tenere il file intero in memoria/sessione.
+                # Per i controlli sul Rif. PA basta la prima riga.
+                streaming_ctrl = uploaded_file_ctrl.size > STREAMING_SOGLIA_BYTES
+                if streaming_ctrl:
+                    df_from_csv = pd.read_csv(uploaded_file_ctrl, nrows=1, **CSV_CONTROLLORE_KWARGS)
+                    log_activity(USERNAME_CTRL, "FILE_UPLOADED_CONTROLLER", f"File: {uploaded_file_ctrl.name}, {uploaded_file_ctrl.size} byte (validazione a blocchi)")
+                else:
+                    # --- Lettura, pre-processing e validazioni dettagliate in un passo ---
+                    # Lo stesso file già elaborato (ricaricato, o da un'altra sessione) è preso dalla cache per
+                    # contenuto; i controlli per bambino sono rifatti con lo storico FSE attuale del DB.
+                    df_from_csv, esiti_ctrl, has_err, info_pipeline_ctrl = valida_contenuto(
+                        uploaded_file_ctrl.getvalue(), 'controllore',
+                        historical_lookup=get_fse_totali_per_cf, # Cap per bambino sull'intero storico, sui CF del file
+                        age_reference_date=date.today(), # Avviso non bloccante su età insolite
+                        parallel=True # Su più processi sopra PARALLEL_SOGLIA_RIGHE righe
+                    )
+                    log_activity(USERNAME_CTRL, "FILE_UPLOADED_CONTROLLER", f"File: {uploaded_file_ctrl.name}, Righe: {len(df_from_csv)}")
 
                 if df_from_csv.empty:
                     st.error("🚨 Il file CSV caricato è vuoto.")
@@ -131,43 +149,31 @@ if uploaded_file_ctrl is not None and st.session_state.get('ctrl_df_loaded_valid
                 else:
                     st.success(f"✅ OK: Nessuna registrazione esistente per Rif. PA '{current_rif_pa}'. Si può procedere.")
 
-                df_check_ctrl = df_from_csv.copy()
-                
-                # --- 2. Pre-processing e Parsing Tipi dal CSV ---
-                # CF pulito
-                df_check_ctrl['cf_pulito'] = df_check_ctrl.get('codice_fiscale_bambino', pd.Series(dtype='str')).astype(str).str.upper().str.strip()
-                
-                # Date (conserva originale per messaggi)
-                df_check_ctrl['data_mandato_originale_csv'] = df_check_ctrl.get('data_mandato', pd.Series(dtype='str'))
-                df_check_ctrl['data_mandato'] = pd.to_datetime(df_check_ctrl['data_mandato_originale_csv'], errors='coerce', dayfirst=True).dt.date
-
-                # Valute (il CSV dovrebbe averle già come numeri, ma parsare per sicurezza se sono stringhe)
-                currency_cols_ctrl = ['importo_mandato','valore_contributo_fse','altri_contributi','quota_retta_destinatario','totale_retta', 'controlli_formali'] # 'controlli_formali' è quella dal CSV del richiedente
-                for col in currency_cols_ctrl:
-                    if col in df_check_ctrl.columns:
-                        df_check_ctrl[col] = df_check_ctrl[col].apply(lambda x: parse_excel_currency(str(x))) # Forzo a stringa per parse_excel_currency
-                    else:
+                if streaming_ctrl:
+                    # --- 2/3. Pre-processing e validazioni a blocchi: in sessione solo righe con errori e riepilogo ---
+                    stato_stream_ctrl = st.empty()
+                    df_val_res, has_err, riepilogo_ctrl = validate_controllore_csv_streaming(
+                        uploaded_file_ctrl,
+                        historical_lookup=get_fse_totali_per_cf, # Storico FSE per il cap per bambino, sui CF di tutto il file
+                        age_reference_date=date.today(),
+                        on_progress=lambda n_righe: stato_stream_ctrl.caption(f"⏳ Righe validate: {n_righe:,}".replace(',', '.'))
+                    )
+                    st.session_state.ctrl_streaming_summary = riepilogo_ctrl
+                    st.session_state.ctrl_validation_results_df = df_val_res
+                    st.session_state.ctrl_has_blocking_errors = has_err
+                    log_activity(USERNAME_CTRL, "FILE_STREAM_VALIDATED_CONTROLLER",
+                                 f"File: {uploaded_file_ctrl.name}, Righe: {riepilogo_ctrl['righe']}, Righe con errori: {riepilogo_ctrl['righe_con_errori']}",
+                                 rif_pa=current_rif_pa)
+                else:
+                    # --- 2/3. Dati parsati e risultati delle validazioni (da valida_contenuto) ---
+                    formato_date_ctrl = info_pipeline_ctrl['formato_date']
+                    st.caption(f"📅 Formato date di mandato rilevato: {formato_date_ctrl}" if formato_date_ctrl else "📅 Nessuna data di mandato riconosciuta nel file.")
+                    for col in info_pipeline_ctrl['colonne_valuta_mancanti']:
                         st.warning(f"⚠️ Colonna valuta attesa '{col}' non trovata nel CSV. Sarà trattata come 0.0 se richiesta.")
-                        df_check_ctrl[col] = 0.0 # Default se mancante
-
-                # Settimane
-                df_check_ctrl['numero_settimane_frequenza'] = df_check_ctrl.get('numero_settimane_frequenza', pd.Series(dtype='str')).apply(
-                    lambda x: int(float(str(x).replace(',','.'))) if pd.notna(x) and str(x).strip().replace('.','',1).replace(',','.',1).isdigit() else 0
-                )
-                st.session_state.ctrl_df_loaded_validated = df_check_ctrl # Salva df dopo parsing
-                
-                # --- 3. Esegui Validazioni Dettagliate ---
-                # 'controlli_formali' nel CSV è il "dichiarato" per il controllore
-                df_val_res, has_err = run_detailed_validations(
-                    df_to_validate=df_check_ctrl,
-                    cf_col_clean='cf_pulito',
-                    original_date_col='data_mandato_originale_csv',
-                    parsed_date_col='data_mandato',
-                    declared_formal_controls_col='controlli_formali', # Usa colonna 'controlli_formali' dal CSV
-                    row_offset_for_messages=2 # Per Controllore, riga CSV è index + intestazione + 1
-                )
-                st.session_state.ctrl_validation_results_df = df_val_res
-                st.session_state.ctrl_has_blocking_errors = has_err
+                    # In sessione un riferimento a dati ed esiti compatti della cache (condivisi, non vanno modificati)
+                    st.session_state.ctrl_df_loaded_validated = df_from_csv
+                    st.session_state.ctrl_esiti_validazione = esiti_ctrl
+                    st.session_state.ctrl_has_blocking_errors = has_err
                 
             except pd.errors.EmptyDataError:
                 st.error("Il file CSV è vuoto o non contiene dati leggibili.")
@@ -190,9 +196,8 @@ if uploaded_file_ctrl is not None and st.session_state.get('ctrl_df_loaded_valid
             st.rerun() 
 
 # --- Visualizzazione Risultati Validazione e Preparazione per Salvataggio ---
-if st.session_state.get('ctrl_validation_results_df') is not None:
+if st.session_state.get('ctrl_validation_results_df') is not None or st.session_state.get('ctrl_esiti_validazione') is not None:
     with results_display_area:
-        df_val_res_show = st.session_state.ctrl_validation_results_df
         current_rif_pa_info_show = st.session_state.get('ctrl_current_rif_pa_info', {})
         
         if 'rif_pa' in current_rif_pa_info_show: # Mostra di nuovo il Rif PA se disponibile
@@ -200,7 +205,34 @@ if st.session_state.get('ctrl_validation_results_df') is not None:
         else: # Se il file non è stato processato o rif_pa non estratto
              st.subheader("🔍 Risultati Verifica Dati Caricati")
 
-        cols_disp_val = ['Riga','Bambino','Esito CF','Esito Data Mandato','Esito D=A+B+C','Esito Regole Contr.FSE','Esito Contr.Formali 5%', "Verifica Max 300€ FSE per Bambino (batch)", 'Errori Rilevati']
+        riepilogo_stream_show = st.session_state.get('ctrl_streaming_summary')
+        if riepilogo_stream_show is not None: # Validazione a blocchi: contatori sull'intero file
+            metric_cols_stream = st.columns(5)
+            metric_cols_stream[0].metric("Righe validate", riepilogo_stream_show['righe'])
+            metric_cols_stream[1].metric("Righe con errori", riepilogo_stream_show['righe_con_errori'])
+            metric_cols_stream[2].metric("Bambini", riepilogo_stream_show['bambini'])
+            metric_cols_stream[3].metric("CF duplicati", riepilogo_stream_show['cf_duplicati'])
+            metric_cols_stream[4].metric(f"Bambini oltre cap {fmt_limite(get_regole()['parametri']['cap_bambino']['cap'])}€", riepilogo_stream_show['bambini_oltre_cap'])
+            st.caption(f"File grande validato a blocchi ({riepilogo_stream_show['blocchi']}): sono mostrate solo le righe con errori bloccanti"
+                       f" (al massimo {STREAMING_MAX_RIGHE_ERRORE})."
+                       + (f" Formato date rilevato: {', '.join(f for f in riepilogo_stream_show['formati_date'] if f) or 'nessuno'}."))
+            for col in riepilogo_stream_show['colonne_valuta_mancanti']:
+                st.warning(f"⚠️ Colonna valuta attesa '{col}' non trovata nel CSV. Sarà trattata come 0.0 se richiesta.")
+
+        esiti_show = st.session_state.get('ctrl_esiti_validazione')
+        if esiti_show is not None: # Messaggi composti solo per la pagina mostrata
+            solo_errori_ctrl = st.checkbox("Mostra solo le righe con errori bloccanti", key="ctrl_solo_errori")
+            df_val_res_show, n_righe_esiti_ctrl, n_pagine_ctrl = pagina_esiti(
+                esiti_show, solo_errori=solo_errori_ctrl, pagina=st.session_state.get('ctrl_pagina_esiti', 1))
+            if n_pagine_ctrl > 1:
+                if st.session_state.get('ctrl_pagina_esiti', 1) > n_pagine_ctrl: # Es. dopo aver attivato il filtro
+                    st.session_state['ctrl_pagina_esiti'] = n_pagine_ctrl
+                st.number_input(f"Pagina dei risultati (di {n_pagine_ctrl}, {n_righe_esiti_ctrl} righe)",
+                                min_value=1, max_value=n_pagine_ctrl, step=1, key="ctrl_pagina_esiti")
+        else: # Validazione a blocchi: righe con errori già formattate
+            df_val_res_show = st.session_state.ctrl_validation_results_df
+
+        cols_disp_val = ['Riga','Bambino','Esito CF','Esito Data Mandato','Esito D=A+B+C','Esito Regole Contr.FSE','Esito Contr.Formali', "Verifica Cap FSE per Bambino (batch)", 'Errori Bloccanti']
         actual_cols_val_disp = [col for col in cols_disp_val if col in df_val_res_show.columns]
         st.dataframe(df_val_res_show[actual_cols_val_disp], use_container_width=True, hide_index=True)
 
@@ -211,38 +243,9 @@ if st.session_state.get('ctrl_validation_results_df') is not None:
             st.success("✅ Verifiche preliminari OK. Pronto per il salvataggio nel database.")
             
             # --- Preparazione DataFrame Finale per il DB ---
-            df_to_save_db = df_loaded_for_save.copy()
-            
-            # Aggiungi ID Trasmissione (univoco per questo batch di caricamento)
-            df_to_save_db['id_trasmissione'] = str(uuid.uuid4())
-            
-            # Ricalcola 'controlli_formali' come 5% FSE (verità ultima per DB)
-            # Questo sovrascrive la colonna 'controlli_formali' che era nel CSV del richiedente.
-            df_to_save_db['controlli_formali'] = round(df_to_save_db['valore_contributo_fse'] * 0.05, 2)
-            
-            # Rinomina colonna CF pulita e rimuovi quella originale (se diversa)
-            if 'codice_fiscale_bambino' in df_to_save_db.columns and 'cf_pulito' in df_to_save_db.columns:
-                 df_to_save_db.drop(columns=['codice_fiscale_bambino'], inplace=True, errors='ignore')
-            if 'cf_pulito' in df_to_save_db.columns:
-                df_to_save_db.rename(columns={'cf_pulito':'codice_fiscale_bambino'}, inplace=True)
-            
-            # Assicura che tutte le colonne DB_COLS_ATTESE esistano, impostando None o default se necessario
-            # (anche se il CSV del richiedente dovrebbe averle tutte)
-            for col_db in DB_COLS_ATTESE:
-                if col_db not in df_to_save_db.columns:
-                    # Determina un default sensato in base al tipo atteso o None
-                    default_val_db = 0.0 if col_db in ['importo_mandato','valore_contributo_fse','altri_contributi','quota_retta_destinatario','totale_retta', 'controlli_formali'] else \
-                                   0 if col_db == 'numero_settimane_frequenza' else \
-                                   None # Per stringhe o date (anche se data dovrebbe esserci)
-                    st.warning(f"⚠️ Colonna DB '{col_db}' mancante nel CSV processato, sarà impostata a '{default_val_db}'.")
-                    df_to_save_db[col_db] = default_val_db
-            
-            # Rimuovi colonne temporanee/ausiliarie non necessarie per il DB
-            df_to_save_db = df_to_save_db.drop(columns=COLS_DA_RIMUOVERE_PER_DB, errors='ignore')
-            
-            # Seleziona solo le colonne attese dal DB nell'ordine corretto (se importante per DB, anche se ORM non lo richiede)
-            final_cols_for_db = [c for c in DB_COLS_ATTESE if c in df_to_save_db.columns]
-            df_final_for_db = df_to_save_db[final_cols_for_db]
+            df_final_for_db, colonne_db_mancanti = prepara_df_per_db(df_loaded_for_save)
+            for col_db, default_val_db in colonne_db_mancanti:
+                st.warning(f"⚠️ Colonna DB '{col_db}' mancante nel CSV processato, sarà impostata a '{default_val_db}'.")
             
             st.session_state.ctrl_df_ready_for_db = df_final_for_db # Salva in session_state
 
@@ -254,38 +257,53 @@ if st.session_state.get('ctrl_validation_results_df') is not None:
                      )
                 st.dataframe(df_preview_db, use_container_width=True, hide_index=True)
         
+        elif not has_errors_display and riepilogo_stream_show is not None:
+            st.success("✅ Verifiche preliminari OK. Pronto per il salvataggio nel database: il file sarà riletto e preparato al momento del salvataggio.")
+
         elif has_errors_display:
             st.error("🚫 Sono stati rilevati errori bloccanti (❌). Correggere il file CSV e ricaricarlo.")
             st.session_state.ctrl_df_ready_for_db = None # Nessun df pronto per il salvataggio
 
 # --- Bottone di Salvataggio (mostrato solo se i dati sono pronti e validi) ---
-if st.session_state.get('ctrl_df_ready_for_db') is not None and not st.session_state.get('ctrl_has_blocking_errors', True):
+streaming_ready_ctrl = st.session_state.get('ctrl_streaming_summary') is not None and uploaded_file_ctrl is not None
+if (st.session_state.get('ctrl_df_ready_for_db') is not None or streaming_ready_ctrl) and not st.session_state.get('ctrl_has_blocking_errors', True):
     if st.button("💾 Salva Dati Verificati nel Database Centrale", key="save_controller_data_final_btn", type="primary"):
         with results_display_area: # Mostra output del salvataggio nella stessa area
             with st.spinner("Salvataggio nel database in corso..."):
-                df_to_persist = st.session_state.ctrl_df_ready_for_db
-                rif_pa_to_persist = df_to_persist['rif_pa'].iloc[0] if not df_to_persist.empty else "N/A_RIFPA_PERSIST"
+                if st.session_state.get('ctrl_df_ready_for_db') is not None:
+                    df_to_persist = st.session_state.ctrl_df_ready_for_db
+                    rif_pa_to_persist = df_to_persist['rif_pa'].iloc[0] if not df_to_persist.empty else "N/A_RIFPA_PERSIST"
+                    n_righe_to_persist = len(df_to_persist)
+                else: # Validazione a blocchi: il file è riletto a blocchi, ognuno preparato e inserito nella stessa transazione
+                    df_to_persist = None
+                    rif_pa_to_persist = (st.session_state.get('ctrl_current_rif_pa_info') or {}).get('rif_pa', "N/A_RIFPA_PERSIST")
+                    n_righe_to_persist = st.session_state.ctrl_streaming_summary['righe']
                 
                 # Doppio controllo (finale) esistenza Rif PA prima di scrivere (paranoia check)
                 if check_rif_pa_exists(rif_pa_to_persist):
                      st.error(f"🚨 ERRORE CRITICO: Il Rif. PA '{rif_pa_to_persist}' risulta già presente nel DB (controllo finale). Salvataggio annullato. Questo non dovrebbe succedere se i controlli precedenti hanno funzionato.")
-                     log_activity(USERNAME_CTRL, "SAVE_BLOCKED_DUPLICATE_RIFPA_FINAL", f"Rif. PA: {rif_pa_to_persist}")
+                     log_activity(USERNAME_CTRL, "SAVE_BLOCKED_DUPLICATE_RIFPA_FINAL", f"Rif. PA: {rif_pa_to_persist}", rif_pa=rif_pa_to_persist)
                 else:
-                    success_db, msg_db = add_multiple_spese(df_to_persist, USERNAME_CTRL)
+                    if df_to_persist is not None:
+                        success_db, msg_db = add_multiple_spese(df_to_persist, USERNAME_CTRL)
+                    else:
+                        success_db, msg_db = add_spese_a_blocchi(iter_blocchi_per_db(uploaded_file_ctrl, str(uuid.uuid4())), USERNAME_CTRL)
                     if success_db:
                         st.success(f"✅ {msg_db}")
-                        log_activity(USERNAME_CTRL, "DATA_SAVED_BY_CONTROLLER", f"Rif.PA: {rif_pa_to_persist}, Righe: {len(df_to_persist)}")
+                        log_activity(USERNAME_CTRL, "DATA_SAVED_BY_CONTROLLER", f"Rif.PA: {rif_pa_to_persist}, Righe: {n_righe_to_persist}", rif_pa=rif_pa_to_persist)
                         # Resetta stato per permettere nuovo caricamento
                         st.session_state.ctrl_df_loaded_validated = None
                         st.session_state.ctrl_df_ready_for_db = None
                         st.session_state.ctrl_validation_results_df = None
+                        st.session_state.ctrl_esiti_validazione = None
                         st.session_state.ctrl_has_blocking_errors = True
                         st.session_state.ctrl_current_rif_pa_info = None
+                        st.session_state.ctrl_streaming_summary = None
                         st.session_state.ctrl_last_uploaded_filename = None 
                         st.rerun() 
                     else:
                         st.error(f"⚠️ Errore durante il salvataggio nel database: {msg_db}")
-                        log_activity(USERNAME_CTRL, "DATA_SAVE_FAILED_CONTROLLER", f"Rif.PA: {rif_pa_to_persist}, Dettaglio: {msg_db}")
+                        log_activity(USERNAME_CTRL, "DATA_SAVE_FAILED_CONTROLLER", f"Rif.PA: {rif_pa_to_persist}, Dettaglio: {msg_db}", rif_pa=rif_pa_to_persist)
 
 elif uploaded_file_ctrl is None and not results_display_area.empty(): # Se il file è stato rimosso e c'erano messaggi
     results_display_area.empty() # Pulisce l'area se non c'è più un file
@@ -1,6 +1,8 @@
 #cartella/pages/02_Log_Attivita.py
 import streamlit as st
-from utils.db import get_log_content, log_activity 
+from utils.auth import get_authenticator
+from utils.db import (read_log_page, log_cursor_valido, log_activity, flush_activity_log, get_activity_log_stats,
+                      query_activity_log, count_activity_log, get_activity_log_filter_options)
 
 st.set_page_config(page_title="Log Attività", layout="wide")
 
@@ -14,7 +16,11 @@ if not st.session_state.get('authentication_status', False):
 USER_ROLE_LOG = st.session_state.get('user_role')
 USERNAME_LOG = st.session_state.get('username')
 NAME_LOG = st.session_state.get('name')
-AUTHENTICATOR_LOG = st.session_state.get('authenticator')
+try:
+    AUTHENTICATOR_LOG = get_authenticator()
+except Exception as e_auth:
+    log_activity(USERNAME_LOG, "AUTH_INIT_ERROR", str(e_auth))
+    AUTHENTICATOR_LOG = None
 
 if not AUTHENTICATOR_LOG:
     st.error("🚨 Errore di sessione. Riprova il login.")
@@ -33,24 +39,107 @@ AUTHENTICATOR_LOG.logout('🚪 Logout', 'sidebar', key='log_logout_sidebar')
 # --- Fine Autenticazione ---
 
 st.title("📜 Log Attività Utente")
-st.markdown("Visualizzazione delle attività recenti registrate nel sistema (le più recenti per prime).")
+st.markdown("Visualizzazione delle attività registrate nel sistema (le più recenti per prime).")
 
-if st.button("🔄 Aggiorna Visualizzazione Log", key="refresh_log_btn"):
-    log_activity(USERNAME_LOG, "LOG_VIEW_REFRESHED", "L'utente ha aggiornato la visualizzazione del log.")
-    st.toast("Visualizzazione del log aggiornata!", icon="🔄")
-    # st.rerun() # Non strettamente necessario se get_log_content() viene chiamato sotto e l'output cambia
+tab_eventi, tab_file = st.tabs(["🔎 Ricerca Eventi", "📄 File di Log"])
 
-try:
-    log_data_content = get_log_content()
-    st.text_area(
-        "Contenuto del Log:", 
-        value=log_data_content, 
-        height=600, 
-        disabled=True, 
-        help="Il log mostra le azioni più recenti in alto. Il file di log ruota per dimensione."
+with tab_eventi:
+    # Ricerca sull'archivio strutturato (tabella activity_log): ogni filtro è una query su indice.
+    # log_search_cursors è la pila dei cursori (ts, id) delle pagine visitate; None = pagina più recente.
+    st.session_state.setdefault('log_search_cursors', [None])
+    flush_activity_log(timeout=1.0)
+    try:
+        opt_users_log, opt_actions_log = get_activity_log_filter_options()
+    except Exception as e_opts:
+        opt_users_log, opt_actions_log = [], []
+        st.error(f"Impossibile leggere l'archivio eventi: {e_opts}")
+
+    search_cols = st.columns([2, 3, 2, 2, 2])
+    sel_user_log = search_cols[0].selectbox("Utente", options=["Tutti"] + opt_users_log, key="log_search_user")
+    sel_actions_log = search_cols[1].multiselect("Azioni", options=opt_actions_log, key="log_search_actions")
+    sel_from_log = search_cols[2].date_input("Dal", value=None, format="DD/MM/YYYY", key="log_search_from")
+    sel_to_log = search_cols[3].date_input("Al (incluso)", value=None, format="DD/MM/YYYY", key="log_search_to")
+    sel_rifpa_log = search_cols[4].text_input("Rif. PA", key="log_search_rifpa").strip()
+    search_page_size = st.selectbox("Eventi per pagina", options=[50, 100, 200, 500], index=1, key="log_search_page_size")
+
+    filtri_log = dict(
+        username=None if sel_user_log == "Tutti" else sel_user_log, actions=sel_actions_log or None,
+        ts_from=sel_from_log, ts_to=sel_to_log, rif_pa=sel_rifpa_log or None,
     )
-except Exception as e_log_display:
-    st.error(f"Impossibile visualizzare il log: {e_log_display}")
-    log_activity(USERNAME_LOG, "LOG_DISPLAY_ERROR", str(e_log_display))
+    # Se cambiano filtri o dimensione pagina si riparte dagli eventi più recenti
+    firma_filtri_log = (repr(sorted(filtri_log.items())), search_page_size)
+    if st.session_state.get('log_search_signature') != firma_filtri_log:
+        st.session_state.log_search_signature = firma_filtri_log
+        st.session_state.log_search_cursors = [None]
+
+    try:
+        df_eventi, eventi_next_cursor = query_activity_log(**filtri_log, limit=search_page_size, cursor=st.session_state.log_search_cursors[-1])
+        totale_eventi = count_activity_log(**filtri_log)
+
+        nav_cols = st.columns([2, 2, 4])
+        if nav_cols[0].button("⬅️ Più recenti", key="log_search_newer_btn", disabled=len(st.session_state.log_search_cursors) <= 1):
+            st.session_state.log_search_cursors.pop()
+            st.rerun()
+        if nav_cols[1].button("Più vecchi ➡️", key="log_search_older_btn", disabled=eventi_next_cursor is None):
+            st.session_state.log_search_cursors.append(eventi_next_cursor)
+            st.rerun()
+        nav_cols[2].caption(f"Pagina {len(st.session_state.log_search_cursors)} · {len(df_eventi)} eventi mostrati su {totale_eventi} trovati")
+
+        if df_eventi.empty:
+            st.info("Nessun evento corrisponde ai filtri selezionati.")
+        else:
+            st.dataframe(
+                df_eventi.drop(columns=['id']).rename(columns={
+                    'ts': 'Data/Ora', 'username': 'Utente', 'action': 'Azione', 'details': 'Dettagli',
+                    'rif_pa': 'Rif. PA', 'id_trasmissione': 'ID Trasmissione',
+                }),
+                use_container_width=True, hide_index=True,
+            )
+    except Exception as e_search:
+        st.error(f"Impossibile eseguire la ricerca sul log: {e_search}")
+        log_activity(USERNAME_LOG, "LOG_SEARCH_ERROR", str(e_search))
+
+with tab_file:
+    # Il log viene letto a pagine partendo dal fondo del file: in sessione c'è solo la pagina visibile.
+    # log_page_cursors è la pila dei cursori (segmento, offset in byte, identità del segmento) delle pagine visitate;
+    # None = pagina più recente.
+    st.session_state.setdefault('log_page_cursors', [None])
+
+    log_cols_layout = st.columns([2, 2, 2, 2])
+    log_page_size = log_cols_layout[0].selectbox("Righe per pagina", options=[100, 200, 500, 1000], index=1, key="log_page_size")
+
+    if log_cols_layout[1].button("🔄 Aggiorna Visualizzazione Log", key="refresh_log_btn"):
+        log_activity(USERNAME_LOG, "LOG_VIEW_REFRESHED", "L'utente ha aggiornato la visualizzazione del log.")
+        st.session_state.log_page_cursors = [None] # Torna alle righe più recenti
+        st.toast("Visualizzazione del log aggiornata!", icon="🔄")
+
+    try:
+        if not log_cursor_valido(st.session_state.log_page_cursors[-1]): # Rotazione avvenuta dopo il caricamento delle pagine
+            st.session_state.log_page_cursors = [None]
+            st.info("Il log è stato ruotato nel frattempo: la visualizzazione riparte dalle righe più recenti.")
+        if st.session_state.log_page_cursors[-1] is None:
+            flush_activity_log(timeout=1.0) # Il log è scritto in background: attende gli eventi ancora in coda
+        log_lines_page, log_next_cursor = read_log_page(n_lines=log_page_size, cursor=st.session_state.log_page_cursors[-1])
+
+        if log_cols_layout[2].button("⬅️ Più recenti", key="log_newer_btn", disabled=len(st.session_state.log_page_cursors) <= 1):
+            st.session_state.log_page_cursors.pop()
+            st.rerun()
+        if log_cols_layout[3].button("Carica più vecchi ➡️", key="log_older_btn", disabled=log_next_cursor is None):
+            st.session_state.log_page_cursors.append(log_next_cursor)
+            st.rerun()
 
+        st.caption(f"Pagina {len(st.session_state.log_page_cursors)} · {len(log_lines_page)} righe" + ("" if log_next_cursor is not None else " · inizio del log raggiunto"))
+        log_stats = get_activity_log_stats()
+        if log_stats['scartati']:
+            st.warning(f"{log_stats['scartati']} eventi di log sono stati scartati dall'avvio perché la coda di scrittura era piena.")
+        st.text_area(
+            "Contenuto del Log:", 
+            value="\n".join(log_lines_page) if log_lines_page else "File di log non ancora creato o vuoto.", 
+            height=600, 
+            disabled=True, 
+            help="Il log mostra le azioni più recenti in alto. Quando il file attivo è esaurito la lettura prosegue nei segmenti ruotati e compressi."
+        )
+    except Exception as e_log_display:
+        st.error(f"Impossibile visualizzare il log: {e_log_display}")
+        log_activity(USERNAME_LOG, "LOG_DISPLAY_ERROR", str(e_log_display))
 #cartella/pages/02_Log_Attivita.py
\ No newline at end of file
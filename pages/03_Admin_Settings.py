@@ -1,5 +1,6 @@
 #cartella/pages/03_Admin_Settings.py
 import streamlit as st
+from utils.auth import get_authenticator
 from utils.db import log_activity 
 
 st.set_page_config(page_title="Impostazioni Admin", layout="centered")
@@ -14,7 +15,11 @@ if not st.session_state.get('authentication_status', False):
 USER_ROLE_ADMIN_PAGE = st.session_state.get('user_role')
 USERNAME_ADMIN_PAGE = st.session_state.get('username')
 NAME_ADMIN_PAGE = st.session_state.get('name')
-AUTHENTICATOR_ADMIN_PAGE = st.session_state.get('authenticator')
+try:
+    AUTHENTICATOR_ADMIN_PAGE = get_authenticator()
+except Exception as e_auth:
+    log_activity(USERNAME_ADMIN_PAGE, "AUTH_INIT_ERROR", str(e_auth))
+    AUTHENTICATOR_ADMIN_PAGE = None
 
 if not AUTHENTICATOR_ADMIN_PAGE:
     st.error("🚨 Errore di sessione. Riprova il login.")
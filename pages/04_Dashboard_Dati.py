@@ -1,8 +1,10 @@
 #cartella/pages/04_Dashboard_Dati.py 
 import streamlit as st
+from utils.auth import get_authenticator
 import pandas as pd
-from utils.db import get_all_spese, log_activity, delete_spese_by_ids
+from utils.db import query_spese, get_riepilogo, get_spese_filter_options, get_spese_data_key, log_activity, delete_spese_by_filters
 from utils.common_utils import sanitize_filename_component, convert_df_to_excel_bytes, generate_timestamp_filename
+from utils.validation_rules import get_regole, fmt_limite # Percentuale configurata nell'etichetta dei controlli formali
 
 st.set_page_config(page_title="Dashboard Dati", layout="wide")
 
@@ -16,7 +18,11 @@ if not st.session_state.get('authentication_status', False):
 USER_ROLE_DASH = st.session_state.get('user_role')
 USERNAME_DASH = st.session_state.get('username')
 NAME_DASH = st.session_state.get('name')
-AUTHENTICATOR_DASH = st.session_state.get('authenticator')
+try:
+    AUTHENTICATOR_DASH = get_authenticator()
+except Exception as e_auth:
+    log_activity(USERNAME_DASH, "AUTH_INIT_ERROR", str(e_auth))
+    AUTHENTICATOR_DASH = None
 
 if not AUTHENTICATOR_DASH:
     st.error("🚨 Errore di sessione. Riprova il login.")
@@ -40,21 +46,39 @@ log_activity(USERNAME_DASH, "PAGE_VIEW", f"Dashboard Dati ({USER_ROLE_DASH})")
 
 st.markdown(f"""
 Questa dashboard permette di:
-- Visualizzare tutti i dati di spesa presenti nel database.
+- Visualizzare i dati di spesa presenti nel database (paginati e ordinabili).
 - Filtrare i dati per una ricerca mirata.
 - Scaricare i dati filtrati in formato CSV o Excel.
 {( "- **Eliminare massivamente** i dati filtrati (azione irreversibile, solo Admin)." if USER_ROLE_DASH == 'admin' else "")}
 """)
 
 # --- Caricamento e Filtri Dati ---
-@st.cache_data(ttl=300) # Cache per 5 minuti per non sovraccaricare il DB su refresh frequenti
-def load_data_from_db():
-    log_activity(USERNAME_DASH, "DB_QUERY_DASHBOARD", "Caricamento dati per dashboard.")
-    return get_all_spese()
+# La tabella non viene più caricata per intero: filtri, ordinamento e paginazione sono eseguiti
+# in SQL (query_spese) e nella sessione arriva solo la pagina visibile.
+# Le opzioni dei filtri sono lette con SELECT DISTINCT sugli indici; la cache è legata a versione dei dati
+# e id massimo, quindi un salvataggio o un'eliminazione sono visibili subito.
+@st.cache_data(max_entries=64)
+def load_filter_options_from_db(comuni_selezionati: tuple, chiave_dati: tuple) -> dict:
+    return get_spese_filter_options(list(comuni_selezionati))
 
-df_spese_full = load_data_from_db()
+COLS_DISPLAY_ORDER_DASH = [
+    'id', 'id_trasmissione', 'rif_pa', 'cup', 'distretto', 'comune_capofila',
+    'numero_mandato', 'data_mandato', 'comune_titolare_mandato', 'importo_mandato',
+    'comune_centro_estivo', 'centro_estivo', 'bambino_cognome_nome', 'codice_fiscale_bambino',
+    'valore_contributo_fse', 'altri_contributi', 'quota_retta_destinatario', 'totale_retta',
+    'controlli_formali', 'numero_settimane_frequenza', 'timestamp_caricamento', 'utente_caricamento'
+]
+SORT_OPTIONS_DASH = {
+    "Data caricamento": 'timestamp_caricamento', "Rif. PA": 'rif_pa', "Comune Centro Estivo": 'comune_centro_estivo',
+    "Centro Estivo": 'centro_estivo', "Data Mandato": 'data_mandato', "Bambino": 'bambino_cognome_nome',
+    "Contr. FSE": 'valore_contributo_fse', "ID DB": 'id'
+}
+PAGE_SIZE_OPTIONS_DASH = [50, 100, 250, 500]
 
-if df_spese_full.empty:
+chiave_dati_dash = get_spese_data_key()
+filter_options_dash = load_filter_options_from_db((), chiave_dati_dash)
+
+if not filter_options_dash['rif_pa']:
     st.info("ℹ️ Nessun dato di spesa presente nel database al momento.")
 else:
     st.subheader("🔍 Filtri Dati")
@@ -65,21 +89,20 @@ else:
 
     filter_cols_layout = st.columns([2, 2, 2, 1]) 
 
-    # Opzioni per filtri (ordinate e uniche)
-    # Usare .tolist() per evitare problemi con tipi specifici di Pandas/Numpy in widget Streamlit
-    rif_pa_opts_list = sorted(df_spese_full['rif_pa'].dropna().unique().tolist())
+    # Opzioni per filtri (ordinate e uniche, lette con SELECT DISTINCT)
+    rif_pa_opts_list = filter_options_dash['rif_pa']
     selected_rif_pa_val = filter_cols_layout[0].multiselect(
         "Rif. PA", options=rif_pa_opts_list, 
-        default=st.session_state.dash_sel_rifpa, # Usa valore da session_state per persistenza
+        default=[v for v in st.session_state.dash_sel_rifpa if v in rif_pa_opts_list], # Usa valore da session_state per persistenza
         key="dash_sel_rifpa_widget", # Chiave widget separata da quella di stato
         placeholder="Filtra per Rif. PA..."
     )
     st.session_state.dash_sel_rifpa = selected_rif_pa_val # Aggiorna stato
 
-    comuni_ce_opts_list = sorted(df_spese_full['comune_centro_estivo'].dropna().unique().tolist())
+    comuni_ce_opts_list = filter_options_dash['comuni']
     selected_comune_ce_val = filter_cols_layout[1].multiselect(
         "Comune Centro Estivo", options=comuni_ce_opts_list, 
-        default=st.session_state.dash_sel_comune_ce,
+        default=[v for v in st.session_state.dash_sel_comune_ce if v in comuni_ce_opts_list],
         key="dash_sel_comune_ce_widget",
         placeholder="Filtra per Comune CE..."
     )
@@ -87,12 +110,12 @@ else:
 
     # Filtro dinamico per centri estivi
     if selected_comune_ce_val:
-        centri_estivi_filtered_opts = sorted(df_spese_full[df_spese_full['comune_centro_estivo'].isin(selected_comune_ce_val)]['centro_estivo'].dropna().unique().tolist())
+        centri_estivi_filtered_opts = load_filter_options_from_db(tuple(selected_comune_ce_val), chiave_dati_dash)['centri']
     else:
-        centri_estivi_filtered_opts = sorted(df_spese_full['centro_estivo'].dropna().unique().tolist())
+        centri_estivi_filtered_opts = filter_options_dash['centri']
     selected_centro_estivo_val = filter_cols_layout[2].multiselect(
         "Centro Estivo", options=centri_estivi_filtered_opts,
-        default=st.session_state.dash_sel_centro_estivo,
+        default=[v for v in st.session_state.dash_sel_centro_estivo if v in centri_estivi_filtered_opts],
         key="dash_sel_centro_estivo_widget",
         placeholder="Filtra per Centro Estivo..."
     )
@@ -105,31 +128,50 @@ else:
         st.session_state.dash_sel_centro_estivo = []
         st.rerun()
 
-    # Applicazione filtri
-    df_filtered_dash = df_spese_full.copy()
-    if st.session_state.dash_sel_rifpa: 
-        df_filtered_dash = df_filtered_dash[df_filtered_dash['rif_pa'].isin(st.session_state.dash_sel_rifpa)]
-    if st.session_state.dash_sel_comune_ce: 
-        df_filtered_dash = df_filtered_dash[df_filtered_dash['comune_centro_estivo'].isin(st.session_state.dash_sel_comune_ce)]
-    if st.session_state.dash_sel_centro_estivo: 
-        df_filtered_dash = df_filtered_dash[df_filtered_dash['centro_estivo'].isin(st.session_state.dash_sel_centro_estivo)]
+    # Filtri correnti (applicati in SQL)
+    filtri_dash = {
+        'rif_pa': st.session_state.dash_sel_rifpa,
+        'comuni': st.session_state.dash_sel_comune_ce,
+        'centri': st.session_state.dash_sel_centro_estivo,
+    }
+    filtri_signature_dash = repr(sorted((k, tuple(v)) for k, v in filtri_dash.items()))
+
+    # --- Ordinamento e Paginazione ---
+    sort_cols_layout = st.columns([2, 1, 1, 1])
+    sort_label_dash = sort_cols_layout[0].selectbox("Ordina per", options=list(SORT_OPTIONS_DASH), key="dash_sort_by")
+    sort_desc_dash = sort_cols_layout[1].checkbox("Decrescente", value=True, key="dash_sort_desc")
+    page_size_dash = sort_cols_layout[2].selectbox("Righe per pagina", options=PAGE_SIZE_OPTIONS_DASH, index=1, key="dash_page_size")
+
+    # Torna alla prima pagina quando cambiano i filtri
+    if st.session_state.get('dash_filters_signature') != filtri_signature_dash:
+        st.session_state.dash_filters_signature = filtri_signature_dash
+        st.session_state.dash_page_num = 1
+    st.session_state.setdefault('dash_page_num', 1)
+
+    def query_pagina_dash(numero_pagina: int):
+        return query_spese(
+            **filtri_dash, offset=(numero_pagina - 1) * page_size_dash, limit=page_size_dash,
+            sort_by=SORT_OPTIONS_DASH[sort_label_dash], descending=sort_desc_dash
+        )
+
+    df_page_dash, total_filtered_dash = query_pagina_dash(st.session_state.dash_page_num)
+    n_pages_dash = max(1, -(-total_filtered_dash // page_size_dash))
+    if st.session_state.dash_page_num > n_pages_dash: # Es. cambio dimensione pagina o dati eliminati
+        st.session_state.dash_page_num = n_pages_dash
+        df_page_dash, total_filtered_dash = query_pagina_dash(n_pages_dash)
+    sort_cols_layout[3].number_input(f"Pagina (di {n_pages_dash})", min_value=1, max_value=n_pages_dash, step=1, key="dash_page_num")
 
     # --- Visualizzazione Dati Tabellare ---
-    expander_title = f"Visualizza/Nascondi Elenco Spese ({len(df_filtered_dash)} risultati filtrati)"
-    with st.expander(expander_title, expanded=len(df_filtered_dash) < 500 and len(df_filtered_dash) > 0): # Espanso se pochi risultati
-        if df_filtered_dash.empty:
+    expander_title = f"Visualizza/Nascondi Elenco Spese ({total_filtered_dash} risultati filtrati)"
+    with st.expander(expander_title, expanded=total_filtered_dash > 0): 
+        if df_page_dash.empty:
             st.info("Nessun dato corrisponde ai filtri selezionati.")
         else:
+            first_row_dash = (st.session_state.dash_page_num - 1) * page_size_dash + 1
+            st.caption(f"Righe {first_row_dash}–{first_row_dash + len(df_page_dash) - 1} di {total_filtered_dash}")
             # Ordine e selezione colonne per la visualizzazione
-            cols_display_order_dash = [
-                'id', 'id_trasmissione', 'rif_pa', 'cup', 'distretto', 'comune_capofila',
-                'numero_mandato', 'data_mandato', 'comune_titolare_mandato', 'importo_mandato',
-                'comune_centro_estivo', 'centro_estivo', 'bambino_cognome_nome', 'codice_fiscale_bambino',
-                'valore_contributo_fse', 'altri_contributi', 'quota_retta_destinatario', 'totale_retta',
-                'controlli_formali', 'numero_settimane_frequenza', 'timestamp_caricamento', 'utente_caricamento'
-            ]
-            cols_to_show_dash = [col for col in cols_display_order_dash if col in df_filtered_dash.columns]
-            df_display_dash = df_filtered_dash[cols_to_show_dash].copy()
+            cols_to_show_dash = [col for col in COLS_DISPLAY_ORDER_DASH if col in df_page_dash.columns]
+            df_display_dash = df_page_dash[cols_to_show_dash].copy()
 
             # Formattazioni per display
             if 'data_mandato' in df_display_dash.columns:
@@ -146,7 +188,7 @@ else:
                 "altri_contributi": st.column_config.NumberColumn("Altri Contr.", format="€ %.2f"),
                 "quota_retta_destinatario": st.column_config.NumberColumn("Quota Retta Dest.", format="€ %.2f"),
                 "totale_retta": st.column_config.NumberColumn("Totale Retta", format="€ %.2f"),
-                "controlli_formali": st.column_config.NumberColumn("Contr. Formali (5%)", format="€ %.2f"),
+                "controlli_formali": st.column_config.NumberColumn(f"Contr. Formali ({fmt_limite(get_regole()['parametri']['controlli_formali']['percentuale'] * 100)}%)", format="€ %.2f"),
                 "data_mandato": st.column_config.TextColumn("Data Mandato"),
                 "timestamp_caricamento": st.column_config.TextColumn("Caricato il")
             }
@@ -156,43 +198,73 @@ else:
                 height=min(600, len(df_display_dash) * 35 + 38) # Altezza dinamica
             )
     
+    # --- Riepilogo Totali (tabelle mantenute da trigger; GROUP BY sulle righe filtrate se i filtri escono dal raggruppamento) ---
+    with st.expander("📊 Riepilogo Totali per Raggruppamento", expanded=False):
+        riepilogo_labels_dash = {"Rif. PA": 'rif_pa', "Comune Centro Estivo": 'comune', "Centro Estivo": 'centro', "Distretto": 'distretto'}
+        riepilogo_label_sel = st.radio("Raggruppa per", options=list(riepilogo_labels_dash), horizontal=True, key="dash_riepilogo_dim")
+        df_riepilogo_dash = get_riepilogo(riepilogo_labels_dash[riepilogo_label_sel], **filtri_dash)
+        nomi_filtri_dash = {'rif_pa': "Rif. PA", 'comuni': "Comune Centro Estivo", 'centri': "Centro Estivo"}
+        filtri_attivi_dash = [nomi_filtri_dash[k] for k, v in filtri_dash.items() if v]
+        st.caption(f"Filtri applicati ai totali: {', '.join(filtri_attivi_dash)} (gli stessi della tabella)." if filtri_attivi_dash
+                   else "Nessun filtro attivo: totali sull'intero database.")
+        if df_riepilogo_dash.empty:
+            st.info("Nessun totale disponibile per il raggruppamento e i filtri selezionati.")
+        else:
+            st.dataframe(
+                df_riepilogo_dash, use_container_width=True, hide_index=True,
+                column_config={
+                    "tot_valore_contributo_fse": st.column_config.NumberColumn("Tot. Contr. FSE (A)", format="€ %.2f"),
+                    "tot_altri_contributi": st.column_config.NumberColumn("Tot. Altri Contr. (B)", format="€ %.2f"),
+                    "tot_quota_retta_destinatario": st.column_config.NumberColumn("Tot. Quota Dest. (C)", format="€ %.2f"),
+                    "tot_totale_retta": st.column_config.NumberColumn("Tot. Retta (D)", format="€ %.2f"),
+                    "tot_controlli_formali": st.column_config.NumberColumn("Tot. Contr. Formali", format="€ %.2f"),
+                    "n_righe": st.column_config.NumberColumn("N. Righe", format="%d"),
+                    "n_bambini": st.column_config.NumberColumn("N. Bambini", format="%d"),
+                }
+            )
+
     # --- Download e Azioni Admin ---
-    if not df_filtered_dash.empty:
+    if total_filtered_dash > 0:
         st.markdown("---")
         st.subheader("📥 Download Dati Filtrati")
-        col_dl1_dash, col_dl2_dash = st.columns(2)
+        st.caption(f"L'export comprende tutte le {total_filtered_dash} righe filtrate (non solo la pagina visibile) e viene generato su richiesta.")
 
         rif_pa_fn_part_dash = "tutti_RifPA"
         if st.session_state.dash_sel_rifpa:
              rif_pa_fn_part_dash = sanitize_filename_component("_".join(st.session_state.dash_sel_rifpa)) if len(st.session_state.dash_sel_rifpa) < 4 else f"{len(st.session_state.dash_sel_rifpa)}_RifPA_selezionati"
 
-        # Per l'export, usiamo il df_filtered_dash originale non formattato per display
-        # ma con le colonne selezionate in cols_to_show_dash
-        df_export_dash = df_filtered_dash[cols_to_show_dash].copy()
-        # Formattazione date per CSV se necessario (ma pd.to_csv gestisce bene oggetti date/datetime)
-        # Se 'data_mandato' è oggetto date, to_csv lo formatta in ISO. Se serve GG/MM/AAAA:
-        if 'data_mandato' in df_export_dash.columns:
-             df_export_dash['data_mandato'] = pd.to_datetime(df_export_dash['data_mandato'], errors='coerce').dt.strftime('%d/%m/%Y')
-        if 'timestamp_caricamento' in df_export_dash.columns:
-            df_export_dash['timestamp_caricamento'] = pd.to_datetime(df_export_dash['timestamp_caricamento'], errors='coerce').dt.strftime('%d/%m/%Y %H:%M:%S')
-
-
-        csv_data_dash = df_export_dash.to_csv(index=False, sep=';', decimal=',', encoding='utf-8-sig').encode('utf-8-sig')
-        fn_csv_dash = generate_timestamp_filename("export_dati_filtrati", rif_pa_fn_part_dash) + ".csv"
-        col_dl1_dash.download_button(label="Scarica Filtrati CSV", data=csv_data_dash, file_name=fn_csv_dash, mime='text/csv', key="dash_dl_csv_btn")
+        if st.button("⚙️ Prepara File di Export", key="dash_prepare_export_btn"):
+            with st.spinner("Preparazione export in corso..."):
+                # Per l'export leggiamo tutte le righe filtrate, non formattate per display
+                df_export_source, _ = query_spese(**filtri_dash, limit=None, sort_by=SORT_OPTIONS_DASH[sort_label_dash], descending=sort_desc_dash, columns=COLS_DISPLAY_ORDER_DASH)
+                df_export_dash = df_export_source.copy()
+                # Formattazione date per CSV (GG/MM/AAAA); per Excel si usa il df originale per preservare i tipi
+                if 'data_mandato' in df_export_dash.columns:
+                     df_export_dash['data_mandato'] = pd.to_datetime(df_export_dash['data_mandato'], errors='coerce').dt.strftime('%d/%m/%Y')
+                if 'timestamp_caricamento' in df_export_dash.columns:
+                    df_export_dash['timestamp_caricamento'] = pd.to_datetime(df_export_dash['timestamp_caricamento'], errors='coerce').dt.strftime('%d/%m/%Y %H:%M:%S')
+                st.session_state.dash_export_files = {
+                    'signature': filtri_signature_dash,
+                    'csv': df_export_dash.to_csv(index=False, sep=';', decimal=',', encoding='utf-8-sig').encode('utf-8-sig'),
+                    'excel': convert_df_to_excel_bytes(df_export_source),
+                    'fn_base': generate_timestamp_filename("export_dati_filtrati", rif_pa_fn_part_dash),
+                }
+                log_activity(USERNAME_DASH, "DASHBOARD_EXPORT_PREPARED", f"{len(df_export_source)} righe. Filtri: {filtri_dash}")
 
-        excel_data_dash = convert_df_to_excel_bytes(df_filtered_dash[cols_to_show_dash]) # Usa df originale per Excel per preservare tipi
-        fn_excel_dash = generate_timestamp_filename("export_dati_filtrati", rif_pa_fn_part_dash) + ".xlsx"
-        col_dl2_dash.download_button(label="Scarica Filtrati Excel", data=excel_data_dash, file_name=fn_excel_dash, mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key="dash_dl_excel_btn")
+        export_files_dash = st.session_state.get('dash_export_files')
+        if export_files_dash and export_files_dash['signature'] == filtri_signature_dash:
+            col_dl1_dash, col_dl2_dash = st.columns(2)
+            col_dl1_dash.download_button(label="Scarica Filtrati CSV", data=export_files_dash['csv'], file_name=export_files_dash['fn_base'] + ".csv", mime='text/csv', key="dash_dl_csv_btn")
+            col_dl2_dash.download_button(label="Scarica Filtrati Excel", data=export_files_dash['excel'], file_name=export_files_dash['fn_base'] + ".xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key="dash_dl_excel_btn")
 
         if USER_ROLE_DASH == 'admin':
             st.markdown("---")
             st.subheader("🗑️ Eliminazione Massiva Dati Filtrati (Solo Admin)")
-            st.warning(f"🔴 ATTENZIONE: Stai per eliminare **{len(df_filtered_dash)}** record dal database in base ai filtri correnti. Questa azione è **IRREVERSIBILE**.")
+            st.warning(f"🔴 ATTENZIONE: Stai per eliminare **{total_filtered_dash}** record dal database in base ai filtri correnti. Questa azione è **IRREVERSIBILE**.")
 
             # Usa un form per raggruppare input e bottone, utile per gestione stato
             with st.form("delete_confirmation_form"):
-                confirm_text_delete = f"CONFERMO ELIMINAZIONE DI {len(df_filtered_dash)} RECORD"
+                confirm_text_delete = f"CONFERMO ELIMINAZIONE DI {total_filtered_dash} RECORD"
                 
                 # Per resettare l'input di testo, si può cambiare la sua chiave o usare un form con clear_on_submit
                 # Qui manteniamo l'approccio di cambiare la chiave del text_input se necessario,
@@ -207,7 +279,7 @@ else:
                 )
                 
                 submitted_delete_form = st.form_submit_button(
-                    f"Procedi con l'Eliminazione di {len(df_filtered_dash)} Record", 
+                    f"Procedi con l'Eliminazione di {total_filtered_dash} Record", 
                     type="primary", 
                     disabled=(user_confirmation_delete != confirm_text_delete)
                 )
@@ -215,8 +287,14 @@ else:
                 if submitted_delete_form: # Questo blocco viene eseguito solo se il form è submittato E il bottone cliccato
                     if user_confirmation_delete == confirm_text_delete:
                         with st.spinner("Eliminazione in corso..."):
-                            ids_to_delete_list = df_filtered_dash['id'].tolist()
-                            deleted_count_res, msg_delete_res = delete_spese_by_ids(ids_to_delete_list, USERNAME_DASH)
+                            # Eliminazione lato server per predicato, a blocchi: gli id non passano dalla sessione
+                            delete_progress_bar = st.progress(0.0, text="Eliminazione in corso...")
+                            deleted_count_res, msg_delete_res = delete_spese_by_filters(
+                                USERNAME_DASH, **filtri_dash,
+                                progress_callback=lambda fatti, totale: delete_progress_bar.progress(
+                                    min(1.0, fatti / max(totale, 1)), text=f"Eliminati {fatti} di {totale} record..."
+                                )
+                            )
                             
                             if deleted_count_res > 0:
                                 st.success(msg_delete_res)
@@ -225,6 +303,7 @@ else:
                                 st.error(f"Eliminazione fallita o nessun record eliminato. Dettaglio: {msg_delete_res}")
                                 log_activity(USERNAME_DASH, "ADMIN_BULK_DELETE_FAILED", msg_delete_res)
                             
+                            st.session_state.pop('dash_export_files', None)
                             # Incrementa il suffisso della chiave per forzare il reset dell'input di testo al prossimo rerun
                             st.session_state.delete_input_key_suffix_dash += 1
                             # Cancella il valore della vecchia chiave per sicurezza (anche se il rerun dovrebbe resettare i widget con nuove chiavi)
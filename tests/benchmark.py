@@ -0,0 +1,234 @@
+#cartella/tests/benchmark.py
+"""
+Tempi (e picchi di memoria) dei percorsi ottimizzati rispetto a quelli di riferimento, su dati
+sintetici. L'equivalenza dei risultati è verificata dai test (python -m pytest -q): qui solo misure.
+Lavora su un database e su file temporanei, non tocca database/spese.db.
+
+Uso: python -m tests.benchmark [righe]
+"""
+import io
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from utils import db
+from utils.common_utils import (
+    _run_detailed_validations_rowwise, _run_detailed_validations_vectorized, _run_detailed_validations_parallel,
+    run_detailed_validations, valida_esiti_compatti, pagina_esiti, _batch_cf_checks, PARALLEL_MAX_WORKERS,
+    validate_codice_fiscale, _cf_verifica_vettoriale, preprocess_controllore_df,
+    parse_excel_currency, parse_excel_currency_series, parse_numero_settimane, parse_numero_settimane_series,
+    parse_data_mandato_series,
+)
+from utils.paste_validation import NOMI_COLONNE_PASTED_DATA, split_righe_incollate, validate_righe_incrementale, validate_richiedente_df
+from utils.stream_validation import validate_controllore_csv_streaming, CSV_CONTROLLORE_KWARGS, VALIDATION_KWARGS_CONTROLLORE
+from utils.validation_pipeline import valida_contenuto, pipeline_cache_info
+from tests.dati_casuali import (
+    AGE_REFERENCE, VALIDATION_ARGS, genera_corpus, genera_batch_cap, cf_strutturato_casuale,
+    riga_incollata_casuale, come_testo_incollato, genera_csv, lookup_storico, genera_trasmissione,
+)
+
+
+def misura(descrizione: str, funzione, n_righe: int) -> float:
+    start = time.perf_counter()
+    funzione()
+    elapsed = time.perf_counter() - start
+    print(f"{descrizione:<40} {n_righe:>7} righe in {elapsed:8.3f}s  ->  {n_righe / elapsed:12,.0f} righe/s")
+    return elapsed
+
+
+def misura_memoria(descrizione: str, funzione, n_righe: int):
+    # Tempo e picco di memoria in due esecuzioni separate: tracemalloc rallenta molto le allocazioni
+    start = time.perf_counter()
+    risultato = funzione()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    funzione()
+    _, picco = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{descrizione:<40} {n_righe:>7} righe in {elapsed:8.3f}s  ->  picco memoria {picco / 2**20:8.1f} MiB")
+    return risultato
+
+
+def _byte_esiti(esiti: dict) -> int:
+    # Array degli esiti (per gli object solo i puntatori: i valori sono quelli del DataFrame validato)
+    righe = sum(v.nbytes for v in esiti['righe'].values())
+    bambini = esiti['bambini'] or {}
+    return righe + sum(v.nbytes for v in [bambini.get('gruppo'), bambini.get('cap'), *bambini.get('valori', {}).values()]
+                       if isinstance(v, np.ndarray))
+
+
+def benchmark_validazioni(n_righe: int):
+    print("== Motori di validazione")
+    df, storico = genera_corpus(n_righe, seed=12345)
+    kwargs = dict(VALIDATION_ARGS, row_offset_for_messages=2, historical_fse_by_cf=storico)
+    t_riga = misura("Riga per riga (iterrows)", lambda: _run_detailed_validations_rowwise(df, **kwargs), n_righe)
+    t_vett = misura("Vettoriale", lambda: _run_detailed_validations_vectorized(df, **kwargs), n_righe)
+    print(f"Speedup: {t_riga / t_vett:.1f}x")
+    _run_detailed_validations_parallel(df.head(10), **kwargs) # Avvio del pool escluso dalla misura
+    t_par = misura(f"Parallelo ({PARALLEL_MAX_WORKERS} processi)", lambda: _run_detailed_validations_parallel(df, **kwargs, n_shards=PARALLEL_MAX_WORKERS), n_righe)
+    print(f"Speedup parallelo/vettoriale: {t_vett / t_par:.1f}x")
+    t_comp = misura("Esiti compatti", lambda: valida_esiti_compatti(df, **kwargs), n_righe)
+    esiti, _ = valida_esiti_compatti(df, **kwargs)
+    misura("Formattazione 1 pagina", lambda: pagina_esiti(esiti), n_righe)
+    completo, _ = run_detailed_validations(df, **kwargs)
+    print(f"Memoria risultati: messaggi {completo.memory_usage(deep=True).sum() / 2**20:.1f} MiB, "
+          f"esiti compatti {_byte_esiti(esiti) / 2**20:.1f} MiB; vettoriale/compatti {t_vett / t_comp:.1f}x")
+
+    # Controlli per bambino (duplicati + cap): il tempo deve crescere linearmente con le righe
+    for n_cap in (20000, 40000):
+        df_cap = genera_batch_cap(n_cap, seed=99)
+        storico_cap = {cf: 10.0 for cf in df_cap['cf_pulito'].unique()[::2]}
+        misura(f"Duplicati + cap ({n_cap // 1000}k)", lambda: _batch_cf_checks(df_cap, 'cf_pulito', storico_cap), n_cap)
+
+    rng = random.Random(777)
+    cfs = [cf_strutturato_casuale(rng).upper() for _ in range(50000)]
+    t_scalare = misura("CF: validate_codice_fiscale", lambda: [validate_codice_fiscale(cf) for cf in cfs], len(cfs))
+    t_matrice = misura("CF: verifica su matrice", lambda: _cf_verifica_vettoriale(cfs, date.today().year), len(cfs))
+    print(f"Speedup: {t_scalare / t_matrice:.1f}x")
+
+
+def benchmark_parsing(n_righe: int):
+    print("== Parsing di importi, settimane e date")
+    rng = random.Random(54321)
+    importi = pd.Series([rng.choice(["100,00", "150,00", "0", "50", "€ 300,00", "75,5", "1.250,00", ""]) if rng.random() < 0.8
+                         else f"{rng.uniform(0, 300):.2f}".replace('.', ',') for _ in range(n_righe)], dtype=str)
+    settimane = pd.Series([str(rng.randint(0, 8)) for _ in range(n_righe)], dtype=str)
+    # Il parsing vettoriale converte una volta ogni valore distinto: il guadagno è limitato da celle / valori distinti
+    print(f"Importi distinti: {importi.nunique()} ({importi.nunique() / n_righe:.0%} delle celle)")
+    t_apply = misura("Importi: apply scalare", lambda: importi.apply(parse_excel_currency), n_righe)
+    t_serie = misura("Importi: parsing vettoriale", lambda: parse_excel_currency_series(importi), n_righe)
+    print(f"Speedup: {t_apply / t_serie:.1f}x")
+    t_apply = misura("Settimane: apply scalare", lambda: settimane.apply(parse_numero_settimane), n_righe)
+    t_serie = misura("Settimane: parsing vettoriale", lambda: parse_numero_settimane_series(settimane), n_righe)
+    print(f"Speedup: {t_apply / t_serie:.1f}x")
+    giorni = [(date(2024, 1, 1) + timedelta(days=i)).strftime('%d/%m/%Y') for i in range(300)]
+    date_testo = pd.Series([rng.choice(giorni) for _ in range(n_righe)], dtype=str)
+    date_testo.iloc[0] = "non una data" # Prima cella non valida: pandas non riesce a dedurre il formato
+    # Anche to_datetime converte una volta ogni valore distinto (cache=True): il confronto è tra i costi per valore
+    t_apply = misura("Date: to_datetime(dayfirst)", lambda: pd.to_datetime(date_testo, errors='coerce', dayfirst=True).dt.date, n_righe)
+    t_serie = misura("Date: formato rilevato", lambda: parse_data_mandato_series(date_testo), n_righe)
+    print(f"Speedup: {t_apply / t_serie:.1f}x")
+
+
+def benchmark_incollato(n_righe: int):
+    print("== Validazione incrementale dell'incollato")
+    rng = random.Random(2024)
+    bambini = [cf_strutturato_casuale(rng) for _ in range(max(1, n_righe // 3))]
+    righe = [riga_incollata_casuale(rng, bambini) for _ in range(n_righe)]
+    corretta = [list(r) for r in righe]
+    corretta[n_righe // 2][9] = "0,00" if righe[n_righe // 2][9] != "0,00" else "1,00" # Una cella corretta dall'utente
+    testi = [come_testo_incollato(righe), come_testo_incollato(corretta)]
+    n_colonne = len(NOMI_COLONNE_PASTED_DATA)
+
+    def validazione_completa(testo: str):
+        df_pasted = pd.read_csv(io.StringIO(testo), sep='\t', header=None, dtype=str, na_filter=False)
+        df_pasted.columns = NOMI_COLONNE_PASTED_DATA
+        return validate_richiedente_df(df_pasted, AGE_REFERENCE)
+
+    def incrementale(testo: str):
+        return validate_righe_incrementale(split_righe_incollate(testo, n_colonne), NOMI_COLONNE_PASTED_DATA, cache, AGE_REFERENCE)
+
+    ripetizioni = 10
+    start = time.perf_counter()
+    for k in range(ripetizioni):
+        validazione_completa(testi[k % 2])
+    t_completa = (time.perf_counter() - start) / ripetizioni
+
+    cache = {}
+    incrementale(testi[0])
+    start = time.perf_counter()
+    for k in range(1, ripetizioni + 1): # A ogni esecuzione cambia una riga rispetto alla precedente
+        incrementale(testi[k % 2])
+    t_modifica = (time.perf_counter() - start) / ripetizioni
+
+    start = time.perf_counter()
+    for _ in range(ripetizioni): # Rerun senza modifiche (expander, download)
+        incrementale(testi[0])
+    t_rerun = (time.perf_counter() - start) / ripetizioni
+
+    print(f"Completa (read_csv + validazione)   {n_righe:>7} righe: {t_completa * 1000:8.1f} ms")
+    print(f"Incrementale, una cella modificata  {n_righe:>7} righe: {t_modifica * 1000:8.1f} ms")
+    print(f"Incrementale, rerun senza modifiche {n_righe:>7} righe: {t_rerun * 1000:8.1f} ms")
+
+
+def benchmark_controllore(n_righe: int):
+    print("== CSV del controllore: validazione a blocchi e cache per contenuto")
+    testo, storico = genera_csv(n_righe, seed=2024)
+    lookup = lookup_storico(storico)
+
+    def validazione_completa(source):
+        df, _, _ = preprocess_controllore_df(pd.read_csv(source, **CSV_CONTROLLORE_KWARGS))
+        return run_detailed_validations(df, **VALIDATION_KWARGS_CONTROLLORE, historical_fse_by_cf=storico,
+                                        age_reference_date=AGE_REFERENCE)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        percorso = os.path.join(tmp_dir, "controllore.csv")
+        with open(percorso, 'w', encoding='utf-8') as f:
+            f.write(testo)
+        print(f"File di {os.path.getsize(percorso) / 2**20:.1f} MiB")
+        misura_memoria("Completa (read_csv)", lambda: validazione_completa(percorso), n_righe)
+        misura_memoria("A blocchi (streaming)", lambda: validate_controllore_csv_streaming(
+            percorso, historical_lookup=lookup, age_reference_date=AGE_REFERENCE), n_righe)
+
+    contenuto = testo.encode('utf-8')
+    misura("Pipeline: primo caricamento", lambda: valida_contenuto(contenuto, historical_lookup=lookup, age_reference_date=AGE_REFERENCE), n_righe)
+    misura("Pipeline: stesso file di nuovo", lambda: valida_contenuto(contenuto, historical_lookup=lookup, age_reference_date=AGE_REFERENCE), n_righe)
+    print(f"Cache: {pipeline_cache_info()}")
+
+
+def inserimento_riga_per_riga(df: pd.DataFrame, username: str):
+    """Riferimento: un INSERT e un commit per riga su una connessione semplice (senza pool né pragma di tuning)."""
+    conn = sqlite3.connect(db.DATABASE_PATH, detect_types=sqlite3.PARSE_DECLTYPES)
+    try:
+        timestamp = datetime.now()
+        for record in df.to_dict('records'):
+            try:
+                conn.execute(db.SPESE_INSERT_SQL, db._build_spesa_values(record, username, timestamp))
+                conn.commit()
+            except sqlite3.IntegrityError:
+                conn.rollback()
+    finally:
+        conn.close()
+
+
+def benchmark_db(n_righe: int):
+    print("== Inserimento nel database")
+    # Il riferimento fa un commit (fsync) per riga: misurato su al più 2000 righe
+    n_riferimento = min(n_righe, 2000)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DATABASE_PATH = os.path.join(tmp_dir, 'riferimento.db')
+        db.init_db()
+        db.close_all_db_connections()
+        df = genera_trasmissione(n_riferimento, "2024-1/RER")
+        t_riga = misura("INSERT + commit riga per riga", lambda: inserimento_riga_per_riga(df, "benchmark"), n_riferimento) / n_riferimento
+
+        db.DATABASE_PATH = os.path.join(tmp_dir, 'benchmark.db')
+        db.init_db()
+        df = genera_trasmissione(n_righe, "2024-1/RER")
+        t_blocco = misura("add_multiple_spese (transazione unica)", lambda: db.add_multiple_spese(df, "benchmark"), n_righe) / n_righe
+        print(f"Speedup: {t_riga / t_blocco:.1f}x")
+        misura("get_riepilogo (tabelle dei trigger)", lambda: db.get_riepilogo('centro'), n_righe)
+        db.flush_activity_log()
+        db.close_all_db_connections()
+
+
+def main():
+    n_righe = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    benchmark_validazioni(n_righe)
+    benchmark_parsing(n_righe)
+    benchmark_incollato(n_righe)
+    benchmark_controllore(n_righe)
+    benchmark_db(n_righe)
+
+
+if __name__ == '__main__':
+    main()
+#cartella/tests/benchmark.py
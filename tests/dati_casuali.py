@@ -0,0 +1,226 @@
+#cartella/tests/dati_casuali.py
+"""
+Generatori di dati casuali (riproducibili dal seed) condivisi dai test e da tests/benchmark.py:
+batch già parsati per i motori di validazione, celle testuali per il parsing, incollati del
+richiedente e loro modifiche, CSV del controllore, trasmissioni già nel formato del DB.
+"""
+import random
+import uuid
+from datetime import date, timedelta
+
+import pandas as pd
+
+from utils.common_utils import CF_MESI, CF_OMOCODIA, CF_POSIZIONI_CIFRE, _cf_carattere_controllo
+from utils.paste_validation import NOMI_COLONNE_PASTED_DATA
+
+AGE_REFERENCE = date(2025, 7, 1)
+VALIDATION_ARGS = dict(
+    cf_col_clean='cf_pulito', original_date_col='data_mandato_originale', parsed_date_col='data_mandato',
+    declared_formal_controls_col='controlli_formali',
+)
+
+
+def _euro(v: float) -> str:
+    return f"{v:.2f}".replace('.', ',')
+
+
+def lookup_storico(storico: dict):
+    """historical_lookup (come db.get_fse_totali_per_cf) su uno storico in memoria."""
+    return lambda cfs: {cf: storico[cf] for cf in cfs if cf in storico}
+
+
+# --- Batch già parsati (importi float, settimane int) ---
+
+def _importo_casuale(rng: random.Random) -> float:
+    scelta = rng.random()
+    if scelta < 0.03:
+        return rng.choice([float('nan'), float('inf'), -float('inf'), 1e12, -0.004])
+    if scelta < 0.25: # Mezzi centesimi: i casi in cui round() e l'arrotondamento vettoriale possono divergere
+        return round(rng.uniform(-10, 400), 2) + rng.choice([0.005, -0.005, 0.0049999999, 0.0050000001])
+    if scelta < 0.35:
+        return float(rng.choice([0, 50, 100, 150, 200, 250, 300, 300.0001, 300.01, 301]))
+    return round(rng.uniform(-20, 450), rng.choice([0, 1, 2, 3]))
+
+
+def _cf_casuale(rng: random.Random, cf_gia_usati: list) -> str:
+    scelta = rng.random()
+    if cf_gia_usati and scelta < 0.2:
+        return rng.choice(cf_gia_usati)
+    if scelta < 0.27:
+        return rng.choice(["", "   ", "ABC", "RSSMRA80A01H501!", "rssmra80a01h501u", " RSSMRA80A01H501U ", "RSSMRA80A01H501UX"])
+    if scelta < 0.35: # Forma corretta ma struttura casuale
+        cf = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789") for _ in range(16))
+    else:
+        cf = cf_strutturato_casuale(rng)
+    cf_gia_usati.append(cf)
+    return cf
+
+
+def cf_strutturato_casuale(rng: random.Random) -> str:
+    """CF con struttura corretta: a volte omocodico, con data inesistente o con CIN errato."""
+    lettere = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    giorno = rng.randint(1, 31) + rng.choice([0, 40])
+    if rng.random() < 0.05:
+        giorno = rng.choice([0, 32, 40, 72, 99])
+    cf = list("".join(rng.choice(lettere) for _ in range(6)) + f"{rng.randint(0, 99):02d}" + rng.choice(CF_MESI)
+              + f"{giorno:02d}" + rng.choice(lettere) + f"{rng.randint(0, 999):03d}")
+    if rng.random() < 0.2: # Omocodia su alcune posizioni numeriche
+        for pos in rng.sample(CF_POSIZIONI_CIFRE, rng.randint(1, 3)):
+            cf[pos] = CF_OMOCODIA[int(cf[pos])]
+    cin = _cf_carattere_controllo("".join(cf))
+    if rng.random() < 0.1:
+        cin = rng.choice([c for c in lettere if c != cin])
+    cf = "".join(cf) + cin
+    return cf.lower() if rng.random() < 0.05 else cf
+
+
+def genera_corpus(n_righe: int, seed: int) -> tuple[pd.DataFrame, dict]:
+    """Batch casuale già nel formato prodotto dal parsing delle pagine (importi float, settimane int) e storico FSE."""
+    rng = random.Random(seed)
+    cf_gia_usati = []
+    righe = []
+    for i in range(n_righe):
+        a, b, c = _importo_casuale(rng), _importo_casuale(rng), _importo_casuale(rng)
+        d = a + b + c if rng.random() < 0.6 else _importo_casuale(rng)
+        data = None if rng.random() < 0.1 else date(2024, 1, 1) + timedelta(days=rng.randint(0, 400))
+        righe.append({
+            'cf_pulito': _cf_casuale(rng, cf_gia_usati),
+            'bambino_cognome_nome': f"Bambino {i}",
+            'data_mandato_originale': (rng.choice(["non una data", ""]) if data is None else
+                                       rng.choice([data.strftime('%d/%m/%Y'), data.isoformat(), f" {data.strftime('%d/%m/%Y')} "])),
+            'data_mandato': pd.NaT if data is None else data,
+            'valore_contributo_fse': a, 'altri_contributi': b, 'quota_retta_destinatario': c, 'totale_retta': d,
+            'numero_settimane_frequenza': rng.choice([0, 0, 1, 2, 3, 4, 5, -1]),
+            'controlli_formali': rng.choice([round(a * 0.05, 2), a * 0.05, _importo_casuale(rng), float('nan')]),
+        })
+    df = pd.DataFrame(righe)
+    storico = {cf: rng.choice([0.0, 50.0, 150.0, 299.99]) for cf in cf_gia_usati if rng.random() < 0.3}
+    return df, storico
+
+
+def genera_batch_cap(n_righe: int, seed: int) -> pd.DataFrame:
+    """Batch con molti bambini ripetuti (3-6 righe ciascuno) in cui circa il 30% supera il cap FSE."""
+    rng = random.Random(seed)
+    righe = []
+    while len(righe) < n_righe:
+        cf = cf_strutturato_casuale(rng)
+        oltre_cap = rng.random() < 0.3
+        n_settimane = rng.randint(3, 6)
+        righe += [{'cf_pulito': cf, 'valore_contributo_fse': 100.0 if oltre_cap else 50.0}] * n_settimane
+    return pd.DataFrame(righe[:n_righe])
+
+
+# --- Celle testuali (parsing di importi e settimane) ---
+
+def cella_casuale(rng: random.Random) -> str:
+    scelta = rng.random()
+    if scelta < 0.3: # Caratteri misti, inclusi spazi Unicode, NUL, cifre non ASCII
+        return "".join(rng.choice("0123456789.,€ -+eE_\t\x00\xa0٣²abn") for _ in range(rng.randint(0, 8)))
+    if scelta < 0.5:
+        return f"{rng.uniform(-5000, 5000):,.{rng.randint(0, 3)}f}" # Formato US
+    if scelta < 0.7:
+        return f"{rng.uniform(-5000, 5000):,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.') # Formato IT
+    if scelta < 0.8:
+        return rng.choice(["nan", "inf", "1e5", "  ", "€", "€ 12,5", "1.", "99999999999999999999", "12.5.3", "1,2,3"])
+    return str(rng.randint(0, 12))
+
+
+# --- Incollato del richiedente (15 colonne separate da tabulazione) ---
+
+def riga_incollata_casuale(rng: random.Random, bambini: list, formato_data: str = '%d/%m/%Y') -> list:
+    cf = rng.choice(bambini) if rng.random() < 0.3 else cf_strutturato_casuale(rng)
+    if rng.random() < 0.05:
+        cf = rng.choice(["", "ABC", " rssmra85t10a562s "])
+    settimane = rng.randint(0, 4)
+    a = round(rng.choice([0, 50, 100, 150, 200, 301]) * (settimane > 0), 2)
+    b, c = round(rng.uniform(0, 50), 2), round(rng.uniform(0, 200), 2)
+    d = round(a + b + c, 2) if rng.random() < 0.95 else round(a + b + c + 1, 2)
+    giorno = date(2024, 1, 1) + timedelta(days=rng.randint(0, 300))
+    data = giorno.strftime(formato_data) if rng.random() < 0.97 else rng.choice(["32/13/2024", "", "45123"])
+    return [str(rng.randint(1, 9999)), data, "Comune", _euro(d), "Comune CE", f"Centro {rng.randint(1, 9)}",
+            "Genitore", f"Bambino {rng.randint(1, 999)}", cf, _euro(a), _euro(b), _euro(c), _euro(d),
+            rng.choice([str(settimane), f" {settimane} ", "x"]) if rng.random() < 0.05 else str(settimane),
+            _euro(round(a * 0.05, 2)) if rng.random() < 0.97 else "1,00"]
+
+
+def come_testo_incollato(righe: list) -> str:
+    return "\n".join("\t".join(r) for r in righe) + "\n"
+
+
+def modifica_incollato(rng: random.Random, righe: list, bambini: list) -> list:
+    """Una modifica come quelle di un utente che corregge l'incollato."""
+    righe = [list(r) for r in righe]
+    azione = rng.choice(['cella', 'cella', 'cancella', 'duplica', 'sposta', 'aggiungi', 'formato_date'])
+    i = rng.randrange(len(righe))
+    if azione == 'cella':
+        righe[i][rng.randrange(len(NOMI_COLONNE_PASTED_DATA))] = riga_incollata_casuale(rng, bambini)[rng.randrange(len(NOMI_COLONNE_PASTED_DATA))]
+    elif azione == 'cancella' and len(righe) > 1:
+        del righe[i]
+    elif azione == 'duplica':
+        righe.insert(rng.randrange(len(righe) + 1), list(righe[i]))
+    elif azione == 'sposta':
+        righe.insert(rng.randrange(len(righe)), righe.pop(i))
+    elif azione == 'aggiungi':
+        righe.append(riga_incollata_casuale(rng, bambini))
+    elif azione == 'formato_date':
+        formato = rng.choice(['%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y'])
+        for r in righe:
+            try:
+                r[1] = pd.to_datetime(r[1], format='%d/%m/%Y').strftime(formato) if rng.random() < 0.8 else r[1]
+            except ValueError:
+                pass
+    return righe
+
+
+# --- CSV del controllore ---
+
+def genera_csv(n_righe: int, seed: int) -> tuple[str, dict]:
+    """Testo CSV del controllore (CF duplicati, bambini oltre il cap, importi incoerenti, date non valide) e storico FSE per CF."""
+    rng = random.Random(seed)
+    bambini = [cf_strutturato_casuale(rng) for _ in range(max(1, n_righe // 2))]
+    righe = []
+    for i in range(n_righe):
+        cf = rng.choice(bambini) if rng.random() < 0.5 else cf_strutturato_casuale(rng)
+        if rng.random() < 0.03:
+            cf = rng.choice(["", "ABC", "rssmra85t10a562s"])
+        settimane = rng.randint(0, 4)
+        a = round(rng.choice([0, 50, 100, 150, 200, 250, 301]) * (settimane > 0), 2)
+        b, c = round(rng.uniform(0, 50), 2), round(rng.uniform(0, 200), 2)
+        d = round(a + b + c, 2) if rng.random() < 0.95 else round(a + b + c + 1, 2)
+        giorno = date(2024, 1, 1) + timedelta(days=rng.randint(0, 300))
+        righe.append({
+            'rif_pa': '2024-1234/RER', 'numero_mandato': str(i), 'data_mandato': giorno.strftime('%d/%m/%Y') if rng.random() < 0.98 else "32/13/2024",
+            'centro_estivo': f"Centro {i % 17}", 'bambino_cognome_nome': f"Bambino {i}", 'codice_fiscale_bambino': cf,
+            'importo_mandato': _euro(d), 'valore_contributo_fse': _euro(a), 'altri_contributi': _euro(b),
+            'quota_retta_destinatario': _euro(c), 'totale_retta': _euro(d), 'numero_settimane_frequenza': str(settimane),
+            'controlli_formali': _euro(round(a * 0.05, 2)) if rng.random() < 0.97 else "1,00",
+        })
+    storico = {cf: rng.choice([0.0, 50.0, 200.0]) for cf in bambini if rng.random() < 0.3}
+    return pd.DataFrame(righe).to_csv(sep=';', index=False), storico
+
+
+# --- Trasmissioni già nel formato del DB ---
+
+def genera_trasmissione(n_righe: int, rif_pa: str) -> pd.DataFrame:
+    """
+    Trasmissione sintetica di n_righe righe già nel formato atteso da add_multiple_spese.
+    I CF sono gli stessi in tutte le trasmissioni (BMBTST0..n): più trasmissioni sommano i totali per bambino.
+    """
+    id_trasmissione = str(uuid.uuid4())
+    righe = []
+    for i in range(n_righe):
+        fse = float(100 + (i % 3) * 50)
+        righe.append({
+            'id_trasmissione': id_trasmissione, 'rif_pa': rif_pa, 'cup': 'E00000000000000',
+            'distretto': ['Distretto Nord', 'Distretto Sud', None][i % 3], 'comune_capofila': 'Unione Test',
+            'numero_mandato': str(1000 + i), 'data_mandato': date(2024, 6, 1 + i % 28),
+            'comune_titolare_mandato': 'Comune Test', 'importo_mandato': 5000.0,
+            'comune_centro_estivo': f"Comune {i % 20}", 'centro_estivo': f"Centro {i % 50}",
+            'genitore_cognome_nome': f"Genitore {i}", 'bambino_cognome_nome': f"Bambino {i}",
+            'codice_fiscale_bambino': f"BMBTST{i:010d}"[:16], 'valore_contributo_fse': fse,
+            'altri_contributi': 0.0, 'quota_retta_destinatario': 50.0, 'totale_retta': fse + 50.0,
+            'numero_settimane_frequenza': 3, 'controlli_formali': round(fse * 0.05, 2),
+        })
+    return pd.DataFrame(righe)
+
+#cartella/tests/dati_casuali.py
@@ -0,0 +1,165 @@
+#cartella/tests/test_activity_log.py
+"""
+Pipeline asincrona del log di attività (utils/db.py): a coda piena i record vengono scartati e
+contati (get_activity_log_stats, annotazione LOG_QUEUE_OVERFLOW nel file), flush_activity_log
+attende che i record accodati siano scritti, shutdown_activity_log ferma il writer e chiude il file.
+Ogni test usa una pipeline propria (coda piccola, file temporaneo) al posto di quella del modulo.
+Tabella activity_log: la paginazione a cursore di query_activity_log restituisce ogni evento una
+sola volta anche con timestamp uguali, e count_activity_log concorda con i filtri.
+"""
+import logging
+import queue
+import random
+import threading
+from datetime import date, datetime
+
+import pytest
+
+from utils import db
+
+DIMENSIONE_CODA = 5
+
+
+class _FileHandlerBloccabile(db._BatchFlushRotatingFileHandler):
+    """File handler che scrive solo quando 'sblocca' è impostato: simula un disco lento."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sblocca = threading.Event()
+        self.sblocca.set()
+
+    def emit(self, record):
+        self.sblocca.wait()
+        super().emit(record)
+
+
+@pytest.fixture
+def coda_di_log(db_temporaneo, tmp_path, monkeypatch):
+    """Pipeline di log con coda da DIMENSIONE_CODA record; il writer non è ancora avviato."""
+    file_handler = _FileHandlerBloccabile(str(tmp_path / 'activity.log'), encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(username)s - %(levelname)s - %(message)s'))
+    file_handler.addFilter(db._default_username_filter)
+    queue_handler = db._BoundedQueueHandler(queue.Queue(maxsize=DIMENSIONE_CODA))
+    queue_handler.file_handler = file_handler
+    queue_handler.writer_thread = threading.Thread(target=db._activity_log_writer, args=(queue_handler,), daemon=True)
+    monkeypatch.setattr(db.logger, 'handlers', [queue_handler])
+    yield queue_handler
+    file_handler.sblocca.set()
+    db.shutdown_activity_log()
+
+
+def _righe_del_file(queue_handler) -> list:
+    with open(queue_handler.file_handler.baseFilename, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def test_coda_piena_scarta_e_conta(coda_di_log):
+    for i in range(DIMENSIONE_CODA + 3):
+        db.log_activity("utente", "EVENTO", f"evento {i}")
+    assert db.get_activity_log_stats() == {'in_coda': DIMENSIONE_CODA, 'scartati': 3}
+    coda_di_log.writer_thread.start()
+    assert db.flush_activity_log()
+    assert db.get_activity_log_stats() == {'in_coda': 0, 'scartati': 3}
+    righe = _righe_del_file(coda_di_log)
+    assert "LOG_QUEUE_OVERFLOW - 3 eventi di log scartati (coda piena)." in righe[0]
+    assert [r.split(" - ", 4)[-1] for r in righe[1:]] == [f"evento {i}" for i in range(DIMENSIONE_CODA)]
+    # Lo scarto viene annotato una sola volta
+    db.log_activity("utente", "EVENTO", "dopo")
+    assert db.flush_activity_log()
+    assert sum("LOG_QUEUE_OVERFLOW" in r for r in _righe_del_file(coda_di_log)) == 1
+
+
+def test_flush_attende_la_scrittura(coda_di_log):
+    coda_di_log.file_handler.sblocca.clear()
+    coda_di_log.writer_thread.start()
+    for i in range(DIMENSIONE_CODA):
+        db.log_activity("utente", "EVENTO", f"evento {i}")
+    # Il writer è fermo sulla scrittura: il flush scade senza che i record siano sul file
+    assert not db.flush_activity_log(timeout=0.2)
+    assert _righe_del_file(coda_di_log) == []
+    coda_di_log.file_handler.sblocca.set()
+    assert db.flush_activity_log()
+    assert len(_righe_del_file(coda_di_log)) == DIMENSIONE_CODA
+    # Gli eventi di log_activity sono anche nella tabella strutturata
+    assert db.count_activity_log(actions=["EVENTO"]) == DIMENSIONE_CODA
+
+
+def test_shutdown_scrive_i_record_e_ferma_il_writer(coda_di_log):
+    coda_di_log.file_handler.sblocca.clear()
+    coda_di_log.writer_thread.start()
+    for i in range(DIMENSIONE_CODA):
+        db.log_activity("utente", "EVENTO", f"evento {i}")
+    threading.Timer(0.1, coda_di_log.file_handler.sblocca.set).start()
+    db.shutdown_activity_log()
+    assert not coda_di_log.writer_thread.is_alive()
+    assert coda_di_log.file_handler.stream is None # File chiuso
+    assert len(_righe_del_file(coda_di_log)) == DIMENSIONE_CODA
+    assert db.count_activity_log(actions=["EVENTO"]) == DIMENSIONE_CODA
+    # Dopo la chiusura flush e shutdown non attendono nulla
+    assert db.flush_activity_log(timeout=0.1)
+    db.shutdown_activity_log(timeout=0.1)
+
+
+UTENTI = ["anna", "bruno", "System"]
+AZIONI = ["LOGIN", "UPLOAD", "DELETE"]
+RIF_PA = [None, "2024-1/RER", "2024-2/RER"]
+
+
+def _eventi_casuali(n: int, seed: int) -> list[tuple]:
+    """Eventi nell'ordine di ACTIVITY_LOG_COLS, con pochi timestamp distinti (molti uguali) su tre giorni."""
+    rng = random.Random(seed)
+    timestamp = [f"2024-06-{g:02d} {h:02d}:00:00.000" for g in (10, 11, 12) for h in (8, 12)]
+    return [(rng.choice(timestamp), rng.choice(UTENTI), rng.choice(AZIONI), f"evento {i}", rng.choice(RIF_PA), None)
+            for i in range(n)]
+
+
+@pytest.fixture
+def eventi_salvati(db_temporaneo) -> list[tuple]:
+    """Eventi salvati direttamente in activity_log; nella lista, ogni evento è preceduto dal suo id."""
+    db = db_temporaneo
+    db.flush_activity_log() # Gli eventi di init_db non devono finire tra quelli del test
+    with db.db_connection() as conn:
+        conn.execute(f"DELETE FROM {db.ACTIVITY_LOG_TABLE}")
+        conn.commit()
+    eventi = _eventi_casuali(300, seed=7)
+    db._store_activity_events(eventi)
+    with db.db_connection() as conn:
+        ids = [r[0] for r in conn.execute(f"SELECT id FROM {db.ACTIVITY_LOG_TABLE} ORDER BY id")]
+    return [(i,) + e for i, e in zip(ids, eventi)]
+
+
+FILTRI = [dict(), dict(username="anna"), dict(actions=["UPLOAD", "DELETE"]), dict(rif_pa="2024-1/RER"),
+          dict(ts_from=date(2024, 6, 11)), dict(ts_to=date(2024, 6, 11)),
+          dict(ts_from=datetime(2024, 6, 10, 12), ts_to=datetime(2024, 6, 12, 8)),
+          dict(username="bruno", actions=["LOGIN"], rif_pa="2024-2/RER", ts_from=date(2024, 6, 11))]
+
+
+def _filtra(eventi: list[tuple], username=None, actions=None, rif_pa=None, ts_from=None, ts_to=None) -> list[tuple]:
+    """Filtri di query_activity_log applicati in Python; le date senza orario valgono come giorno intero."""
+    def dentro(ts: str) -> bool:
+        t = datetime.fromisoformat(ts)
+        if ts_from is not None and t < (ts_from if isinstance(ts_from, datetime) else datetime.combine(ts_from, datetime.min.time())):
+            return False
+        if ts_to is not None and (t > ts_to if isinstance(ts_to, datetime) else t.date() > ts_to):
+            return False
+        return True
+    return [e for e in eventi if (username is None or e[2] == username) and (actions is None or e[3] in actions)
+            and (rif_pa is None or e[5] == rif_pa) and dentro(e[1])]
+
+
+@pytest.mark.parametrize('filtri', FILTRI)
+@pytest.mark.parametrize('limit', [1, 7, 50, 1000])
+def test_pagine_del_log_strutturato(eventi_salvati, filtri, limit):
+    attesi = _filtra(eventi_salvati, **filtri)
+    assert db.count_activity_log(**filtri) == len(attesi)
+    letti, cursore = [], None
+    while True:
+        pagina, cursore = db.query_activity_log(limit=limit, cursor=cursore, **filtri)
+        assert len(pagina) <= limit
+        pagina = pagina[['id'] + db.ACTIVITY_LOG_COLS].astype(object)
+        letti.extend(pagina.where(pagina.notna(), None).itertuples(index=False, name=None)) # NULL letti come NaN
+        if cursore is None:
+            break
+    # Nessun evento ripetuto o saltato tra le pagine, dal più recente (a parità di ts, id decrescente)
+    assert letti == sorted(attesi, key=lambda e: (e[1], e[0]), reverse=True)
+
+#cartella/tests/test_activity_log.py
@@ -0,0 +1,117 @@
+#cartella/tests/test_auth.py
+"""
+Configurazione di autenticazione in cache (utils/auth.py) su un config.yaml temporaneo con valori
+di prova: entro l'intervallo di controllo non si accede al file, un file toccato ma invariato non
+viene riparsato, un contenuto diverso dà un nuovo digest e un nuovo authenticator, un errore di
+sintassi YAML lascia invariata la cache. L'authenticator di streamlit_authenticator e
+st.session_state sono sostituiti (i test non girano dentro un'app Streamlit).
+"""
+import os
+
+import pytest
+
+pytest.importorskip('streamlit')
+pytest.importorskip('streamlit_authenticator')
+pytest.importorskip('bcrypt')
+
+import yaml
+
+from utils import auth
+
+CONFIG_PROVA = """\
+credentials:
+  usernames:
+    utente_prova:
+      name: Utente Prova
+      password: password-di-prova
+      role: {ruolo}
+cookie:
+  name: cookie_prova
+  key: chiave-di-prova
+  expiry_days: 1
+"""
+
+
+def _scrivi(percorso, testo: str, mtime_ns: int):
+    # mtime esplicito: due scritture ravvicinate possono avere lo stesso mtime (risoluzione del file system)
+    percorso.write_text(testo, encoding='utf-8')
+    os.utime(percorso, ns=(mtime_ns, mtime_ns))
+
+
+class _AuthenticatorFinto:
+    def __init__(self, credentials, cookie_name, cookie_key, cookie_expiry_days):
+        self.credentials, self.cookie_name = credentials, cookie_name
+
+
+@pytest.fixture
+def config_temporaneo(tmp_path, monkeypatch):
+    """config.yaml di prova, cache vuota e conteggio dei parsing YAML."""
+    percorso = tmp_path / 'config.yaml'
+    _scrivi(percorso, CONFIG_PROVA.format(ruolo='user'), 1_000_000_000)
+    monkeypatch.setattr(auth, '_config_cache', {})
+    monkeypatch.setattr(auth, 'CONFIG_INTERVALLO_CONTROLLO', 0) # Stat del file a ogni chiamata
+    monkeypatch.setattr(auth.st, 'session_state', {})
+    monkeypatch.setattr(auth.stauth, 'Authenticate', _AuthenticatorFinto)
+    parsing = []
+    yaml_load = yaml.load
+    def load_contato(*args, **kwargs):
+        parsing.append(1)
+        return yaml_load(*args, **kwargs)
+    monkeypatch.setattr(auth.yaml, 'load', load_contato)
+    return percorso, parsing
+
+
+def test_entro_intervallo_nessun_accesso_al_file(config_temporaneo, monkeypatch):
+    percorso, parsing = config_temporaneo
+    monkeypatch.setattr(auth, 'CONFIG_INTERVALLO_CONTROLLO', 3600)
+    config, digest = auth.get_config(str(percorso))
+    # Anche con il file modificato la seconda chiamata restituisce la configurazione in cache
+    _scrivi(percorso, CONFIG_PROVA.format(ruolo='admin'), 2_000_000_000)
+    assert auth.get_config(str(percorso)) == (config, digest)
+    assert len(parsing) == 1
+    assert auth.get_ruolo_utente('utente_prova', str(percorso)) == 'user'
+
+
+def test_file_toccato_ma_invariato_non_riparsato(config_temporaneo):
+    percorso, parsing = config_temporaneo
+    config, digest = auth.get_config(str(percorso))
+    os.utime(percorso, ns=(2_000_000_000, 2_000_000_000))
+    config_dopo, digest_dopo = auth.get_config(str(percorso))
+    assert config_dopo is config and digest_dopo == digest
+    assert len(parsing) == 1
+
+
+def test_contenuto_diverso_nuovo_digest_e_authenticator(config_temporaneo):
+    percorso, parsing = config_temporaneo
+    authenticator = auth.get_authenticator(str(percorso))
+    _, digest = auth.get_config(str(percorso))
+    auth.st.session_state['authentication_status'] = True
+    assert auth.get_authenticator(str(percorso)) is authenticator # Credenziali invariate: stessa istanza
+    _scrivi(percorso, CONFIG_PROVA.format(ruolo='admin'), 2_000_000_000)
+    nuovo = auth.get_authenticator(str(percorso))
+    _, nuovo_digest = auth.get_config(str(percorso))
+    assert nuovo_digest != digest
+    assert nuovo is not authenticator
+    assert auth.st.session_state['authenticator_versione'] == nuovo_digest
+    assert nuovo.credentials['usernames']['utente_prova']['role'] == 'admin'
+    assert auth.get_ruolo_utente('utente_prova', str(percorso)) == 'admin'
+    assert len(parsing) == 2
+
+
+def test_errore_di_sintassi_lascia_la_cache(config_temporaneo):
+    percorso, _ = config_temporaneo
+    config, digest = auth.get_config(str(percorso))
+    authenticator = auth.get_authenticator(str(percorso))
+    voce = dict(auth._config_cache[str(percorso)])
+    _scrivi(percorso, "credentials: [non chiusa\n", 2_000_000_000)
+    with pytest.raises(yaml.YAMLError):
+        auth.get_config(str(percorso))
+    with pytest.raises(yaml.YAMLError):
+        auth.get_authenticator(str(percorso))
+    assert auth._config_cache[str(percorso)] == voce
+    assert auth.st.session_state['authenticator'] is authenticator
+    # Corretto il file, la configurazione è riletta alla chiamata successiva
+    _scrivi(percorso, CONFIG_PROVA.format(ruolo='user'), 3_000_000_000)
+    assert auth.get_config(str(percorso)) == (config, digest)
+
+#cartella/tests/test_auth.py
@@ -0,0 +1,85 @@
+#cartella/tests/test_batch_ingest.py
+"""
+Caricamento da riga di comando (utils/batch_ingest.py, main con --workers 1) su una cartella di CSV
+generati: un file valido è caricato con codice di uscita 0, un Rif. PA ripetuto nello stesso lancio
+dà RIF_PA_ESISTENTE, --dry-run non scrive nel DB; i report per file e il riepilogo sono scritti.
+"""
+import pandas as pd
+import pytest
+
+from utils.batch_ingest import main, ESITO_CARICATO, ESITO_VALIDO, ESITO_RIF_PA_ESISTENTE
+from utils.common_utils import _cf_carattere_controllo
+from tests.dati_casuali import _euro
+
+
+def csv_valido(rif_pa: str, n_righe: int, primo_bambino: int = 0) -> str:
+    """CSV del controllore senza errori bloccanti: CF distinti e validi, importi coerenti, FSE sotto il cap."""
+    righe = []
+    for i in range(n_righe):
+        k = primo_bambino + i
+        cf = f"BNCLRA1{k % 10}A{k // 10 + 1:02d}H501"
+        fse = float(100 + (i % 3) * 50)
+        righe.append({
+            'rif_pa': rif_pa, 'numero_mandato': str(i), 'data_mandato': f"{i % 28 + 1:02d}/06/2024",
+            'centro_estivo': f"Centro {i % 5}", 'bambino_cognome_nome': f"Bambino {k}",
+            'codice_fiscale_bambino': cf + _cf_carattere_controllo(cf), 'importo_mandato': _euro(fse + 50),
+            'valore_contributo_fse': _euro(fse), 'altri_contributi': _euro(0), 'quota_retta_destinatario': _euro(50),
+            'totale_retta': _euro(fse + 50), 'numero_settimane_frequenza': "3", 'controlli_formali': _euro(round(fse * 0.05, 2)),
+        })
+    return pd.DataFrame(righe).to_csv(sep=';', index=False)
+
+
+@pytest.fixture
+def cartella_csv(db_temporaneo, tmp_path):
+    """Due file validi con Rif. PA diversi e un terzo che ripete il Rif. PA del primo."""
+    cartella = tmp_path / 'arrivi'
+    cartella.mkdir()
+    (cartella / 'a_comune1.csv').write_text(csv_valido("2024-1/RER", 12), encoding='utf-8')
+    (cartella / 'b_comune2.csv').write_text(csv_valido("2024-2/RER", 8, primo_bambino=20), encoding='utf-8')
+    (cartella / 'c_comune1_bis.csv').write_text(csv_valido("2024-1/RER", 5, primo_bambino=40), encoding='utf-8')
+    return db_temporaneo, cartella, tmp_path / 'report'
+
+
+def _riepilogo(cartella_report) -> pd.DataFrame:
+    riepiloghi = list(cartella_report.glob('riepilogo_batch*.csv'))
+    assert len(riepiloghi) == 1
+    return pd.read_csv(riepiloghi[0], sep=';', encoding='utf-8-sig', keep_default_na=False)
+
+
+def test_file_valido_caricato(db_temporaneo, tmp_path):
+    percorso = tmp_path / 'comune.csv'
+    percorso.write_text(csv_valido("2024-7/RER", 10), encoding='utf-8')
+    assert main([str(percorso), '--workers', '1', '--report-dir', str(tmp_path / 'report')]) == 0
+    df, n_salvate = db_temporaneo.query_spese(limit=None)
+    assert n_salvate == 10
+    assert set(df['rif_pa']) == {"2024-7/RER"}
+    assert _riepilogo(tmp_path / 'report')['esito'].tolist() == [ESITO_CARICATO]
+
+
+def test_rif_pa_ripetuto_nello_stesso_lancio(cartella_csv):
+    db, cartella, report = cartella_csv
+    assert main([str(cartella), '--workers', '1', '--report-dir', str(report)]) == 1
+    riepilogo = _riepilogo(report)
+    assert riepilogo['esito'].tolist() == [ESITO_CARICATO, ESITO_CARICATO, ESITO_RIF_PA_ESISTENTE]
+    assert "file precedente di questo lancio" in riepilogo['messaggio'].iloc[2]
+    _, n_salvate = db.query_spese(limit=0)
+    assert n_salvate == 12 + 8
+    # Un report per file (anche per quello scartato), con il nome del file: file senza errori, report senza righe
+    for nome_report, nome_file in zip(riepilogo['report'], ['a_comune1', 'b_comune2', 'c_comune1_bis']):
+        assert nome_report.endswith(f"{nome_file}_esiti.csv")
+        esiti = pd.read_csv(nome_report, sep=';', encoding='utf-8-sig')
+        assert 'Riga' in esiti.columns and esiti.empty
+
+
+def test_dry_run_non_scrive(cartella_csv):
+    db, cartella, report = cartella_csv
+    assert main([str(cartella), '--workers', '1', '--report-dir', str(report), '--dry-run']) == 1
+    riepilogo = _riepilogo(report)
+    assert riepilogo['esito'].tolist() == [ESITO_VALIDO, ESITO_VALIDO, ESITO_RIF_PA_ESISTENTE]
+    assert len(list(report.glob('*_esiti.csv'))) == 3
+    assert riepilogo['righe'].tolist() == [12, 8, 5]
+    _, n_salvate = db.query_spese(limit=0)
+    assert n_salvate == 0
+    assert not db.check_rif_pa_exists("2024-1/RER")
+
+#cartella/tests/test_batch_ingest.py
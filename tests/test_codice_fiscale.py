@@ -0,0 +1,54 @@
+#cartella/tests/test_codice_fiscale.py
+"""
+Codici fiscali con esito atteso scritto a mano (non calcolato con le funzioni del modulo): i CF
+casuali di tests/dati_casuali.py ricavano il carattere di controllo da _cf_carattere_controllo e
+confrontano solo i motori tra loro, quindi una tabella dei valori sbagliata non li farebbe fallire.
+"""
+from datetime import date
+
+import pytest
+
+from utils.common_utils import validate_codice_fiscale, _cf_verifica_vettoriale
+
+# CF, motivo atteso ('' se valido), carattere di controllo atteso, data di nascita attesa
+CF_NOTI = [
+    ("RSSMRA85T10A562S", '', 'S', date(1985, 12, 10)),
+    ("RSSMRA85T10A562T", 'controllo', 'S', date(1985, 12, 10)),   # Carattere di controllo errato
+    ("RSSMRAURTMLARSNL", '', 'L', date(1985, 12, 10)),            # Omocodico: tutte le cifre sostituite
+    ("RSSMRA85T1LA562Z", 'controllo', 'V', date(1985, 12, 10)),   # Omocodico su una cifra, controllo errato
+    ("BNCLRA10A41H501K", '', 'K', date(2010, 1, 1)),              # Femmina: giorno + 40
+    ("RSSMRA85Z10A562S", 'struttura', None, None),                # Lettera del mese inesistente (Z)
+    ("RSSMRA85T32A562S", 'data', None, None),                     # 32 dicembre
+    ("RSSMRA85B30A562S", 'data', None, None),                     # 30 febbraio
+    ("RSSMR185T10A562S", 'struttura', None, None),                # Cifra al posto di una lettera del cognome/nome
+]
+
+
+@pytest.mark.parametrize('cf, motivo, cin, nascita', CF_NOTI)
+def test_validate_codice_fiscale_casi_noti(cf, motivo, cin, nascita):
+    valido, msg = validate_codice_fiscale(cf)
+    assert valido == (motivo == '')
+    if motivo == 'controllo':
+        assert f"atteso '{cin}'" in msg
+    elif motivo == 'struttura':
+        assert "struttura non conforme" in msg
+    elif motivo == 'data':
+        assert "data di nascita inesistente" in msg
+
+
+def test_verifica_vettoriale_casi_noti():
+    motivi, cin, nascita = _cf_verifica_vettoriale([cf for cf, *_ in CF_NOTI], 2025)
+    assert motivi.tolist() == [m for _, m, _, _ in CF_NOTI]
+    for (cf, motivo, cin_atteso, nascita_attesa), cin_ottenuto, nascita_ottenuta in zip(CF_NOTI, cin.tolist(), nascita.tolist()):
+        if cin_atteso is not None:
+            assert cin_ottenuto == cin_atteso, cf
+        if nascita_attesa is not None:
+            assert nascita_ottenuta == nascita_attesa, cf
+
+
+def test_codice_fiscale_minuscolo_e_spazi():
+    assert validate_codice_fiscale(" rssmra85t10a562s ")[0]
+    assert not validate_codice_fiscale("RSSMRA85T10A562")[0]
+    assert not validate_codice_fiscale("")[0]
+
+#cartella/tests/test_codice_fiscale.py
@@ -0,0 +1,241 @@
+#cartella/tests/test_db.py
+"""
+Database: le tabelle di riepilogo e i totali FSE per bambino mantenuti dai trigger coincidono con
+un GROUP BY su spese_sostenute dopo inserimenti ed eliminazioni, anche quando sono ricavati dalle
+migrazioni su un database esistente; get_riepilogo con i filtri della dashboard coincide con le
+righe di query_spese; add_multiple_spese scarta e riporta le righe non valide (o annulla tutto in
+modalità tutto-o-niente); la lettura paginata del log scorre il file attivo e i segmenti compressi
+senza perdere né ripetere righe (con cursori invalidati dalla rotazione).
+"""
+import gzip
+import os
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from utils import db
+from tests.dati_casuali import genera_trasmissione
+
+
+def _totali_da_group_by(conn, key_cols: list) -> pd.DataFrame:
+    keys = ", ".join(f"COALESCE({k}, '') AS {k}" for k in key_cols)
+    tot = ", ".join(f"ROUND(SUM(COALESCE({c}, 0)), 6) AS tot_{c}" for c in db.RIEPILOGO_IMPORTI)
+    group_by = ", ".join(str(i + 1) for i in range(len(key_cols)))
+    return pd.read_sql_query(f"SELECT {keys}, {tot}, COUNT(*) AS n_righe, COUNT(DISTINCT codice_fiscale_bambino) AS n_bambini "
+                             f"FROM {db.TABLE_NAME} GROUP BY {group_by} ORDER BY {group_by}", conn)
+
+
+def _verifica_totali_trigger():
+    with db.db_connection() as conn:
+        for dimensione, key_cols in db.RIEPILOGO_DIMENSIONI.items():
+            tot = ", ".join(f"ROUND(tot_{c}, 6) AS tot_{c}" for c in db.RIEPILOGO_IMPORTI)
+            da_trigger = pd.read_sql_query(f"SELECT {', '.join(key_cols)}, {tot}, n_righe, n_bambini FROM riepilogo_{dimensione} "
+                                           f"ORDER BY {', '.join(key_cols)}", conn)
+            pd.testing.assert_frame_equal(da_trigger, _totali_da_group_by(conn, key_cols), obj=f"riepilogo_{dimensione}")
+        da_trigger = pd.read_sql_query(f"SELECT codice_fiscale_bambino, ROUND(tot_valore_contributo_fse, 6) AS tot, n_righe "
+                                       f"FROM {db.TOTALI_FSE_BAMBINO_TABLE} ORDER BY 1", conn)
+        atteso = pd.read_sql_query(f"SELECT codice_fiscale_bambino, ROUND(SUM(COALESCE(valore_contributo_fse, 0)), 6) AS tot, "
+                                   f"COUNT(*) AS n_righe FROM {db.TABLE_NAME} GROUP BY 1 ORDER BY 1", conn)
+    pd.testing.assert_frame_equal(da_trigger, atteso, obj=db.TOTALI_FSE_BAMBINO_TABLE)
+
+
+def _salva_trasmissioni(db_test):
+    for n_righe, rif_pa in ((120, "2024-1/RER"), (80, "2024-2/RER"), (150, "2024-3/RER")):
+        ok, msg = db_test.add_multiple_spese(genera_trasmissione(n_righe, rif_pa), "test")
+        assert ok, msg
+
+
+def test_totali_trigger_dopo_inserimenti_ed_eliminazioni(db_temporaneo):
+    _salva_trasmissioni(db_temporaneo)
+    _verifica_totali_trigger()
+    for filtri in (dict(rif_pa=["2024-2/RER"]), dict(comuni=["Comune 3", "Comune 7"]),
+                   dict(rif_pa=["2024-3/RER"], centri=["Centro 10", "Centro 11"]), dict()):
+        n_prima = db_temporaneo.query_spese(limit=0)[1]
+        n_filtrate = db_temporaneo.query_spese(limit=0, **filtri)[1]
+        eliminate, _ = db_temporaneo.delete_spese_by_filters("test", **filtri, batch_size=7)
+        assert eliminate == n_filtrate
+        assert db_temporaneo.query_spese(limit=0)[1] == n_prima - n_filtrate
+        _verifica_totali_trigger()
+
+
+def test_totali_fse_per_cf(db_temporaneo):
+    _salva_trasmissioni(db_temporaneo)
+    df, _ = db_temporaneo.query_spese(limit=None, columns=['codice_fiscale_bambino', 'valore_contributo_fse'])
+    attesi = df.groupby('codice_fiscale_bambino')['valore_contributo_fse'].sum().round(2).to_dict()
+    assert db_temporaneo.get_fse_totali_per_cf(list(attesi) + ["", "NONSALVATO00000"]) == attesi
+
+
+@pytest.mark.parametrize('dimensione', list(db.RIEPILOGO_DIMENSIONI))
+@pytest.mark.parametrize('filtri', [dict(), dict(rif_pa=["2024-1/RER", "2024-3/RER"]), dict(comuni=["Comune 1", "Comune 2"]),
+                                    dict(comuni=["Comune 4"], centri=["Centro 4", "Centro 24", "Centro 5"]),
+                                    dict(rif_pa=["2024-2/RER"], centri=["Centro 1"])])
+def test_riepilogo_uguale_alle_righe_filtrate(db_temporaneo, dimensione, filtri):
+    _salva_trasmissioni(db_temporaneo)
+    key_cols = db.RIEPILOGO_DIMENSIONI[dimensione]
+    righe, _ = db_temporaneo.query_spese(limit=None, **filtri)
+    righe[key_cols] = righe[key_cols].fillna('')
+    attesi = righe.groupby(key_cols, as_index=False).agg(
+        **{f"tot_{c}": (c, 'sum') for c in db.RIEPILOGO_IMPORTI},
+        n_righe=('codice_fiscale_bambino', 'size'), n_bambini=('codice_fiscale_bambino', 'nunique'))
+    attesi[[f"tot_{c}" for c in db.RIEPILOGO_IMPORTI]] = attesi[[f"tot_{c}" for c in db.RIEPILOGO_IMPORTI]].round(2)
+    riepilogo = db_temporaneo.get_riepilogo(dimensione, **filtri)
+    pd.testing.assert_frame_equal(riepilogo, attesi, check_dtype=False)
+
+
+# Schema di spese_sostenute prima delle migrazioni (nessuna tabella di riepilogo, user_version 0)
+SCHEMA_PRE_MIGRAZIONI = f"""
+    CREATE TABLE {db.TABLE_NAME} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, id_trasmissione TEXT NOT NULL, rif_pa TEXT NOT NULL, cup TEXT,
+        distretto TEXT, comune_capofila TEXT, numero_mandato TEXT, data_mandato DATE, comune_titolare_mandato TEXT,
+        importo_mandato REAL DEFAULT 0.0, comune_centro_estivo TEXT, centro_estivo TEXT, genitore_cognome_nome TEXT,
+        bambino_cognome_nome TEXT NOT NULL, codice_fiscale_bambino TEXT NOT NULL, valore_contributo_fse REAL DEFAULT 0.0,
+        altri_contributi REAL DEFAULT 0.0, quota_retta_destinatario REAL DEFAULT 0.0, totale_retta REAL DEFAULT 0.0,
+        numero_settimane_frequenza INTEGER DEFAULT 0, controlli_formali REAL DEFAULT 0.0,
+        timestamp_caricamento DATETIME NOT NULL, utente_caricamento TEXT NOT NULL,
+        UNIQUE(id_trasmissione, codice_fiscale_bambino, data_mandato, centro_estivo, valore_contributo_fse)
+    )"""
+
+
+@pytest.fixture
+def db_pre_migrazioni(tmp_path, monkeypatch):
+    """Database con lo schema precedente alle migrazioni e righe già salvate (inserite senza trigger)."""
+    db.flush_activity_log()
+    db.close_all_db_connections()
+    percorso = str(tmp_path / "spese.db")
+    conn = sqlite3.connect(percorso)
+    conn.execute(SCHEMA_PRE_MIGRAZIONI)
+    timestamp = datetime(2024, 7, 1, 12, 0)
+    for n_righe, rif_pa in ((120, "2023-1/RER"), (80, "2023-2/RER")):
+        conn.executemany(db.SPESE_INSERT_SQL, [db._build_spesa_values(r, "storico", timestamp)
+                                               for r in genera_trasmissione(n_righe, rif_pa).to_dict('records')])
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(db, 'DATABASE_PATH', percorso)
+    yield db
+    db.flush_activity_log()
+    db.close_all_db_connections()
+
+
+def _schema(conn) -> list:
+    return conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name").fetchall()
+
+
+def test_migrazioni_su_database_esistente(db_pre_migrazioni):
+    db_pre_migrazioni.init_db()
+    assert db_pre_migrazioni.get_schema_version() == max(v for v, _, _ in db.SCHEMA_MIGRATIONS)
+    assert db_pre_migrazioni.query_spese(limit=0)[1] == 200
+    _verifica_totali_trigger() # Tabelle di riepilogo e totali per bambino ricavati dalle righe esistenti
+    with db.db_connection() as conn:
+        assert conn.execute(f"SELECT COUNT(*) FROM {db.TOTALI_FSE_BAMBINO_TABLE}").fetchone()[0] == 120
+        schema = [tuple(r) for r in _schema(conn)]
+
+    # Seconda esecuzione: nessuna migrazione, schema e totali invariati
+    assert db_pre_migrazioni.apply_migrations() == []
+    db_pre_migrazioni.init_db()
+    with db.db_connection() as conn:
+        assert [tuple(r) for r in _schema(conn)] == schema
+    _verifica_totali_trigger()
+
+    # I trigger creati dalle migrazioni aggiornano i totali anche per le nuove righe
+    assert db_pre_migrazioni.add_multiple_spese(genera_trasmissione(50, "2024-1/RER"), "test")[0]
+    _verifica_totali_trigger()
+
+
+def _trasmissione_con_duplicato(n_righe: int) -> pd.DataFrame:
+    # La riga 0 ripetuta in fondo (stessa chiave UNIQUE) e una riga senza id_trasmissione
+    df = genera_trasmissione(n_righe, "2024-9/RER")
+    df = pd.concat([df, df.iloc[[0]]], ignore_index=True)
+    df.loc[5, 'id_trasmissione'] = None
+    return df
+
+
+def test_add_multiple_spese_salva_le_righe_valide(db_temporaneo):
+    df = _trasmissione_con_duplicato(30)
+    ok, msg = db_temporaneo.add_multiple_spese(df, "test")
+    assert not ok
+    assert "Aggiunte 29 righe. 2 righe non importate." in msg
+    assert f"Riga Dati {len(df)}: Errore: Violazione vincolo di unicità per Bambino 0 (possibile duplicato)" in msg
+    assert "Riga Dati 6: Errore interno: ID Trasmissione mancante." in msg
+    salvate, n_salvate = db_temporaneo.query_spese(limit=None, columns=['numero_mandato'])
+    assert n_salvate == 29
+    assert sorted(salvate['numero_mandato']) == sorted(df['numero_mandato'].drop(index=[5, len(df) - 1]))
+    _verifica_totali_trigger()
+
+
+def test_add_multiple_spese_atomico_non_salva_nulla(db_temporaneo):
+    ok, msg = db_temporaneo.add_multiple_spese(_trasmissione_con_duplicato(30), "test", atomic=True)
+    assert not ok
+    assert "Nessuna riga importata (modalità tutto-o-niente): 2 righe non valide." in msg
+    assert db_temporaneo.query_spese(limit=0)[1] == 0
+    _verifica_totali_trigger()
+
+
+def test_add_multiple_spese_righe_gia_presenti(db_temporaneo):
+    df = genera_trasmissione(20, "2024-9/RER")
+    assert db_temporaneo.add_multiple_spese(df, "test")[0]
+    ok, msg = db_temporaneo.add_multiple_spese(df, "test") # Stessa trasmissione salvata di nuovo
+    assert not ok
+    assert "Aggiunte 0 righe. 20 righe non importate." in msg
+    assert db_temporaneo.query_spese(limit=0)[1] == 20
+    assert db_temporaneo.add_multiple_spese(df.iloc[:0], "test") == (True, "Nessuna riga da importare.")
+
+
+# --- Lettura paginata del log ---
+
+def _scrivi_segmento(percorso: str, righe: list):
+    contenuto = "".join(f"{r}\n" for r in righe).encode('utf-8')
+    if percorso.endswith('.gz'):
+        with gzip.open(percorso, 'wb') as f:
+            f.write(contenuto)
+    else:
+        with open(percorso, 'wb') as f:
+            f.write(contenuto)
+
+
+@pytest.fixture
+def log_segmentato(tmp_path, monkeypatch):
+    """Log con file attivo e due segmenti compressi: righe numerate dalla più vecchia (.2.gz) alla più recente."""
+    percorso = str(tmp_path / "activity.log")
+    monkeypatch.setattr(db, 'log_file_path', percorso)
+    monkeypatch.setattr(db, 'LOG_READ_BLOCK_SIZE', 256) # Più blocchi per segmento, righe a cavallo dei blocchi
+    righe = [f"2025-07-01 10:00:00 - INFO - User: test - Action: EVENTO - Details: riga {i:04d} " + "x" * (i % 37) for i in range(700)]
+    _scrivi_segmento(f"{percorso}.2.gz", righe[:250])
+    _scrivi_segmento(f"{percorso}.1.gz", righe[250:520])
+    _scrivi_segmento(percorso, righe[520:])
+    return percorso, righe
+
+
+@pytest.mark.parametrize('n_lines', [1, 7, 250, 1000])
+def test_pagine_del_log_attraverso_i_segmenti(log_segmentato, n_lines):
+    _, righe = log_segmentato
+    lette, cursor = [], None
+    while True:
+        pagina, cursor = db.read_log_page(n_lines, cursor)
+        assert 0 < len(pagina) <= n_lines
+        lette += pagina
+        if cursor is None:
+            break
+        assert len(pagina) == n_lines
+    assert lette == righe[::-1]
+
+
+def test_cursore_del_log_non_valido_dopo_rotazione(log_segmentato):
+    percorso, righe = log_segmentato
+    _, cursor_attivo = db.read_log_page(50)
+    _, cursor_segmento = db.read_log_page(200, cursor_attivo) # Prosegue nel primo segmento compresso
+    assert cursor_segmento[0] == 1 and db.log_cursor_valido(cursor_segmento)
+    # Rotazione: .2.gz -> .3.gz, .1.gz -> .2.gz, file attivo compresso in .1.gz, nuovo file attivo
+    os.rename(f"{percorso}.2.gz", f"{percorso}.3.gz")
+    os.rename(f"{percorso}.1.gz", f"{percorso}.2.gz")
+    db._gzip_log_rotator(percorso, f"{percorso}.1.gz")
+    _scrivi_segmento(percorso, ["riga dopo la rotazione"])
+    for cursor in (cursor_attivo, cursor_segmento):
+        assert not db.log_cursor_valido(cursor)
+        with pytest.raises(ValueError):
+            db.read_log_page(10, cursor)
+    pagina, _ = db.read_log_page(1000)
+    assert pagina == ["riga dopo la rotazione"] + righe[::-1][:999]
+
+#cartella/tests/test_db.py
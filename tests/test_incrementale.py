@@ -0,0 +1,46 @@
+#cartella/tests/test_incrementale.py
+"""
+Validazione incrementale dell'incollato del richiedente: a ogni modifica (celle corrette, righe
+cancellate, duplicate o spostate, date riscritte in un altro formato) validate_righe_incrementale,
+con la cache delle esecuzioni precedenti, restituisce esattamente dati parsati, risultati, flag e
+formato del percorso completo (read_csv + validate_richiedente_df).
+"""
+import random
+from io import StringIO
+
+import pandas as pd
+import pytest
+
+from utils.common_utils import formatta_esiti
+from utils.paste_validation import (
+    NOMI_COLONNE_PASTED_DATA, split_righe_incollate, validate_righe_incrementale, validate_richiedente_df,
+)
+from tests.dati_casuali import (
+    AGE_REFERENCE, cf_strutturato_casuale, riga_incollata_casuale, come_testo_incollato, modifica_incollato,
+)
+
+
+def validazione_completa(testo: str):
+    df_pasted = pd.read_csv(StringIO(testo), sep='\t', header=None, dtype=str, na_filter=False)
+    df_pasted.columns = NOMI_COLONNE_PASTED_DATA
+    return validate_richiedente_df(df_pasted, AGE_REFERENCE)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_incrementale_uguale_a_validazione_completa(seed):
+    rng = random.Random(seed)
+    bambini = [cf_strutturato_casuale(rng) for _ in range(10)]
+    righe = [riga_incollata_casuale(rng, bambini) for _ in range(rng.randint(1, 80))]
+    cache = {}
+    for passo in range(12):
+        testo = come_testo_incollato(righe)
+        atteso = validazione_completa(testo)
+        ottenuto = validate_righe_incrementale(split_righe_incollate(testo, len(NOMI_COLONNE_PASTED_DATA)),
+                                               NOMI_COLONNE_PASTED_DATA, cache, AGE_REFERENCE)
+        pd.testing.assert_frame_equal(atteso[0], ottenuto[0], check_exact=True, obj=f"dati (passo {passo})")
+        pd.testing.assert_frame_equal(formatta_esiti(atteso[1]), formatta_esiti(ottenuto[1]), check_exact=True,
+                                      obj=f"risultati (passo {passo})")
+        assert atteso[2:] == ottenuto[2:]
+        righe = modifica_incollato(rng, righe, bambini)
+
+#cartella/tests/test_incrementale.py
@@ -0,0 +1,86 @@
+#cartella/tests/test_parsing.py
+"""
+Parsing vettoriale di importi, settimane e date: stessi valori (ed eccezioni) delle funzioni
+scalari su celle testuali casuali, sia sul percorso vettoriale sia sotto la soglia
+PARSING_VETTORIALE_MIN_CELLE; per le date, formato rilevato e stesse date del parsing dayfirst.
+"""
+import random
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+from utils import common_utils
+from utils.common_utils import (
+    parse_excel_currency, parse_excel_currency_series, parse_numero_settimane, parse_numero_settimane_series,
+    parse_data_mandato_series, DATA_MANDATO_FORMATI, DATA_FORMATO_EXCEL,
+)
+from tests.dati_casuali import cella_casuale
+
+
+@pytest.fixture(params=['vettoriale', 'soglia_default'])
+def percorso_parsing(request, monkeypatch):
+    """'vettoriale': anche le colonne corte dei test passano dal parsing vettoriale (non dall'apply scalare)."""
+    if request.param == 'vettoriale':
+        monkeypatch.setattr(common_utils, 'PARSING_VETTORIALE_MIN_CELLE', 0)
+    return request.param
+
+
+def _risultato(funzione, celle: pd.Series):
+    try:
+        return funzione(celle), None
+    except Exception as e:
+        return None, type(e)
+
+
+def _stesse_date(attese, ottenute) -> bool:
+    return all((a is pd.NaT and o is pd.NaT) or a == o for a, o in zip(attese, ottenute, strict=True))
+
+
+@pytest.mark.parametrize('scalare, vettoriale', [(parse_excel_currency, parse_excel_currency_series),
+                                                 (parse_numero_settimane, parse_numero_settimane_series)])
+@pytest.mark.parametrize('seed', range(150))
+def test_parsing_vettoriale_uguale_a_scalare(percorso_parsing, scalare, vettoriale, seed):
+    rng = random.Random(seed)
+    celle = pd.Series([cella_casuale(rng) for _ in range(rng.randint(1, 60))], dtype=rng.choice([str, object]))
+    atteso, errore_atteso = _risultato(lambda s: s.apply(scalare), celle)
+    ottenuto, errore_ottenuto = _risultato(vettoriale, celle)
+    assert errore_atteso == errore_ottenuto
+    if errore_atteso is None:
+        pd.testing.assert_series_equal(atteso, ottenuto, check_exact=True)
+
+
+@pytest.mark.parametrize('seed', range(150))
+def test_date_in_un_formato(percorso_parsing, seed):
+    rng = random.Random(seed)
+    formato = rng.choice(list(DATA_MANDATO_FORMATI))
+    celle, attese = [], []
+    for _ in range(rng.randint(1, 60)):
+        d = date(2020, 1, 1) + timedelta(days=rng.randint(0, 2500))
+        if rng.random() < 0.1:
+            celle.append(rng.choice(["", "  ", "non una data", "31/02/2024", "2024-13-45", "12345", "99999"]))
+            attese.append(pd.NaT)
+            continue
+        testo = str((d - date(1899, 12, 30)).days) if formato == DATA_FORMATO_EXCEL else d.strftime(formato)
+        celle.append(rng.choice([testo, f" {testo} "]))
+        attese.append(d)
+    ottenute, rilevato = parse_data_mandato_series(pd.Series(celle, dtype=rng.choice([str, object])))
+    assert _stesse_date(attese, ottenute)
+    if any(a is not pd.NaT for a in attese):
+        assert rilevato == DATA_MANDATO_FORMATI[formato]
+
+
+@pytest.mark.parametrize('celle', [
+    ['03/05/24', '14/06/24', '01/07/24'],
+    ['03.05.2024', '14.06.2024'],
+    ['03/05/2024 00:00:00', '14/06/2024'],
+    ['3/5/2024', ' 14/06/2024 ', '', 'non una data'],
+])
+def test_date_riconosciute_dal_parsing_dayfirst(celle):
+    # Colonne che il parsing precedente (pd.to_datetime con dayfirst=True) già riconosceva: stesse date
+    colonna = pd.Series(celle, dtype=object)
+    attese = pd.to_datetime(colonna, errors='coerce', dayfirst=True, format='mixed').dt.date
+    ottenute, _ = parse_data_mandato_series(colonna)
+    assert _stesse_date(attese, ottenute)
+
+#cartella/tests/test_parsing.py
@@ -0,0 +1,120 @@
+#cartella/tests/test_streaming.py
+"""
+CSV del controllore: la validazione a blocchi restituisce le righe "Batch" e le righe con errori
+del percorso completo (read_csv + run_detailed_validations), con lo stesso flag; il salvataggio a
+blocchi scrive le stesse righe del salvataggio in un'unica volta e vede i duplicati tra blocchi
+diversi; la cache per contenuto di valida_contenuto restituisce i risultati della lettura diretta
+e resta entro il limite di memoria.
+"""
+import io
+import random
+import uuid
+
+import pandas as pd
+import pytest
+
+from utils import validation_pipeline
+from utils.common_utils import preprocess_controllore_df, run_detailed_validations, formatta_esiti, prepara_df_per_db
+from utils.stream_validation import (
+    validate_controllore_csv_streaming, iter_blocchi_per_db, CSV_CONTROLLORE_KWARGS, VALIDATION_KWARGS_CONTROLLORE,
+)
+from utils.validation_pipeline import valida_contenuto, pipeline_cache_info, clear_pipeline_cache
+from tests.dati_casuali import AGE_REFERENCE, genera_csv, lookup_storico
+
+COLONNE_CONFRONTO_DB = ['rif_pa', 'numero_mandato', 'data_mandato', 'centro_estivo', 'bambino_cognome_nome', 'codice_fiscale_bambino',
+                        'importo_mandato', 'valore_contributo_fse', 'altri_contributi', 'quota_retta_destinatario',
+                        'totale_retta', 'numero_settimane_frequenza', 'controlli_formali']
+
+
+def lettura_diretta(source, storico: dict) -> tuple[pd.DataFrame, pd.DataFrame, bool]:
+    df, _, _ = preprocess_controllore_df(pd.read_csv(source, **CSV_CONTROLLORE_KWARGS))
+    res, has_err = run_detailed_validations(df, **VALIDATION_KWARGS_CONTROLLORE, historical_fse_by_cf=storico,
+                                            age_reference_date=AGE_REFERENCE)
+    return df, res, has_err
+
+
+@pytest.mark.parametrize('chunk_rows', [5, 64, 10000])
+@pytest.mark.parametrize('seed', range(15))
+def test_streaming_uguale_a_validazione_completa(seed, chunk_rows):
+    testo, storico = genera_csv(random.Random(seed).randint(1, 200), seed)
+    _, res, err_atteso = lettura_diretta(io.StringIO(testo), storico)
+    # Il percorso a blocchi conserva solo le righe "Batch" e le righe con errori
+    atteso = res[(res['Riga'] == "Batch") | (res['Errori Bloccanti'] != "Nessuno")].reset_index(drop=True)
+    ottenuto, err_ottenuto, _ = validate_controllore_csv_streaming(
+        io.StringIO(testo), historical_lookup=lookup_storico(storico), age_reference_date=AGE_REFERENCE, chunk_rows=chunk_rows)
+    pd.testing.assert_frame_equal(atteso.astype(object), ottenuto.astype(object), check_exact=True)
+    assert err_atteso == err_ottenuto
+
+
+def _righe_salvate(db, id_trasmissione: str) -> pd.DataFrame:
+    df, _ = db.query_spese(limit=None, sort_by='id', descending=False, columns=['id_trasmissione'] + COLONNE_CONFRONTO_DB)
+    return df[df['id_trasmissione'] == id_trasmissione].drop(columns='id_trasmissione').reset_index(drop=True)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_salvataggio_a_blocchi_uguale_a_salvataggio_unico(db_temporaneo, seed):
+    db = db_temporaneo
+    testo, _ = genera_csv(300, seed)
+    df, _, _ = preprocess_controllore_df(pd.read_csv(io.StringIO(testo), **CSV_CONTROLLORE_KWARGS))
+    id_unico, id_blocchi = str(uuid.uuid4()), str(uuid.uuid4())
+    esito_unico = db.add_multiple_spese(prepara_df_per_db(df, id_unico)[0], "test")
+    esito_blocchi = db.add_spese_a_blocchi(iter_blocchi_per_db(io.StringIO(testo), id_blocchi, chunk_rows=37), "test")
+    assert esito_unico[0] == esito_blocchi[0]
+    assert esito_unico[1].replace(id_unico[:8], '') == esito_blocchi[1].replace(id_blocchi[:8], '')
+    righe = _righe_salvate(db, id_blocchi)
+    assert len(righe) > 0
+    pd.testing.assert_frame_equal(_righe_salvate(db, id_unico), righe, check_exact=True)
+
+
+@pytest.mark.parametrize('atomic', [False, True])
+def test_salvataggio_a_blocchi_duplicato_tra_blocchi(db_temporaneo, atomic):
+    db = db_temporaneo
+    testo, _ = genera_csv(50, seed=3)
+    df_csv = pd.read_csv(io.StringIO(testo), **CSV_CONTROLLORE_KWARGS)
+    # Una riga dei primi blocchi ripetuta in fondo, in un altro blocco (con una data valida: NULL non viola il vincolo UNIQUE)
+    ripetuta = df_csv.index[df_csv['data_mandato'] != "32/13/2024"][0]
+    df_csv = pd.concat([df_csv, df_csv.iloc[[ripetuta]]], ignore_index=True)
+    ok, msg = db.add_spese_a_blocchi(iter_blocchi_per_db(io.StringIO(df_csv.to_csv(sep=';', index=False)), str(uuid.uuid4()),
+                                                         chunk_rows=10), "test", atomic=atomic)
+    assert not ok
+    assert f"Riga Dati {len(df_csv)}:" in msg
+    _, n_salvate = db.query_spese(limit=0)
+    assert n_salvate == (0 if atomic else len(df_csv) - 1)
+
+
+@pytest.fixture
+def cache_pipeline_vuota():
+    clear_pipeline_cache()
+    yield
+    clear_pipeline_cache()
+
+
+@pytest.mark.parametrize('seed', range(15))
+def test_cache_pipeline_uguale_a_lettura_diretta(cache_pipeline_vuota, seed):
+    testo, storico = genera_csv(random.Random(seed).randint(1, 200), seed)
+    contenuto = testo.encode('utf-8')
+    storico_dopo = {cf: v + 100.0 for cf, v in storico.items()} # Altre trasmissioni salvate nel frattempo
+    for sorgente, storico_passo, atteso_da_cache in [(contenuto, storico, False), (contenuto, storico, True),
+                                                     (testo, storico_dopo, True)]:
+        atteso = lettura_diretta(io.BytesIO(contenuto), storico_passo)
+        df, esiti, has_err, info = valida_contenuto(sorgente, historical_lookup=lookup_storico(storico_passo),
+                                                  age_reference_date=AGE_REFERENCE)
+        pd.testing.assert_frame_equal(atteso[0], df, check_exact=True)
+        pd.testing.assert_frame_equal(atteso[1], formatta_esiti(esiti), check_exact=True)
+        assert atteso[2] == has_err
+        assert info['da_cache'] == atteso_da_cache
+
+
+def test_cache_pipeline_entro_il_limite_di_memoria(cache_pipeline_vuota, monkeypatch):
+    monkeypatch.setattr(validation_pipeline, 'PIPELINE_CACHE_MAX_BYTES', 2 * 1024 * 1024)
+    contenuti = [genera_csv(300, 1000 + i)[0].encode('utf-8') for i in range(30)]
+    for contenuto in contenuti:
+        valida_contenuto(contenuto, age_reference_date=AGE_REFERENCE)
+        info = pipeline_cache_info()
+        assert info['byte'] <= info['max_byte']
+    assert pipeline_cache_info()['evicted'] > 0
+    # Le voci più recenti restano in cache, le prime sono state rimosse
+    assert valida_contenuto(contenuti[-1], age_reference_date=AGE_REFERENCE)[3]['da_cache']
+    assert not valida_contenuto(contenuti[0], age_reference_date=AGE_REFERENCE)[3]['da_cache']
+
+#cartella/tests/test_streaming.py
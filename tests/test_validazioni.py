@@ -0,0 +1,106 @@
+#cartella/tests/test_validazioni.py
+"""
+Motori di validazione: il vettoriale (e quello parallelo a blocchi di righe) restituiscono
+esattamente lo stesso DataFrame e lo stesso flag del motore riga per riga, anche con limiti
+delle regole diversi dai default; gli esiti compatti formattati per alcune righe o per pagine
+danno le stesse righe del risultato completo.
+"""
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import validation_rules
+from utils.common_utils import (
+    _run_detailed_validations_rowwise, _run_detailed_validations_vectorized, _can_vectorize_validations,
+    _run_detailed_validations_parallel, run_detailed_validations,
+    valida_esiti_compatti, formatta_esiti, posizioni_con_errori, pagina_esiti,
+)
+from tests.dati_casuali import AGE_REFERENCE, VALIDATION_ARGS, genera_corpus
+
+
+def _corpus_e_kwargs(seed: int, max_righe: int) -> tuple[pd.DataFrame, dict]:
+    rng = random.Random(seed)
+    df, storico = genera_corpus(rng.randint(1, max_righe), seed)
+    kwargs = dict(VALIDATION_ARGS, row_offset_for_messages=rng.choice([1, 2]),
+                  historical_fse_by_cf=storico if rng.random() < 0.5 else None,
+                  age_reference_date=AGE_REFERENCE if rng.random() < 0.5 else None)
+    return df, kwargs
+
+
+def _confronta_motori(seed: int):
+    df, kwargs = _corpus_e_kwargs(seed, 60)
+    assert _can_vectorize_validations(df, kwargs['cf_col_clean'], kwargs['declared_formal_controls_col'])
+    res_riga, err_riga = _run_detailed_validations_rowwise(df, **kwargs)
+    res_vett, err_vett = _run_detailed_validations_vectorized(df, **kwargs)
+    pd.testing.assert_frame_equal(res_riga, res_vett, check_exact=True)
+    assert err_riga == err_vett
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_vettoriale_uguale_a_riga_per_riga(seed):
+    _confronta_motori(seed)
+
+
+@pytest.fixture
+def regole_configurate(tmp_path, monkeypatch):
+    """File delle regole con limiti diversi dai default."""
+    percorso = tmp_path / "regole_validazione.yaml"
+    percorso.write_text("regole:\n  contributo_fse: {cap_settimanale: 80, cap_riga: 250.5}\n"
+                        "  controlli_formali: {percentuale: 0.1}\n  cap_bambino: {cap: 200}\n", encoding='utf-8')
+    monkeypatch.setattr(validation_rules, 'REGOLE_FILE', str(percorso))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_regole_configurate_motori_uguali(regole_configurate, seed):
+    _confronta_motori(seed)
+
+
+def test_regole_configurate_nei_messaggi(regole_configurate):
+    df, storico = genera_corpus(200, seed=7)
+    res, _ = _run_detailed_validations_vectorized(df, **VALIDATION_ARGS, historical_fse_by_cf=storico)
+    testo = " ".join(res['Errori Bloccanti'].tolist())
+    for atteso in ("cap 80€", "limite assoluto di 250.5€", "Superato cap 200€"):
+        assert atteso in testo
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_parallelo_uguale_a_seriale(seed):
+    df, kwargs = _corpus_e_kwargs(seed, 300)
+    res_seriale, err_seriale = run_detailed_validations(df, **kwargs)
+    res_par, err_par = _run_detailed_validations_parallel(df, **kwargs, n_shards=random.Random(seed).randint(1, 6))
+    pd.testing.assert_frame_equal(res_seriale, res_par, check_exact=True)
+    assert err_seriale == err_par
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_esiti_compatti_coerenti_con_risultato_completo(seed):
+    df, kwargs = _corpus_e_kwargs(seed, 120)
+    rng = random.Random(seed + 1)
+    kwargs['batch_checks'] = rng.random() < 0.8
+    completo, err_completo = run_detailed_validations(df, **kwargs)
+    esiti, err_esiti = valida_esiti_compatti(df, **kwargs)
+    n_batch = int((completo['Riga'] == "Batch").sum())
+    righe_dati = completo.iloc[n_batch:].reset_index(drop=True)
+    assert err_completo == err_esiti
+
+    posizioni = sorted(rng.sample(range(len(df)), rng.randint(0, len(df))))
+    pd.testing.assert_frame_equal(righe_dati.iloc[posizioni].reset_index(drop=True),
+                                  formatta_esiti(esiti, posizioni, includi_batch=False), check_exact=True,
+                                  check_dtype=False) # 'Riga' è object solo se ci sono righe "Batch"
+    attese = np.flatnonzero((righe_dati['Errori Bloccanti'] != "Nessuno").to_numpy())
+    assert posizioni_con_errori(esiti).tolist() == attese.tolist()
+
+    righe_per_pagina = rng.randint(1, 40)
+    pagine, n_sel, n_pagine = [], 0, 1
+    for pagina in range(1, 1000):
+        df_pagina, n_sel, n_pagine = pagina_esiti(esiti, solo_errori=True, pagina=pagina, righe_per_pagina=righe_per_pagina)
+        pagine.append(df_pagina)
+        if pagina >= n_pagine:
+            break
+    solo_errori = pd.concat([completo.iloc[:n_batch], righe_dati.iloc[attese]], ignore_index=True)
+    pd.testing.assert_frame_equal(solo_errori, pd.concat(pagine, ignore_index=True), check_exact=True, check_dtype=False)
+    assert n_sel == len(attese)
+
+#cartella/tests/test_validazioni.py
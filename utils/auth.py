@@ -1,6 +1,103 @@
+#cartella/utils/auth.py
+"""
+Configurazione di autenticazione (config.yaml) e authenticator condivisi dalle pagine.
+Il file è letto e parsato una sola volta per processo: le riesecuzioni di Streamlit (ogni interazione
+col form di login, ogni cambio di pagina) riusano la configurazione in cache. Al più ogni
+CONFIG_INTERVALLO_CONTROLLO secondi si controlla lo stat del file (mtime, dimensione); se cambia si
+rilegge e, solo se il digest del contenuto è diverso, si riparsa: le modifiche alle credenziali
+valgono senza riavviare l'app.
+"""
+import copy
+import hashlib
+import os
+import threading
+import time
+from typing import Union
+
+import streamlit as st
 import streamlit_authenticator as stauth
+import yaml
+from yaml.loader import SafeLoader
 import bcrypt # Assicurati di averlo installato: pip install bcrypt
 
+CONFIG_FILE = 'config.yaml'
+CONFIG_INTERVALLO_CONTROLLO = 2.0 # Secondi tra due controlli dello stat del file (0 = a ogni chiamata)
+
+_config_cache = {} # percorso -> {'stat', 'digest', 'config', 'controllato'}
+_config_lock = threading.Lock()
+
+def get_config(percorso: Union[str, None] = None) -> tuple[dict, str]:
+    """
+    Configurazione parsata e digest del contenuto (identifica la versione delle credenziali).
+    La configurazione è condivisa da tutte le sessioni: non modificarla.
+    Solleva FileNotFoundError (file assente) o yaml.YAMLError (sintassi) come la lettura diretta;
+    in caso di errore la cache non cambia e il file è riletto alla chiamata successiva.
+    """
+    percorso = percorso or CONFIG_FILE
+    adesso = time.monotonic()
+    with _config_lock:
+        voce = _config_cache.get(percorso)
+        if voce is not None and adesso - voce['controllato'] < CONFIG_INTERVALLO_CONTROLLO:
+            return voce['config'], voce['digest'] # Nessun accesso al disco
+        stato = os.stat(percorso)
+        chiave_stat = (stato.st_mtime_ns, stato.st_size)
+        if voce is not None and voce['stat'] == chiave_stat:
+            voce['controllato'] = adesso
+            return voce['config'], voce['digest']
+        with open(percorso, 'rb') as file:
+            contenuto = file.read()
+        digest = hashlib.blake2b(contenuto, digest_size=20).hexdigest()
+        if voce is not None and voce['digest'] == digest: # File toccato ma invariato: niente parsing
+            voce.update(stat=chiave_stat, controllato=adesso)
+            return voce['config'], voce['digest']
+        config = yaml.load(contenuto, Loader=SafeLoader)
+        if not isinstance(config, dict):
+            raise yaml.YAMLError(f"'{percorso}' non contiene una mappa di configurazione.")
+        _config_cache[percorso] = {'stat': chiave_stat, 'digest': digest, 'config': config, 'controllato': adesso}
+        return config, digest
+
+def get_ruolo_utente(username: str, percorso: Union[str, None] = None) -> str:
+    """Ruolo dell'utente dalle credenziali in cache ('user' se non specificato)."""
+    config, _ = get_config(percorso)
+    return config['credentials']['usernames'].get(username, {}).get('role', 'user')
+
+def get_authenticator(percorso: Union[str, None] = None) -> stauth.Authenticate:
+    """
+    Authenticator della sessione corrente, usato dal form di login e da tutte le pagine.
+    È creato una volta per sessione e ricreato solo se le credenziali cambiano: non può essere
+    condiviso tra sessioni perché il gestore dei cookie legge i cookie del browser della sessione.
+    Ogni istanza riceve una copia delle credenziali, che streamlit_authenticator aggiorna sul posto.
+    Solleva le eccezioni di get_config e KeyError se mancano chiavi di configurazione.
+    """
+    config, digest = get_config(percorso)
+    authenticator = st.session_state.get('authenticator')
+    if authenticator is not None and st.session_state.get('authenticator_versione') == digest:
+        if st.session_state.get('authentication_status'):
+            return authenticator
+        # Login non ancora effettuato: si rileggono i cookie del browser come alla creazione, per il
+        # login automatico da cookie di una sessione precedente. cookie_handler.cookie_manager è interno
+        # a streamlit_authenticator (versione fissata in requirements.txt): se manca o non funziona
+        # l'istanza viene ricreata, come quando cambiano le credenziali
+        cookie_manager = getattr(getattr(authenticator, 'cookie_handler', None), 'cookie_manager', None)
+        rileggi_cookie = getattr(cookie_manager, 'get_all', None)
+        if callable(rileggi_cookie):
+            try:
+                rileggi_cookie()
+                return authenticator
+            except Exception:
+                pass
+    authenticator = stauth.Authenticate(
+        copy.deepcopy(config['credentials']),
+        config['cookie']['name'],
+        config['cookie']['key'],
+        config['cookie']['expiry_days'],
+        # preauthorized=config.get('preauthorized', {}) # Opzionale per preautorizzazioni
+    )
+    st.session_state['authenticator'] = authenticator
+    st.session_state['authenticator_versione'] = digest
+    return authenticator
+
+
 def generate_hashed_passwords():
     """Utility per generare password hashate."""
     # Esempio: inserisci qui le password che vuoi hashare
@@ -15,4 +112,6 @@ def generate_hashed_passwords():
 
 if __name__ == '__main__':
     generate_hashed_passwords()
-    print("\nRicorda di aggiornare il file config.yaml con le password hashate generate e di impostare i ruoli (admin/user).")
\ No newline at end of file
+    print("\nRicorda di aggiornare il file config.yaml con le password hashate generate e di impostare i ruoli (admin/user).")
+
+#cartella/utils/auth.py
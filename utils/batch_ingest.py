@@ -0,0 +1,276 @@
+#cartella/utils/batch_ingest.py
+"""
+Validazione e caricamento da riga di comando di molti file di trasmissione del controllore
+(es. i CSV ricevuti dai comuni a fine stagione), senza Streamlit.
+Stessi passi della pagina 01_Gestione_Dati_Controllore: lettura, pre-processing e controlli per riga
+in un pool di processi (un file per processo alla volta); poi, nel processo principale e nell'ordine
+dei file, controlli sul Rif. PA (formato, già nel DB o in un file precedente del lancio), controlli
+per bambino con lo storico FSE del DB e inserimento della trasmissione con add_multiple_spese.
+Solo il processo principale scrive nel DB: lo storico letto per ogni file comprende le trasmissioni
+caricate prima nello stesso lancio (con --dry-run sono sommate in memoria, senza scrivere).
+Per ogni file si scrive un report CSV (righe "Batch" e righe con errori bloccanti, come nella pagina;
+tutte le righe con --report-completo) e a fine lancio un riepilogo per file.
+
+Uso: python -m utils.batch_ingest PERCORSO [PERCORSO ...] [--report-dir CARTELLA] [--workers N]
+                                 [--utente NOME] [--dry-run] [--fail-fast] [--report-completo]
+PERCORSO: file CSV, cartella (tutti i suoi .csv) o glob (es. "arrivi/2025-*.csv").
+Codice di uscita: 0 se tutti i file sono validi (e caricati), 1 altrimenti, 2 se non ci sono file.
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Union
+
+import pandas as pd
+
+from utils.common_utils import (
+    validate_rif_pa_format, prepara_df_per_db, formatta_esiti, posizioni_con_errori, aggiungi_esiti_bambini,
+    sanitize_filename_component, generate_timestamp_filename, PARALLEL_MAX_WORKERS,
+)
+from utils.db import init_db, add_multiple_spese, check_rif_pa_exists, get_fse_totali_per_cf, log_activity, flush_activity_log
+from utils.stream_validation import VALIDATION_KWARGS_CONTROLLORE
+from utils.validation_pipeline import parse_e_valida_righe
+
+BATCH_REPORT_DIR = 'report_batch'
+BATCH_UTENTE = 'batch_cli' # Utente registrato nel DB e nel log delle attività
+BATCH_FILE_IN_CODA = 2     # File letti in anticipo per processo (limita la memoria dei risultati in attesa)
+
+# Esiti per file
+ESITO_CARICATO = 'CARICATO'
+ESITO_VALIDO = 'VALIDO'    # --dry-run: sarebbe stato caricato
+ESITO_ERRORI = 'ERRORI_VALIDAZIONE'
+ESITO_RIF_PA_NON_VALIDO = 'RIF_PA_NON_VALIDO'
+ESITO_RIF_PA_ESISTENTE = 'RIF_PA_ESISTENTE'
+ESITO_FILE_VUOTO = 'FILE_VUOTO'
+ESITO_ERRORE_LETTURA = 'ERRORE_LETTURA'
+ESITO_ERRORE_DB = 'ERRORE_DB'
+ESITI_OK = (ESITO_CARICATO, ESITO_VALIDO)
+
+def espandi_percorsi(percorsi: list) -> list:
+    """File CSV da elaborare: cartelle (i loro .csv), file e glob, senza duplicati e nell'ordine dato."""
+    trovati = []
+    for percorso in percorsi:
+        if os.path.isdir(percorso):
+            trovati.extend(sorted(os.path.join(percorso, f) for f in os.listdir(percorso)
+                                  if f.lower().endswith('.csv') and os.path.isfile(os.path.join(percorso, f))))
+        elif os.path.isfile(percorso):
+            trovati.append(percorso)
+        else:
+            trovati.extend(sorted(f for f in glob.glob(percorso, recursive=True) if os.path.isfile(f)))
+    visti = set()
+    return [f for f in trovati if not (os.path.abspath(f) in visti or visti.add(os.path.abspath(f)))]
+
+def _leggi_e_valida(percorso: str, age_reference_date: date) -> dict:
+    """Nel processo del pool: lettura, pre-processing e controlli per riga (senza quelli per bambino)."""
+    inizio = time.perf_counter()
+    try:
+        with open(percorso, 'rb') as file:
+            contenuto = file.read()
+        voce, _ = parse_e_valida_righe(contenuto, 'controllore', age_reference_date, parallel=False)
+    except pd.errors.EmptyDataError:
+        return {'errore': "Il file CSV è vuoto o non contiene dati leggibili.", 'esito': ESITO_FILE_VUOTO}
+    except pd.errors.ParserError as pe:
+        return {'errore': f"Errore di parsing del CSV: {pe}. Verificare separatore (';'), decimali (',') e encoding (UTF-8).",
+                'esito': ESITO_ERRORE_LETTURA}
+    except ValueError as ve: # Errori di conversione non gestiti
+        return {'errore': f"Errore nella conversione dei dati CSV: {ve}. Controlla colonne, formati numerici e date.",
+                'esito': ESITO_ERRORE_LETTURA}
+    except Exception as e: # File illeggibile
+        return {'errore': f"{type(e).__name__}: {e}", 'esito': ESITO_ERRORE_LETTURA}
+    return {'voce': voce, 'byte': len(contenuto), 'secondi': time.perf_counter() - inizio}
+
+def _risultati_in_ordine(percorsi: list, workers: int, age_reference_date: date):
+    """(percorso, risultato di _leggi_e_valida) nell'ordine dei file, letti in parallelo da workers processi."""
+    if workers <= 1:
+        for percorso in percorsi:
+            yield percorso, _leggi_e_valida(percorso, age_reference_date)
+        return
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        da_inviare = iter(percorsi)
+        in_corso = deque((p, pool.submit(_leggi_e_valida, p, age_reference_date))
+                         for _, p in zip(range(workers * BATCH_FILE_IN_CODA), da_inviare))
+        while in_corso:
+            percorso, futuro = in_corso.popleft()
+            successivo = next(da_inviare, None)
+            if successivo is not None:
+                in_corso.append((successivo, pool.submit(_leggi_e_valida, successivo, age_reference_date)))
+            yield percorso, futuro.result()
+    finally: # Anche con --fail-fast: i file non ancora iniziati non vengono letti
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _nome_report(percorso: str, usati: set) -> str:
+    base = sanitize_filename_component(os.path.splitext(os.path.basename(percorso))[0]) or 'file'
+    nome, n = f"{base}_esiti.csv", 1
+    while nome in usati: # Stesso nome di file in cartelle diverse
+        n += 1
+        nome = f"{base}_{n}_esiti.csv"
+    usati.add(nome)
+    return nome
+
+def _scrivi_csv(df: pd.DataFrame, percorso: str):
+    df.to_csv(percorso, index=False, sep=';', decimal=',', encoding='utf-8-sig')
+
+def elabora_file(percorso: str, risultato: dict, stato: dict, opzioni: argparse.Namespace) -> dict:
+    """
+    Controlli nel processo principale, report e (se valido e non --dry-run) inserimento di un file.
+    stato: Rif. PA già visti nel lancio, FSE per CF dei file validi in --dry-run, nomi dei report usati.
+    Returns: riga del riepilogo ('file', 'esito', 'messaggio', 'rif_pa', 'righe', 'righe_con_errori', ...).
+    """
+    riga = {'file': percorso, 'esito': None, 'messaggio': '', 'rif_pa': '', 'righe': 0, 'righe_con_errori': 0,
+            'byte': risultato.get('byte', 0), 'secondi_lettura_validazione': round(risultato.get('secondi', 0.0), 3),
+            'secondi_controlli_bambino': 0.0, 'secondi_inserimento': 0.0, 'id_trasmissione': '', 'report': ''}
+    if 'errore' in risultato:
+        riga.update(esito=risultato['esito'], messaggio=risultato['errore'])
+        return riga
+    voce = risultato['voce']
+    df = voce['df']
+    riga['righe'] = len(df)
+    if df.empty:
+        riga.update(esito=ESITO_FILE_VUOTO, messaggio="Il file CSV non contiene righe di dati.")
+        return riga
+
+    # --- 1. Rif. PA (dalla prima riga, come nella pagina del controllore) ---
+    rif_pa = df['rif_pa'].iloc[0] if 'rif_pa' in df.columns else None
+    rif_pa_ok, messaggio_rif = False, "Colonna 'rif_pa' mancante nel file CSV."
+    if rif_pa is not None:
+        rif_pa_ok, messaggio_rif = validate_rif_pa_format(rif_pa)
+    if rif_pa_ok:
+        rif_pa = rif_pa.strip()
+        riga['rif_pa'] = rif_pa
+        if rif_pa in stato['rif_pa_visti']:
+            rif_pa_ok, messaggio_rif = False, f"Rif. PA '{rif_pa}' già presente in un file precedente di questo lancio."
+            riga['esito'] = ESITO_RIF_PA_ESISTENTE
+        elif check_rif_pa_exists(rif_pa):
+            rif_pa_ok, messaggio_rif = False, f"Esiste già una registrazione nel database per il Rif. PA '{rif_pa}'."
+            riga['esito'] = ESITO_RIF_PA_ESISTENTE
+    else:
+        riga['esito'] = ESITO_RIF_PA_NON_VALIDO
+
+    # --- 2. Controlli per bambino con lo storico FSE attuale (più i file validi del lancio in --dry-run) ---
+    inizio = time.perf_counter()
+    cf_col = VALIDATION_KWARGS_CONTROLLORE['cf_col_clean']
+    cf_file = df[cf_col].unique().tolist()
+    storico = get_fse_totali_per_cf(cf_file)
+    for cf in cf_file:
+        if cf in stato['fse_simulato']:
+            storico[cf] = storico.get(cf, 0.0) + stato['fse_simulato'][cf]
+    esiti, has_err = aggiungi_esiti_bambini(voce['esiti'], df, cf_col, storico)
+    posizioni = posizioni_con_errori(esiti)
+    riga['righe_con_errori'] = len(posizioni)
+    riga['secondi_controlli_bambino'] = round(time.perf_counter() - inizio, 3)
+
+    # --- 3. Report del file ---
+    nome_report = os.path.join(opzioni.report_dir, _nome_report(percorso, stato['report_usati']))
+    _scrivi_csv(formatta_esiti(esiti, posizioni=None if opzioni.report_completo else posizioni), nome_report)
+    riga['report'] = nome_report
+
+    if not rif_pa_ok:
+        riga['messaggio'] = messaggio_rif
+        return riga
+    if has_err:
+        riga.update(esito=ESITO_ERRORI, messaggio=f"{len(posizioni)} righe con errori bloccanti" if len(posizioni)
+                    else "Errori bloccanti sull'intero file (es. CF duplicati)")
+        log_activity(opzioni.utente, "FILE_VALIDATION_FAILED_BATCH", f"File: {os.path.basename(percorso)}, Righe: {len(df)}, Righe con errori: {len(posizioni)}",
+                     rif_pa=rif_pa)
+        return riga
+
+    # --- 4. Inserimento (o sola simulazione) ---
+    df_db, colonne_mancanti = prepara_df_per_db(df)
+    riga['id_trasmissione'] = df_db['id_trasmissione'].iloc[0]
+    if colonne_mancanti:
+        riga['messaggio'] = "Colonne DB mancanti impostate al default: " + ', '.join(c for c, _ in colonne_mancanti) + ". "
+    if opzioni.dry_run:
+        stato['rif_pa_visti'].add(rif_pa)
+        for cf, fse in df_db.groupby('codice_fiscale_bambino')['valore_contributo_fse'].sum().items():
+            stato['fse_simulato'][cf] = stato['fse_simulato'].get(cf, 0.0) + fse
+        riga.update(esito=ESITO_VALIDO, messaggio=riga['messaggio'] + "Valido (dry-run, non caricato).")
+        return riga
+    inizio = time.perf_counter()
+    # Tutto-o-niente: un caricamento parziale registrerebbe il Rif. PA e impedirebbe di ricaricare il file corretto
+    success_db, msg_db = add_multiple_spese(df_db, opzioni.utente, atomic=True)
+    riga['secondi_inserimento'] = round(time.perf_counter() - inizio, 3)
+    if not success_db:
+        riga.update(esito=ESITO_ERRORE_DB, messaggio=riga['messaggio'] + msg_db.replace('\n', ' '))
+        return riga
+    stato['rif_pa_visti'].add(rif_pa)
+    riga.update(esito=ESITO_CARICATO, messaggio=riga['messaggio'] + msg_db)
+    log_activity(opzioni.utente, "DATA_SAVED_BY_BATCH", f"File: {os.path.basename(percorso)}, Righe: {len(df_db)}",
+                 rif_pa=rif_pa, id_trasmissione=riga['id_trasmissione'])
+    return riga
+
+def _stampa_statistiche(righe: list, secondi_totali: float, opzioni: argparse.Namespace, n_file: int):
+    conteggi = {}
+    for r in righe:
+        conteggi[r['esito']] = conteggi.get(r['esito'], 0) + 1
+    n_righe = sum(r['righe'] for r in righe)
+    mib = sum(r['byte'] for r in righe) / (1024 * 1024)
+    print(f"\nFile elaborati: {len(righe)} di {n_file}" + (" (interrotto da --fail-fast)" if len(righe) < n_file else ""))
+    for esito, n in sorted(conteggi.items()):
+        print(f"  {esito:<20} {n}")
+    al_secondo = (lambda n: n / secondi_totali) if secondi_totali > 0 else (lambda n: 0.0)
+    print(f"Righe: {n_righe} ({mib:.1f} MiB) in {secondi_totali:.2f}s -> {al_secondo(n_righe):.0f} righe/s, "
+          f"{al_secondo(len(righe)):.1f} file/s, {al_secondo(mib):.1f} MiB/s")
+    print(f"Tempi: lettura e controlli per riga {sum(r['secondi_lettura_validazione'] for r in righe):.2f}s "
+          f"(somma su {opzioni.workers} processi), controlli per bambino {sum(r['secondi_controlli_bambino'] for r in righe):.2f}s, "
+          f"inserimento {sum(r['secondi_inserimento'] for r in righe):.2f}s")
+
+def main(argv: Union[list, None] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m utils.batch_ingest',
+                                     description="Valida e carica nel DB molti CSV di trasmissione del controllore.")
+    parser.add_argument('percorsi', nargs='+', help="File CSV, cartelle o glob")
+    parser.add_argument('--report-dir', default=BATCH_REPORT_DIR, help=f"Cartella dei report (default: {BATCH_REPORT_DIR})")
+    parser.add_argument('--workers', type=int, default=PARALLEL_MAX_WORKERS, help="Processi per lettura e validazione")
+    parser.add_argument('--utente', default=BATCH_UTENTE, help="Utente registrato nel DB e nel log delle attività")
+    parser.add_argument('--dry-run', action='store_true', help="Valida e scrive i report senza caricare nel DB")
+    parser.add_argument('--fail-fast', action='store_true', help="Si ferma al primo file non valido o non caricato")
+    parser.add_argument('--report-completo', action='store_true', help="Report con tutte le righe, non solo quelle con errori")
+    opzioni = parser.parse_args(argv)
+
+    percorsi = espandi_percorsi(opzioni.percorsi)
+    if not percorsi:
+        print("Nessun file CSV trovato.", file=sys.stderr)
+        return 2
+    opzioni.workers = max(1, min(opzioni.workers, len(percorsi)))
+    os.makedirs(opzioni.report_dir, exist_ok=True)
+    os.makedirs("database", exist_ok=True, mode=0o755)
+    init_db()
+    log_activity(opzioni.utente, "BATCH_INGEST_START", f"File: {len(percorsi)}, dry-run: {opzioni.dry_run}")
+
+    stato = {'rif_pa_visti': set(), 'fse_simulato': {}, 'report_usati': set()}
+    righe = []
+    inizio = time.perf_counter()
+    risultati = _risultati_in_ordine(percorsi, opzioni.workers, date.today())
+    try:
+        for i, (percorso, risultato) in enumerate(risultati, 1):
+            riga = elabora_file(percorso, risultato, stato, opzioni)
+            righe.append(riga)
+            print(f"[{i}/{len(percorsi)}] {percorso}: {riga['esito']}"
+                  + (f" (Rif. PA {riga['rif_pa']}, {riga['righe']} righe, {riga['righe_con_errori']} con errori)" if riga['righe'] else "")
+                  + (f" - {riga['messaggio']}" if riga['esito'] not in ESITI_OK else ""))
+            if opzioni.fail_fast and riga['esito'] not in ESITI_OK:
+                break
+    finally:
+        risultati.close()
+    secondi_totali = time.perf_counter() - inizio
+
+    nome_riepilogo = os.path.join(opzioni.report_dir, generate_timestamp_filename('riepilogo_batch') + '.csv')
+    _scrivi_csv(pd.DataFrame(righe), nome_riepilogo)
+    _stampa_statistiche(righe, secondi_totali, opzioni, len(percorsi))
+    print(f"Riepilogo: {nome_riepilogo}")
+    tutti_ok = len(righe) == len(percorsi) and all(r['esito'] in ESITI_OK for r in righe)
+    log_activity(opzioni.utente, "BATCH_INGEST_END",
+                 f"File: {len(righe)}/{len(percorsi)}, OK: {sum(r['esito'] in ESITI_OK for r in righe)}, {secondi_totali:.1f}s")
+    flush_activity_log()
+    return 0 if tutti_ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+#cartella/utils/batch_ingest.py
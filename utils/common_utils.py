@@ -1,10 +1,19 @@
 #cartella/utils/common_utils.py
 import re
-from datetime import datetime
+import uuid # Per generare id_trasmissione
+from datetime import datetime, date
 import pandas as pd
 import io
 import numpy as np
-# from typing import Union # Rimosso perché non utilizzato
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Union
+
+from utils.validation_rules import fmt_limite, get_regole, regole_per_parametri, REGOLE_PER_RIGA
 
 def sanitize_filename_component(name_part: str) -> str:
     """
@@ -43,9 +52,62 @@ def generate_timestamp_filename(type_prefix: str = "file", rif_pa_sanitized: str
     return "_".join(filter(None, filename_parts)) # Usa filter(None, ...) per gestire parti vuote
 
 # --- Funzioni di Validazione ---
-def validate_codice_fiscale(cf: str) -> tuple[bool, str]:
+# --- Codice Fiscale: struttura, omocodia, data di nascita e carattere di controllo (CIN) ---
+CF_MESI = "ABCDEHLMPRST"               # Lettera del mese di nascita (gennaio..dicembre)
+CF_OMOCODIA = "LMNPQRSTUV"             # Lettere che sostituiscono le cifre 0..9 nei CF omocodici
+CF_POSIZIONI_CIFRE = (6, 7, 9, 10, 12, 13, 14) # Posizioni (da 0) che possono subire omocodia
+CF_POSIZIONI_LETTERE = (0, 1, 2, 3, 4, 5, 11, 15)
+CF_ETA_PLAUSIBILE = (3, 17)            # Età (anni) attese per un centro estivo
+_CF_VALORI_DISPARI = dict(zip("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ",
+                              [1, 0, 5, 7, 9, 13, 15, 17, 19, 21] +
+                              [1, 0, 5, 7, 9, 13, 15, 17, 19, 21, 2, 4, 18, 20, 11, 3, 6, 8, 12, 14, 16, 10, 22, 25, 24, 23]))
+_CF_VALORI_PARI = {**{str(i): i for i in range(10)}, **{chr(ord('A') + i): i for i in range(26)}}
+CF_MESSAGGI_ERRORE = {
+    'struttura': "❌ CF '{cf}' non valido (struttura non conforme: lettere/cifre fuori posizione).",
+    'data': "❌ CF '{cf}' non valido (data di nascita inesistente).",
+    'controllo': "❌ CF '{cf}' non valido (carattere di controllo errato, atteso '{cin}').",
+}
+CF_AVVISO_ETA = " ⚠️ Età {eta} anni: insolita per un centro estivo (attesa {eta_min}-{eta_max})"
+
+def _cf_carattere_controllo(cf15: str) -> str:
+    """CIN: somma dei valori dei caratteri in posizione dispari e pari (tabelle ufficiali) modulo 26."""
+    somma = sum((_CF_VALORI_DISPARI if i % 2 == 0 else _CF_VALORI_PARI)[c] for i, c in enumerate(cf15))
+    return chr(ord('A') + somma % 26)
+
+def _cf_anno_completo(yy: int, anno_riferimento: int) -> int:
+    # Le due cifre dell'anno non indicano il secolo: per dei bambini vale il più recente non futuro
+    return (2000 if yy <= anno_riferimento % 100 else 1900) + yy
+
+def _cf_verifica_completa(cf_upper: str, anno_riferimento: int) -> tuple[str, str, Union[date, None]]:
+    """
+    Verifica un CF che ha già la forma di 16 caratteri [A-Z0-9].
+    Returns: (motivo dell'errore: '' se valido, altrimenti una chiave di CF_MESSAGGI_ERRORE;
+              carattere di controllo atteso; data di nascita o None se non ricavabile)
     """
-    Valida il formato base di un codice fiscale italiano (16 caratteri alfanumerici).
+    cin = _cf_carattere_controllo(cf_upper[:15])
+    if (not all(cf_upper[i].isalpha() for i in CF_POSIZIONI_LETTERE) or cf_upper[8] not in CF_MESI
+            or not all(cf_upper[i].isdigit() or cf_upper[i] in CF_OMOCODIA for i in CF_POSIZIONI_CIFRE)):
+        return 'struttura', cin, None
+    cifre = {i: int(cf_upper[i]) if cf_upper[i].isdigit() else CF_OMOCODIA.index(cf_upper[i]) for i in CF_POSIZIONI_CIFRE}
+    giorno = cifre[9] * 10 + cifre[10]
+    try:
+        nascita = date(_cf_anno_completo(cifre[6] * 10 + cifre[7], anno_riferimento), CF_MESI.index(cf_upper[8]) + 1,
+                       giorno - 40 if giorno > 40 else giorno) # Per le femmine il giorno è aumentato di 40
+    except ValueError:
+        return 'data', cin, None
+    if cf_upper[15] != cin:
+        return 'controllo', cin, nascita
+    return '', cin, nascita
+
+def _eta_in_anni(nascita: date, riferimento: date) -> int:
+    return riferimento.year - nascita.year - ((riferimento.month, riferimento.day) < (nascita.month, nascita.day))
+
+def validate_codice_fiscale(cf: str, age_reference_date: Union[date, None] = None) -> tuple[bool, str]:
+    """
+    Valida un codice fiscale italiano: forma (16 caratteri alfanumerici), classi di caratteri per
+    posizione (con le sostituzioni di omocodia), data di nascita esistente e carattere di controllo.
+    Se age_reference_date è fornita, aggiunge un avviso non bloccante (⚠️) quando l'età a quella
+    data è fuori da CF_ETA_PLAUSIBILE.
     Restituisce: (is_valid, message)
     """
     if not cf or not isinstance(cf, str) or str(cf).strip() == "":
@@ -55,8 +117,60 @@ def validate_codice_fiscale(cf: str) -> tuple[bool, str]:
     
     if not re.fullmatch(r"^[A-Z0-9]{16}$", cf_upper): # Usato re.fullmatch per chiarezza
         return False, f"❌ CF '{cf}' non valido (formato: 16 caratteri alfanumerici)."
-        
-    return True, f"✅ OK ({cf_upper})" # Mostra il CF validato per conferma
+
+    riferimento = age_reference_date or date.today()
+    motivo, cin, nascita = _cf_verifica_completa(cf_upper, riferimento.year)
+    if motivo:
+        return False, CF_MESSAGGI_ERRORE[motivo].format(cf=cf, cin=cin)
+
+    msg = f"✅ OK ({cf_upper})" # Mostra il CF validato per conferma
+    if age_reference_date is not None:
+        eta = _eta_in_anni(nascita, age_reference_date)
+        if not CF_ETA_PLAUSIBILE[0] <= eta <= CF_ETA_PLAUSIBILE[1]:
+            msg += CF_AVVISO_ETA.format(eta=eta, eta_min=CF_ETA_PLAUSIBILE[0], eta_max=CF_ETA_PLAUSIBILE[1])
+    return True, msg
+
+# Tabelle di lookup per byte ASCII: la verifica vettoriale lavora su una matrice n x 16 di uint8
+_CF_LUT_DISPARI = np.zeros(256, dtype=np.int64)
+_CF_LUT_PARI = np.zeros(256, dtype=np.int64)
+for _car, _val in _CF_VALORI_DISPARI.items():
+    _CF_LUT_DISPARI[ord(_car)] = _val
+for _car, _val in _CF_VALORI_PARI.items():
+    _CF_LUT_PARI[ord(_car)] = _val
+_CF_LUT_CIFRA = np.full(256, -1, dtype=np.int64) # Cifra rappresentata (anche da lettera omocodica), -1 se nessuna
+for _i in range(10):
+    _CF_LUT_CIFRA[ord(str(_i))] = _i
+    _CF_LUT_CIFRA[ord(CF_OMOCODIA[_i])] = _i
+_CF_LUT_MESE = np.zeros(256, dtype=np.int64)
+for _i, _car in enumerate(CF_MESI):
+    _CF_LUT_MESE[ord(_car)] = _i + 1
+_CF_LUT_LETTERA = np.zeros(256, dtype=bool)
+_CF_LUT_LETTERA[ord('A'):ord('Z') + 1] = True
+_GIORNI_MESE = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+def _cf_verifica_vettoriale(cf_upper: list, anno_riferimento: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Come _cf_verifica_completa, per una lista di CF che hanno già la forma [A-Z0-9]{16}.
+    Returns: (motivi, CIN attesi, date di nascita datetime64[D] (NaT se non ricavabile))
+    """
+    n = len(cf_upper)
+    m = np.frombuffer("".join(cf_upper).encode('ascii'), dtype=np.uint8).reshape(n, 16)
+    somma = _CF_LUT_DISPARI[m[:, 0:15:2]].sum(axis=1) + _CF_LUT_PARI[m[:, 1:15:2]].sum(axis=1)
+    cin = (somma % 26 + ord('A')).astype(np.uint8)
+    cifre = _CF_LUT_CIFRA[m[:, list(CF_POSIZIONI_CIFRE)]]
+    mese = _CF_LUT_MESE[m[:, 8]]
+    struttura_ok = _CF_LUT_LETTERA[m[:, list(CF_POSIZIONI_LETTERE)]].all(axis=1) & (mese > 0) & (cifre >= 0).all(axis=1)
+    anno = np.where(cifre[:, 0] * 10 + cifre[:, 1] <= anno_riferimento % 100, 2000, 1900) + cifre[:, 0] * 10 + cifre[:, 1]
+    giorno_cf = cifre[:, 2] * 10 + cifre[:, 3]
+    giorno = np.where(giorno_cf > 40, giorno_cf - 40, giorno_cf)
+    bisestile = (anno % 4 == 0) & ((anno % 100 != 0) | (anno % 400 == 0))
+    giorni_mese = _GIORNI_MESE[mese] + ((mese == 2) & bisestile)
+    data_ok = struttura_ok & (giorno >= 1) & (giorno <= giorni_mese)
+    cin_ok = m[:, 15] == cin
+    motivi = np.select([~struttura_ok, ~data_ok, ~cin_ok], ['struttura', 'data', 'controllo'], default='').astype(object)
+    nascita = np.full(n, np.datetime64('NaT'), dtype='datetime64[D]')
+    nascita[data_ok] = ((anno[data_ok] - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (mese[data_ok] - 1)).astype('datetime64[D]') + (giorno[data_ok] - 1)
+    return motivi, cin.view('S1').astype(str).astype(object), nascita
 
 def parse_excel_currency(value) -> float:
     """
@@ -94,12 +208,174 @@ def parse_excel_currency(value) -> float:
         # print(f"Warning: Impossibile convertire '{s_val}' (originale: '{value}') in numero. Usato 0.0.") # Per debug
         return 0.0
 
-def check_controlli_formali(row: pd.Series, col_name_dichiarati: str = 'controlli_formali_dichiarati') -> tuple[bool, str]:
+# --- Parsing vettoriale di colonne intere ---
+# Ogni valore distinto viene convertito una sola volta (pd.factorize), con la funzione scalare
+# (importi) o con i metodi .str di pandas e la funzione scalare per i casi particolari (settimane):
+# il risultato coincide con values.apply(...) cella per cella. Il guadagno è quindi limitato dal
+# rapporto tra celle e valori distinti: sui dati di tests/benchmark.py (importi distinti ~18% delle
+# celle a 20.000 righe, ~11% a 200.000) circa 4-7x, non 10-50x; pd.factorize da solo costa ~1/10
+# dell'apply. Le operazioni vettoriali hanno un costo fisso di qualche ms: sotto PARSING_VETTORIALE_MIN_CELLE
+# celle (es. le poche righe nuove della validazione incrementale) si usa direttamente l'apply.
+PARSING_VETTORIALE_MIN_CELLE = 1000
+
+def _factorize_strings(values: pd.Series) -> Union[tuple[np.ndarray, pd.Series], None]:
+    """(codici, valori distinti) se le celle sono almeno PARSING_VETTORIALE_MIN_CELLE e tutte quelle non mancanti sono stringhe, altrimenti None."""
+    if len(values) < max(PARSING_VETTORIALE_MIN_CELLE, 1) or pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'empty'):
+        return None
+    cells = values.to_numpy(dtype=object)
+    codes, uniques = pd.factorize(cells, use_na_sentinel=True) # Mancanti -> codice -1
+    present = codes >= 0
+    # L'hash table di pandas confronta le stringhe fino al primo NUL ('3' e '3\x00' collidono):
+    # se la ricostruzione non coincide con le celle originali si rinuncia alla fattorizzazione
+    if not (uniques[codes[present]] == cells[present]).all():
+        return None
+    return codes, pd.Series(uniques, dtype=object)
+
+def parse_excel_currency_series(values: pd.Series) -> pd.Series:
+    """
+    Equivalente di values.apply(parse_excel_currency) per un'intera colonna (stesso risultato,
+    cella per cella): simbolo €, separatori IT (1.234,56) e US (1,234.56), celle vuote o non
+    numeriche (0.0). Le colonne con celle non testuali passano da parse_excel_currency.
+    """
+    factorized = _factorize_strings(values)
+    if factorized is None:
+        return values.map(parse_excel_currency)
+    codes, uniques = factorized
+    # Una sola chiamata della funzione scalare per valore distinto. I metodi .str sui valori distinti
+    # (object) sono anch'essi cicli Python, uno per passaggio: con 6-7 passaggi (€, strip, rfind,
+    # replace, to_numeric) costavano più di una chiamata scalare per valore
+    parsed = np.fromiter((parse_excel_currency(u) for u in uniques.tolist()), dtype=np.float64, count=len(uniques))
+    return pd.Series(np.append(parsed, 0.0)[codes], index=values.index, name=values.name)
+
+def parse_numero_settimane(value) -> int:
+    """
+    Converte il numero di settimane in intero (parte intera; 0 se mancante o non numerico).
+    Accetta un solo separatore decimale '.', es. "3" o "3.0"; "3,5" vale 0.
+    """
+    return int(float(str(value).replace(',','.'))) if pd.notna(value) and str(value).strip().replace('.','',1).replace(',','.',1).isdigit() else 0
+
+def parse_numero_settimane_series(values: pd.Series) -> pd.Series:
+    """Equivalente di values.apply(parse_numero_settimane) per un'intera colonna."""
+    factorized = _factorize_strings(values)
+    if factorized is None:
+        return values.map(parse_numero_settimane)
+    codes, uniques = factorized
+    s_val = uniques.str.strip()
+    digits_only = s_val.str.replace('.', '', n=1, regex=False)
+    valid = digits_only.str.isdigit() # Una virgola diventerebbe '.', quindi rende il valore non valido
+    # Cifre decimali e lunghezza contenuta: float() e int64 sono esatti; il resto (es. '²',
+    # numeri enormi) passa dalla funzione scalare, che si comporta come prima (anche sollevando)
+    fast = valid & digits_only.str.isdecimal() & (digits_only.str.len() <= 15)
+    parsed = pd.Series(0, index=uniques.index, dtype=object)
+    parsed[fast] = np.trunc(s_val[fast].to_numpy(dtype=object).astype(np.float64)).astype(np.int64)
+    parsed[valid & ~fast] = uniques[valid & ~fast].map(parse_numero_settimane)
+    if not parsed.map(lambda v: -2**63 <= v < 2**63).all():
+        return values.map(parse_numero_settimane) # Fuori da int64: stesso risultato (object) di apply
+    return pd.Series(np.append(parsed.to_numpy(dtype=np.int64), 0)[codes], index=values.index, name=values.name)
+
+# --- Date di mandato: formato rilevato su un campione, parsing con formati espliciti ---
+DATA_FORMATO_EXCEL = 'excel'
+DATA_MANDATO_FORMATI = { # Formato -> descrizione; in ordine di preferenza a parità di righe riconosciute
+    '%d/%m/%Y': 'GG/MM/AAAA',
+    '%d/%m/%y': 'GG/MM/AA',
+    '%d-%m-%Y': 'GG-MM-AAAA',
+    '%d.%m.%Y': 'GG.MM.AAAA',
+    '%Y-%m-%d': 'ISO AAAA-MM-GG',
+    '%Y-%m-%d %H:%M:%S': 'ISO AAAA-MM-GG hh:mm:ss',
+    DATA_FORMATO_EXCEL: 'numero seriale Excel',
+}
+DATA_CAMPIONE_FORMATO = 100 # Valori distinti usati per rilevare il formato
+DATA_FORMATO_AUTO = 'auto' # parse_data_mandato_series: formato da rilevare sui valori stessi
+_EXCEL_EPOCA = np.datetime64('1899-12-30', 'D')
+_EXCEL_SERIALE_MIN_MAX = (36526, 73050) # 01/01/2000 - 31/12/2099: un numero qualsiasi non è una data
+
+def _parse_date_formato(strings: list, formato: str) -> np.ndarray:
+    """Stringhe (già pulite) -> datetime64[D] con un solo formato esplicito; NaT se non conformi."""
+    if formato != DATA_FORMATO_EXCEL:
+        parsed = pd.to_datetime(pd.Series(strings, dtype=object), format=formato, errors='coerce')
+        return parsed.to_numpy(dtype='datetime64[D]')
+    serials = pd.Series(strings, dtype=object)
+    is_serial = serials.str.fullmatch(r"\d{5}(\.\d+)?").fillna(False).to_numpy(dtype=bool)
+    days = np.floor(pd.to_numeric(serials.where(is_serial), errors='coerce').to_numpy(dtype=np.float64)) # Parte decimale = orario
+    in_range = is_serial & (days >= _EXCEL_SERIALE_MIN_MAX[0]) & (days <= _EXCEL_SERIALE_MIN_MAX[1])
+    result = np.full(len(strings), np.datetime64('NaT'), dtype='datetime64[D]')
+    result[in_range] = _EXCEL_EPOCA + days[in_range].astype(np.int64)
+    return result
+
+def _rileva_formato_data(campione: list) -> Union[str, None]:
+    # Il formato che riconosce più valori del campione (None se nessuno ne riconosce)
+    riconosciuti = {}
+    for fmt in DATA_MANDATO_FORMATI:
+        riconosciuti[fmt] = int((~np.isnat(_parse_date_formato(campione, fmt))).sum())
+        if riconosciuti[fmt] == len(campione): # Nessun formato successivo può prevalere: inutile provarli
+            break
+    migliore = max(riconosciuti, key=riconosciuti.get) # max restituisce il primo a parità
+    return migliore if riconosciuti[migliore] > 0 else None
+
+def _campione_formato_data(values) -> list:
+    # Campione per _rileva_formato_data: primi valori distinti non vuoti (ripuliti) in ordine di apparizione.
+    # values può essere un iteratore: la lettura si ferma appena il campione è completo
+    visti, campione = set(), []
+    for v in values:
+        if isinstance(v, str) and v not in visti:
+            visti.add(v)
+            if v.strip():
+                campione.append(v.strip())
+                if len(campione) == DATA_CAMPIONE_FORMATO:
+                    break
+    return campione
+
+def parse_data_mandato_series(values: pd.Series, formato: Union[str, None] = DATA_FORMATO_AUTO) -> tuple[pd.Series, str]:
+    """
+    Converte una colonna di date testuali (GG/MM/AAAA, GG/MM/AA, GG-MM-AAAA, GG.MM.AAAA, ISO, seriale
+    Excel) in oggetti date. Il formato prevalente è rilevato su un campione di valori distinti (o indicato
+    con formato, es. se rilevato sull'intero incollato con _rileva_formato_data(_campione_formato_data(...)))
+    e applicato in modo esplicito; i valori che non lo rispettano provano gli altri formati e infine il
+    parsing libero con dayfirst=True. Ogni valore distinto è convertito una sola volta (le date di
+    mandato si ripetono molto). I non riconosciuti diventano NaT.
+    Returns:
+        pd.Series: date (datetime.date) o NaT, stesso indice di values (come pd.to_datetime(...).dt.date).
+        str: descrizione del formato rilevato ('' se nessuna data riconosciuta).
+    """
+    factorized = _factorize_strings(values)
+    if factorized is not None:
+        codes, uniques = factorized
+    else: # Poche celle, celle non testuali o hash ambiguo: memo su dizionario dei valori distinti
+        memo = {}
+        codes = np.array([-1 if not isinstance(v, str) else memo.setdefault(v, len(memo)) for v in values.tolist()], dtype=np.int64)
+        uniques = list(memo)
+    cleaned = [u.strip() for u in uniques]
+
+    parsed_uniques = np.full(len(uniques), np.datetime64('NaT'), dtype='datetime64[D]')
+    if formato == DATA_FORMATO_AUTO:
+        formato = _rileva_formato_data(_campione_formato_data(uniques))
+    if formato is not None:
+        for fmt in [formato] + [f for f in DATA_MANDATO_FORMATI if f != formato]:
+            todo = np.flatnonzero(np.isnat(parsed_uniques))
+            if todo.size == 0:
+                break
+            parsed_uniques[todo] = _parse_date_formato([cleaned[i] for i in todo], fmt)
+    # Ultimo tentativo, valore per valore, con il parsing libero dayfirst usato in precedenza per
+    # l'intera colonna (es. '03/05/2024 00:00:00'): i valori restanti sono in genere pochi
+    for i in np.flatnonzero(np.isnat(parsed_uniques)):
+        if cleaned[i]:
+            ts = pd.to_datetime(cleaned[i], errors='coerce', dayfirst=True)
+            if pd.notna(ts):
+                parsed_uniques[i] = np.datetime64(ts.date())
+
+    dates_uniques = np.append(parsed_uniques, np.datetime64('NaT')).astype(object) # datetime.date, None per NaT
+    dates_uniques[dates_uniques == None] = pd.NaT # noqa: E711 (confronto elemento per elemento)
+    return (pd.Series(dates_uniques[codes], index=values.index, name=values.name, dtype=object),
+            DATA_MANDATO_FORMATI.get(formato, ''))
+
+def check_controlli_formali(row: pd.Series, col_name_dichiarati: str = 'controlli_formali_dichiarati',
+                            parametri: Union[dict, None] = None) -> tuple[bool, str]:
     """
     Verifica se il valore dei controlli formali dichiarato/fornito corrisponde al 5%
-    calcolato del valore_contributo_fse.
+    (parametro 'percentuale' della regola 'controlli_formali') calcolato del valore_contributo_fse.
     Restituisce: (is_valid, message)
     """
+    parametri = parametri or get_regole()['parametri']['controlli_formali']
     valore_fse_input = row.get('valore_contributo_fse', 0.0)
     
     try:
@@ -107,7 +383,8 @@ def check_controlli_formali(row: pd.Series, col_name_dichiarati: str = 'controll
     except (ValueError, TypeError):
          valore_fse = 0.0
 
-    calculated_val = round(valore_fse * 0.05, 2)
+    calculated_val = round(valore_fse * parametri['percentuale'], 2)
+    calcolato = f"Calcolato {fmt_limite(parametri['percentuale'] * 100)}%" # Il limite configurato compare nel messaggio
     declared_val_input = row.get(col_name_dichiarati)
     
     declared_val_float = None
@@ -122,11 +399,11 @@ def check_controlli_formali(row: pd.Series, col_name_dichiarati: str = 'controll
 
     if declared_val_float is not None: # Sarà sempre non None se parse_excel_currency restituisce float
         if not np.isclose(declared_val_float, calculated_val):
-            return False, f"❌ Dich./Fornito ({declared_val_input})={declared_val_float:.2f} ≠ Calcolato={calculated_val:.2f}"
+            return False, f"❌ Dich./Fornito ({declared_val_input})={declared_val_float:.2f} ≠ {calcolato}={calculated_val:.2f}"
         else:
-            return True, f"✅ OK (Dich./Fornito ({declared_val_input})={declared_val_float:.2f}, Calcolato={calculated_val:.2f})"
+            return True, f"✅ OK (Dich./Fornito ({declared_val_input})={declared_val_float:.2f}, {calcolato}={calculated_val:.2f})"
     else: # Questo caso non dovrebbe più verificarsi se parse_excel_currency restituisce sempre float
-        return True, f"ℹ️ Calcolato={calculated_val:.2f} (Valore dich./fornito '{declared_val_input}' non numerico o mancante)"
+        return True, f"ℹ️ {calcolato}={calculated_val:.2f} (Valore dich./fornito '{declared_val_input}' non numerico o mancante)"
 
 
 def check_sum_d(row: pd.Series) -> tuple[bool, str]:
@@ -156,16 +433,18 @@ def check_sum_d(row: pd.Series) -> tuple[bool, str]:
         
     return True, f"✅ OK (D={d:.2f})"
 
-def check_contribution_rules(row: pd.Series) -> tuple[bool, str]:
+def check_contribution_rules(row: pd.Series, parametri: Union[dict, None] = None) -> tuple[bool, str]:
     """
-    Verifica le regole sul contributo FSE (A):
+    Verifica le regole sul contributo FSE (A), con i limiti della regola 'contributo_fse':
     - Non negativo.
-    - <= 100€/settimana.
-    - <= 300€ per riga.
+    - <= cap_settimanale (100€)/settimana.
+    - <= cap_riga (300€) per riga.
     - 0 se settimane = 0.
     Tutti i valori sono attesi come numerici (float/int) nella riga.
     Restituisce: (is_valid, message)
     """
+    parametri = parametri or get_regole()['parametri']['contributo_fse']
+    cap_settimanale, cap_riga, tolleranza = parametri['cap_settimanale'], parametri['cap_riga'], parametri['tolleranza']
     try:
         val_A = row.get('valore_contributo_fse', 0.0)
         total_cost_D = row.get('totale_retta', 0.0)
@@ -187,8 +466,8 @@ def check_contribution_rules(row: pd.Series) -> tuple[bool, str]:
     # Usiamo np.isclose per il confronto ">" aggiungendo una piccola tolleranza al limite,
     # o confrontando direttamente se val_A > (limite + epsilon)
     # Qui, un confronto diretto è più chiaro:
-    if val_A > 300.0001: # Leggera tolleranza per l'input
-         return False, f"❌ Contr. FSE (A)={val_A:.2f} supera il limite assoluto di 300€ per singola riga."
+    if val_A > cap_riga + tolleranza: # Leggera tolleranza per l'input
+         return False, f"❌ Contr. FSE (A)={val_A:.2f} supera il limite assoluto di {fmt_limite(cap_riga)}€ per singola riga."
 
     if num_weeks == 0:
         if not np.isclose(val_A, 0.0): # Se 0 settimane, il contributo FSE deve essere 0
@@ -201,8 +480,8 @@ def check_contribution_rules(row: pd.Series) -> tuple[bool, str]:
     # Se total_cost_D è 0 e num_weeks > 0, cost_per_week è 0.
     cost_per_week = round(total_cost_D / num_weeks, 2) if num_weeks > 0 else 0.0
     
-    # Il contributo settimanale FSE non può superare 100€ né il costo settimanale effettivo
-    max_weekly_contrib_allowed = min(cost_per_week, 100.00)
+    # Il contributo settimanale FSE non può superare il cap settimanale né il costo settimanale effettivo
+    max_weekly_contrib_allowed = min(cost_per_week, cap_settimanale)
     
     # Contributo FSE totale atteso per la riga, basato sulle settimane e sul cap settimanale
     expected_total_contrib_for_row = round(max_weekly_contrib_allowed * num_weeks, 2)
@@ -214,9 +493,9 @@ def check_contribution_rules(row: pd.Series) -> tuple[bool, str]:
     # Esempio: 3 settimane, costo retta 120€/sett. -> max_weekly_contrib_allowed = 100€. expected_total_contrib_for_row = 300€.
     #          val_A non può superare 300€.
 
-    if val_A > (expected_total_contrib_for_row + 0.0001): # Tolleranza per confronto
+    if val_A > (expected_total_contrib_for_row + tolleranza): # Tolleranza per confronto
         return False, (f"❌ Contr. FSE (A)={val_A:.2f} supera il massimo calcolabile per N. settimane ({expected_total_contrib_for_row:.2f} = "
-                       f"{num_weeks} sett. * {max_weekly_contrib_allowed:.2f}€/sett. (min tra costo/sett: {cost_per_week:.2f} e cap 100€))")
+                       f"{num_weeks} sett. * {max_weekly_contrib_allowed:.2f}€/sett. (min tra costo/sett: {cost_per_week:.2f} e cap {fmt_limite(cap_settimanale)}€))")
          
     return True, f"✅ OK (Contr.FSE={val_A:.2f} ≤ Max calcolato={expected_total_contrib_for_row:.2f})"
 
@@ -237,14 +516,139 @@ def validate_rif_pa_format(rif_pa_input: str) -> tuple[bool, str]:
     else:
         return False, f"❌ Rif. PA '{rif_pa_trimmed}' non è nel formato richiesto (AAAA-NUMERO/RER). Esempio: 2023-1234/RER."
 
-# NUOVA FUNZIONE PER CENTRALIZZARE LE VALIDAZIONI DETTAGLIATE
-def run_detailed_validations(
+def _esiti_per_bambino(
+    counts: pd.Series, contrib_per_child: Union[pd.Series, None], historical_fse_by_cf: Union[dict, None] = None
+) -> dict:
+    """
+    Esiti compatti dei controlli per bambino a partire dai totali per CF (indice: CF, in ordine di
+    prima apparizione): numero di righe (duplicati nel batch) e contributo FSE (regola 'cap_bambino',
+    con l'eventuale storico).
+    Returns:
+        dict: 'duplicati' (lista di (CF, righe) in ordine di frequenza, come value_counts(): decrescente,
+              a parità ordine di apparizione), 'cap' (caso della regola per bambino, None se il batch non
+              ha la colonna FSE), 'valori' (totali FSE per bambino usati dai messaggi).
+    """
+    counts_sorted = counts.sort_values(ascending=False, kind="stable")
+    duplicated_cfs_series = counts_sorted[counts_sorted > 1]
+    esiti = {'duplicati': list(duplicated_cfs_series.items()), 'cap': None, 'valori': {}}
+    if contrib_per_child is None:
+        return esiti
+    colonne = {'fse_batch': contrib_per_child.to_numpy(dtype=np.float64), 'fse_storico': None}
+    if historical_fse_by_cf is not None:
+        # Cap sull'intero storico: batch corrente + quanto già registrato in altre trasmissioni
+        colonne['fse_storico'] = contrib_per_child.index.to_series().map(historical_fse_by_cf).fillna(0.0).to_numpy(dtype=np.float64)
+    esiti['cap'], calcolati = get_regole()['compilate']['cap_bambino']['valuta'](colonne)
+    esiti['valori'] = {**colonne, **calcolati}
+    return esiti
+
+def _oltre_cap(esiti_bambino: dict, regole: dict) -> np.ndarray:
+    # bool per bambino, True se oltre il cap
+    if esiti_bambino['cap'] is None:
+        return np.zeros(0, dtype=bool)
+    return np.isin(esiti_bambino['cap'], regole['compilate']['cap_bambino']['errori'])
+
+def _messaggi_duplicati(duplicati: list) -> list:
+    return [f"❌ Il Codice Fiscale '{cf_dupl}' è presente {count} volte nel batch." for cf_dupl, count in duplicati]
+
+def _messaggi_cap(esiti_bambino: dict, regole: dict, gruppi: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Esito del cap (colonna di verifica) ed errore bloccante ('' se nessuno) per i bambini indicati
+    (numeri di gruppo; -1 per le righe senza CF, che valgono '✅ OK'). I messaggi sono composti una
+    volta per bambino distinto.
+    """
+    child_msg = np.full(len(gruppi), '✅ OK', dtype=object)
+    child_err = np.full(len(gruppi), '', dtype=object)
+    if esiti_bambino['cap'] is None or len(gruppi) == 0:
+        return child_msg, child_err
+    distinti, posizione = np.unique(gruppi, return_inverse=True)
+    validi = distinti >= 0
+    g = distinti[validi]
+    valori = {k: (None if v is None else v[g]) for k, v in esiti_bambino['valori'].items()}
+    compilata = regole['compilate']['cap_bambino']
+    caso = esiti_bambino['cap'][g]
+    msg_distinti = np.full(len(distinti), '✅ OK', dtype=object)
+    err_distinti = np.full(len(distinti), '', dtype=object)
+    msg_validi = compilata['messaggi'](caso, valori)
+    msg_distinti[validi] = msg_validi
+    err_distinti[validi] = np.where(np.isin(caso, compilata['errori']), msg_validi, '')
+    return msg_distinti[posizione], err_distinti[posizione]
+
+def _child_checks(
+    counts: pd.Series, contrib_per_child: Union[pd.Series, None], historical_fse_by_cf: Union[dict, None] = None
+) -> tuple[list, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Controlli per bambino a partire dai totali per CF (indice: CF, in ordine di prima apparizione),
+    con tutti i messaggi (vedi _esiti_per_bambino per gli esiti compatti).
+    Returns:
+        list: messaggi di errore delle righe "Batch" per i CF duplicati (in ordine di frequenza).
+        np.ndarray: esito del cap per bambino (colonna di verifica), più un ultimo elemento '✅ OK'
+                    per le righe senza CF (indice -1).
+        np.ndarray: errore bloccante del cap per bambino ('' se nessuno), stesso formato.
+        np.ndarray: bool per bambino, True se oltre il cap.
+    """
+    esiti = _esiti_per_bambino(counts, contrib_per_child, historical_fse_by_cf)
+    regole = get_regole()
+    child_msg, child_err = _messaggi_cap(esiti, regole, np.append(np.arange(len(counts)), -1))
+    over_cap = _oltre_cap(esiti, regole) if esiti['cap'] is not None else np.zeros(len(counts), dtype=bool)
+    return _messaggi_duplicati(esiti['duplicati']), child_msg, child_err, over_cap
+
+def _aggregate_per_child(df: pd.DataFrame, cf_col_clean: str) -> tuple[np.ndarray, pd.DataFrame]:
+    """
+    Un solo groupby sui CF non vuoti. Returns: (numero di gruppo per riga, -1 se CF vuoto;
+    DataFrame indicizzato per CF in ordine di prima apparizione con 'righe' ed eventualmente 'fse').
+    """
+    n = len(df)
+    group_of_row = np.full(n, -1, dtype=np.int64)
+    valid_mask = (df[cf_col_clean].str.strip() != '').to_numpy(dtype=bool)
+    has_fse = 'valore_contributo_fse' in df.columns
+    valid_rows = df.loc[valid_mask, [cf_col_clean] + (['valore_contributo_fse'] if has_fse else [])]
+    grouped = valid_rows.groupby(cf_col_clean, sort=False)
+    group_of_row[valid_mask] = grouped.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    per_child = pd.DataFrame({'righe': grouped.size()})
+    if has_fse:
+        per_child['fse'] = grouped['valore_contributo_fse'].sum()
+    return group_of_row, per_child
+
+def _batch_cf_checks(
+    df: pd.DataFrame, cf_col_clean: str, historical_fse_by_cf: Union[dict, None] = None
+) -> tuple[list, np.ndarray, np.ndarray, bool]:
+    """
+    Controlli aggregati per bambino in un solo passaggio: un groupby sui CF non vuoti dà numero
+    di righe e contributo FSE per bambino, riportati poi sulle righe tramite il numero di gruppo
+    (nessuna scansione del DataFrame per ciascun CF).
+    Returns:
+        list: messaggi di errore delle righe "Batch" per i CF duplicati (in ordine di frequenza).
+        np.ndarray: esito del cap 300€ per ogni riga di df (colonna di verifica).
+        np.ndarray: errore bloccante del cap per ogni riga ('' se nessuno).
+        bool: True se ci sono CF duplicati o bambini oltre il cap.
+    """
+    group_of_row, per_child = _aggregate_per_child(df, cf_col_clean)
+    batch_errors, child_msg, child_err, over_cap = _child_checks(per_child['righe'], per_child.get('fse'), historical_fse_by_cf)
+    return batch_errors, child_msg[group_of_row], child_err[group_of_row], bool(batch_errors) or bool(over_cap.any())
+
+def _no_batch_cf_checks(n: int) -> tuple[list, np.ndarray, np.ndarray, bool]:
+    # Stesso formato di _batch_cf_checks con controlli per bambino disattivati
+    return [], np.full(n, '✅ OK', dtype=object), np.full(n, '', dtype=object), False
+
+def _append_cap_errors(row_errors: np.ndarray, cap_err: np.ndarray) -> np.ndarray:
+    # Aggiunge l'errore del cap a 'Errori Bloccanti' ("Nessuno" se la riga non aveva altri errori)
+    has_cap = cap_err != ''
+    no_other = np.isin(row_errors, ["Nessuno", ""])
+    return np.where(has_cap, np.where(no_other, cap_err, row_errors + "; " + cap_err), row_errors)
+
+# Motore di riferimento riga per riga (iterrows + funzioni check_*): run_detailed_validations usa il
+# motore vettoriale quando i tipi lo consentono e ricade su questo negli altri casi. È anche il
+# termine di confronto per la verifica di equivalenza (tests/test_validazioni.py).
+def _run_detailed_validations_rowwise(
     df_to_validate: pd.DataFrame,
     cf_col_clean: str,  # Nome della colonna con CF pulito (es. 'codice_fiscale_bambino_pulito')
     original_date_col: str, # Nome della colonna con la data originale stringa
     parsed_date_col: str,   # Nome della colonna con la data parsata a oggetto date
     declared_formal_controls_col: str, # Nome della colonna con i controlli formali dichiarati/da CSV
-    row_offset_for_messages: int = 1 # 1 per Richiedente (0-indexed +1), 2 per Controllore (CSV header + 0-indexed +1)
+    row_offset_for_messages: int = 1, # 1 per Richiedente (0-indexed +1), 2 per Controllore (CSV header + 0-indexed +1)
+    historical_fse_by_cf: Union[dict, None] = None, # CF -> FSE già registrato nel DB (altre trasmissioni)
+    age_reference_date: Union[date, None] = None, # Se fornita, avviso (⚠️) per età da CF non plausibili a quella data
+    batch_checks: bool = True # False: niente controlli per bambino (duplicati, cap), calcolati dal chiamante
 ) -> tuple[pd.DataFrame, bool]:
     """
     Esegue una serie di validazioni su un DataFrame pre-processato.
@@ -257,30 +661,34 @@ def run_detailed_validations(
         parsed_date_col: Nome della colonna con la data già parsata a oggetto datetime.date.
         declared_formal_controls_col: Nome della colonna per i controlli formali dichiarati.
         row_offset_for_messages: Usato per numerare le righe nei messaggi di errore (es. riga Excel/CSV).
+        historical_fse_by_cf: Se fornito (es. da db.get_fse_totali_per_cf), il cap di 300€ per bambino
+                              è verificato sul totale batch + storico, mostrato nella colonna di verifica.
+        age_reference_date: Se fornita, l'età ricavata dal CF a quella data fuori da CF_ETA_PLAUSIBILE
+                            è segnalata nell'esito CF con un avviso non bloccante.
+        batch_checks: Se False omette i controlli per bambino sull'intero batch (CF duplicati e cap 300€):
+                      serve a chi valida il file a blocchi e li calcola sui totali (stream_validation).
     Returns:
         pd.DataFrame: DataFrame con i risultati della validazione per ogni riga.
         bool: True se ci sono errori bloccanti, False altrimenti.
     """
     validation_results_list = []
     has_blocking_errors_overall = False
+    parametri_regole = get_regole()['parametri'] # Limiti letti una volta per batch
 
-    # --- 1. Controllo CF Duplicati nel Batch ---
-    # Considera solo CF non vuoti per il controllo duplicati
-    valid_cfs_for_dup_check = df_to_validate[df_to_validate[cf_col_clean].str.strip() != ''][cf_col_clean]
-    if not valid_cfs_for_dup_check.empty:
-        cf_counts = valid_cfs_for_dup_check.value_counts()
-        duplicated_cfs_series = cf_counts[cf_counts > 1]
-        if not duplicated_cfs_series.empty:
-            has_blocking_errors_overall = True
-            for cf_dupl, count in duplicated_cfs_series.items():
-                err_msg = f"❌ Il Codice Fiscale '{cf_dupl}' è presente {count} volte nel batch."
-                validation_results_list.append({
-                    'Riga': "Batch", 'Bambino': "N/A", 'Esito CF': "N/A",
-                    'Esito Data Mandato': "N/A", 'Esito D=A+B+C': "N/A",
-                    'Esito Regole Contr.FSE': "N/A", 'Esito Contr.Formali 5%': "N/A",
-                    'Errori Bloccanti': err_msg,
-                    'Verifica Max 300€ FSE per Bambino (batch)': "N/A"
-                })
+    # --- 1. Controlli per Bambino nel Batch (CF duplicati e cap 300€, un solo groupby) ---
+    # Considera solo CF non vuoti; l'esito del cap è riportato sulle righe al passo 3
+    if batch_checks:
+        batch_errors, cap_msg, cap_err, has_blocking_errors_overall = _batch_cf_checks(df_to_validate, cf_col_clean, historical_fse_by_cf)
+    else:
+        batch_errors, cap_msg, cap_err, has_blocking_errors_overall = _no_batch_cf_checks(len(df_to_validate))
+    for err_msg in batch_errors:
+        validation_results_list.append({
+            'Riga': "Batch", 'Bambino': "N/A", 'Esito CF': "N/A",
+            'Esito Data Mandato': "N/A", 'Esito D=A+B+C': "N/A",
+            'Esito Regole Contr.FSE': "N/A", 'Esito Contr.Formali': "N/A",
+            'Errori Bloccanti': err_msg,
+            'Verifica Cap FSE per Bambino (batch)': "N/A"
+        })
 
     # --- 2. Validazioni per Riga ---
     for index, row in df_to_validate.iterrows():
@@ -288,7 +696,7 @@ def run_detailed_validations(
         
         # Validazione CF
         cf_to_val = row.get(cf_col_clean, '')
-        cf_ok, cf_msg = validate_codice_fiscale(cf_to_val)
+        cf_ok, cf_msg = validate_codice_fiscale(cf_to_val, age_reference_date)
         if not cf_ok: row_errors.append(cf_msg)
 
         # Validazione Data (già parsata, qui formattiamo il messaggio)
@@ -305,10 +713,10 @@ def run_detailed_validations(
         sum_ok, sum_msg = check_sum_d(row)
         if not sum_ok: row_errors.append(sum_msg)
         
-        contrib_ok, contrib_msg = check_contribution_rules(row)
+        contrib_ok, contrib_msg = check_contribution_rules(row, parametri_regole['contributo_fse'])
         if not contrib_ok: row_errors.append(contrib_msg)
         
-        cf5_ok, cf5_msg = check_controlli_formali(row, declared_formal_controls_col)
+        cf5_ok, cf5_msg = check_controlli_formali(row, declared_formal_controls_col, parametri_regole['controlli_formali'])
         if not cf5_ok: row_errors.append(cf5_msg)
 
         if any("❌" in e for e in row_errors):
@@ -321,46 +729,23 @@ def run_detailed_validations(
             'Esito Data Mandato': msg_data,
             'Esito D=A+B+C': sum_msg,
             'Esito Regole Contr.FSE': contrib_msg,
-            'Esito Contr.Formali 5%': cf5_msg,
+            'Esito Contr.Formali': cf5_msg,
             'Errori Bloccanti': " ; ".join(row_errors) if row_errors else "Nessuno",
-            'Verifica Max 300€ FSE per Bambino (batch)': '⏳' # Placeholder, verrà aggiornato dopo
+            'Verifica Cap FSE per Bambino (batch)': '⏳' # Placeholder, verrà aggiornato dopo
         })
 
     df_results = pd.DataFrame(validation_results_list)
 
-    # --- 3. Check Aggregato Max 300€ FSE per Bambino (nel batch) ---
-    col_cap_agg = "Verifica Max 300€ FSE per Bambino (batch)"
+    # --- 3. Check Aggregato cap FSE per Bambino (nel batch) ---
+    # Le righe per-riga sono le ultime len(df_to_validate) di df_results (dopo le eventuali righe "Batch"):
+    # gli esiti calcolati al passo 1 sono allineati per posizione, senza cercare le righe per numero
+    col_cap_agg = "Verifica Cap FSE per Bambino (batch)"
     if not df_results.empty and col_cap_agg in df_results.columns: # Assicurati che la colonna esista
         df_results[col_cap_agg] = '✅ OK' # Default
-
-    if cf_col_clean in df_to_validate.columns and 'valore_contributo_fse' in df_to_validate.columns:
-        # Escludi righe con CF vuoto dal calcolo aggregato
-        valid_cf_rows_for_agg = df_to_validate[df_to_validate[cf_col_clean].str.strip() != '']
-        if not valid_cf_rows_for_agg.empty:
-            contrib_per_child = valid_cf_rows_for_agg.groupby(cf_col_clean)['valore_contributo_fse'].sum()
-            children_over_cap = contrib_per_child[contrib_per_child > 300.0001] # Tolleranza
-            
-            if not children_over_cap.empty:
-                has_blocking_errors_overall = True
-                for cf_val, total_contrib in children_over_cap.items():
-                    error_msg_cap = f"❌ Superato cap 300€ ({total_contrib:.2f}€ totali nel batch)"
-                    
-                    # Trova gli indici originali (nel df_to_validate) corrispondenti al CF
-                    original_indices = df_to_validate.index[df_to_validate[cf_col_clean] == cf_val].tolist()
-                    
-                    for orig_idx in original_indices:
-                        # Trova la riga corrispondente nel DataFrame dei risultati (df_results)
-                        # basandosi sull'indice originale + offset
-                        row_mask_results = df_results['Riga'] == (orig_idx + row_offset_for_messages)
-                        
-                        if not df_results.loc[row_mask_results].empty:
-                            df_results.loc[row_mask_results, col_cap_agg] = error_msg_cap
-                            current_errs = df_results.loc[row_mask_results, 'Errori Bloccanti'].iloc[0]
-                            if error_msg_cap not in current_errs:
-                                if current_errs == "Nessuno" or current_errs == "":
-                                    df_results.loc[row_mask_results, 'Errori Bloccanti'] = error_msg_cap
-                                else:
-                                    df_results.loc[row_mask_results, 'Errori Bloccanti'] += "; " + error_msg_cap
+        per_row_results_idx = df_results.index[len(batch_errors):]
+        df_results.loc[per_row_results_idx, col_cap_agg] = cap_msg
+        df_results.loc[per_row_results_idx, 'Errori Bloccanti'] = _append_cap_errors(
+            df_results.loc[per_row_results_idx, 'Errori Bloccanti'].to_numpy(dtype=object), cap_err)
     
     # Assicurarsi che 'Errori Bloccanti' sia 'Nessuno' se vuoto
     if 'Errori Bloccanti' in df_results.columns:
@@ -368,4 +753,566 @@ def run_detailed_validations(
 
     return df_results, has_blocking_errors_overall
 
-# cartella/utils/common_utils.py
\ No newline at end of file
+# --- Motore di validazione vettoriale ---
+# Stesse regole e stessi messaggi delle funzioni check_* riga per riga, valutate su colonne intere
+# (le regole sugli importi sono quelle compilate del registro in utils/validation_rules.py).
+VALIDATION_AMOUNT_COLS = ['valore_contributo_fse', 'altri_contributi', 'quota_retta_destinatario', 'totale_retta']
+
+def _can_vectorize_validations(df: pd.DataFrame, cf_col_clean: str, declared_formal_controls_col: str) -> bool:
+    """
+    Il motore vettoriale è equivalente al riga per riga per i tipi prodotti dal parsing delle
+    pagine (importi float64, settimane intere, CF stringa, indice univoco). Per tipi diversi
+    (es. colonne ancora testuali) le funzioni check_* hanno rami propri: si usa il riga per riga.
+    """
+    if df.empty or not df.index.is_unique or not df.columns.is_unique:
+        return False
+    cf_dtype = df[cf_col_clean].dtype
+    # Colonna testo: object o il dtype stringa con NaN come mancante (default di pandas 3 per dtype=str)
+    if not (cf_dtype == object or (isinstance(cf_dtype, pd.StringDtype) and cf_dtype.na_value is not pd.NA)):
+        return False
+    for col in VALIDATION_AMOUNT_COLS + [declared_formal_controls_col]:
+        if col in df.columns and df[col].dtype != np.float64:
+            return False
+    weeks_dtype = df['numero_settimane_frequenza'].dtype if 'numero_settimane_frequenza' in df.columns else np.dtype('int64')
+    return isinstance(weeks_dtype, np.dtype) and weeks_dtype.kind == 'i'
+
+# --- Esiti compatti ---
+# Il motore vettoriale non compone subito i messaggi: per ogni riga conserva il caso di ogni controllo
+# (intero piccolo), una maschera di bit dei controlli non superati e i valori che compaiono nei
+# messaggi; per bambino i duplicati e il caso del cap con i totali FSE. È qualche decina di byte per
+# riga invece di sette testi. formatta_esiti compone le colonne in italiano (le stesse di
+# run_detailed_validations) solo per le righe richieste: una pagina della tabella, le righe con
+# errori, un export.
+CF_OK, CF_OK_ETA, CF_MANCANTE, CF_FORMATO = 0, 1, 2, 3 # Casi dell'esito CF; poi uno per ogni motivo di CF_MESSAGGI_ERRORE
+CF_CASI_MOTIVO = {motivo: 4 + i for i, motivo in enumerate(CF_MESSAGGI_ERRORE)}
+DATA_OK, DATA_CONVERTITA, DATA_NON_RICONOSCIUTA = 0, 1, 2
+ESITI_BIT = {nome: 1 << i for i, nome in enumerate(['cf', 'data'] + REGOLE_PER_RIGA)} # Bit di 'errori' per controllo
+ESITI_INGRESSI_REGOLE = ('A', 'B', 'C', 'D', 'settimane', 'dichiarato')
+
+def _fmt_data_mandato(v, fmt_cache: dict) -> Union[str, None]:
+    # Data parsata come GG/MM/AAAA (None se non è una data), calcolata una volta per data distinta
+    try:
+        return fmt_cache[v]
+    except (KeyError, TypeError):
+        fmt = v.strftime('%d/%m/%Y') if pd.notna(v) and hasattr(v, 'strftime') else None
+        try:
+            fmt_cache[v] = fmt
+        except TypeError:
+            pass
+        return fmt
+
+def _valida_righe_compatto(
+    df: pd.DataFrame, cf_col_clean: str, original_date_col: str, parsed_date_col: str,
+    declared_formal_controls_col: str, row_offset_for_messages: int, age_reference_date: Union[date, None]
+) -> dict:
+    """Controlli per riga del motore vettoriale: colonne di esiti compatti (vedi valida_esiti_compatti)."""
+    n = len(df)
+    righe = {
+        'riga': np.asarray(df.index + row_offset_for_messages),
+        'bambino': df['bambino_cognome_nome'].to_numpy(dtype=object) if 'bambino_cognome_nome' in df.columns else np.full(n, 'N/A', dtype=object),
+    }
+
+    # CF (validate_codice_fiscale): forma, poi verifica completa su matrice per i CF di forma corretta
+    cf_values = df[cf_col_clean].to_numpy(dtype=object)
+    cf_is_str = np.fromiter((isinstance(v, str) for v in cf_values), dtype=bool, count=n)
+    cf_series = pd.Series(np.where(cf_is_str, cf_values, ""), dtype=object)
+    cf_missing = ~cf_is_str | (cf_series.str.strip() == "").to_numpy()
+    cf_upper = cf_series.str.upper().str.strip().to_numpy(dtype=object)
+    cf_shape_ok = ~cf_missing & pd.Series(cf_upper, dtype=object).str.fullmatch(r"^[A-Z0-9]{16}$").to_numpy(dtype=bool)
+    cf_caso = np.where(cf_missing, CF_MANCANTE, CF_FORMATO).astype(np.int8)
+    cf_cin = np.full(n, '', dtype=object)
+    cf_eta = np.zeros(n, dtype=np.int16)
+    if cf_shape_ok.any():
+        riferimento = age_reference_date or date.today()
+        shape_pos = np.flatnonzero(cf_shape_ok)
+        motivi, cin, nascita = _cf_verifica_vettoriale(cf_upper[shape_pos].tolist(), riferimento.year)
+        cf_caso[shape_pos] = [CF_CASI_MOTIVO.get(motivo, CF_OK) for motivo in motivi.tolist()]
+        cf_cin[shape_pos] = cin
+        ok = motivi == ''
+        if age_reference_date is not None and ok.any():
+            nascita_ok = pd.DatetimeIndex(nascita[ok])
+            rif = age_reference_date
+            eta = (rif.year - nascita_ok.year - ((rif.month * 100 + rif.day) < (nascita_ok.month * 100 + nascita_ok.day))).to_numpy()
+            fuori = (eta < CF_ETA_PLAUSIBILE[0]) | (eta > CF_ETA_PLAUSIBILE[1])
+            cf_caso[shape_pos[ok][fuori]] = CF_OK_ETA
+            cf_eta[shape_pos[ok][fuori]] = eta[fuori]
+    righe.update(cf=cf_values, cf_caso=cf_caso, cf_cin=cf_cin, cf_eta=cf_eta)
+    errori = np.where(cf_caso > CF_OK_ETA, ESITI_BIT['cf'], 0).astype(np.uint16)
+
+    # Data mandato (già parsata): la formattazione è calcolata una volta per data distinta
+    parsed_dates = df[parsed_date_col].to_numpy(dtype=object) if parsed_date_col in df.columns else np.full(n, None, dtype=object)
+    orig_dates = df[original_date_col].to_numpy(dtype=object) if original_date_col in df.columns else np.full(n, '', dtype=object)
+    fmt_cache = {}
+    date_fmts = [_fmt_data_mandato(v, fmt_cache) for v in parsed_dates.tolist()]
+    data_caso = np.array([
+        DATA_NON_RICONOSCIUTA if fmt is None else (DATA_CONVERTITA if str(orig).strip() != fmt else DATA_OK)
+        for orig, fmt in zip(orig_dates.tolist(), date_fmts)
+    ], dtype=np.int8)
+    righe.update(data_originale=orig_dates, data_parsata=parsed_dates, data_caso=data_caso)
+    errori[data_caso == DATA_NON_RICONOSCIUTA] |= ESITI_BIT['data']
+
+    # Regole sugli importi (registro compilato di validation_rules, nell'ordine dei messaggi):
+    # D = A + B + C, contributo FSE, controlli formali. NaN/inf negli importi sono ammessi
+    # (come nel riga per riga): niente warning numpy
+    def amount(col: str) -> np.ndarray:
+        return df[col].to_numpy(dtype=np.float64) if col in df.columns else np.zeros(n)
+    colonne = dict(zip('ABCD', (amount(col) for col in VALIDATION_AMOUNT_COLS)))
+    colonne['settimane'] = df['numero_settimane_frequenza'].to_numpy(dtype=np.int64) if 'numero_settimane_frequenza' in df.columns else np.zeros(n, dtype=np.int64)
+    colonne['dichiarato'] = df[declared_formal_controls_col].to_numpy(dtype=np.float64) if declared_formal_controls_col in df.columns else np.full(n, np.nan)
+    righe.update(colonne)
+    compilate = get_regole()['compilate']
+    with np.errstate(all='ignore'):
+        for nome in REGOLE_PER_RIGA:
+            caso, calcolati = compilate[nome]['valuta'](colonne)
+            righe[nome] = caso
+            righe.update({f"{nome}.{k}": v for k, v in calcolati.items()})
+            errori[np.isin(caso, compilate[nome]['errori'])] |= ESITI_BIT[nome]
+    righe['errori'] = errori
+    return righe
+
+def _messaggi_cf(righe: dict) -> np.ndarray:
+    caso, valori = righe['cf_caso'], righe['cf']
+    msg = np.full(len(caso), "❌ CF mancante.", dtype=object)
+    motivo_per_caso = {c: m for m, c in CF_CASI_MOTIVO.items()}
+    for i, c in enumerate(caso.tolist()):
+        if c == CF_MANCANTE:
+            continue
+        if c == CF_FORMATO:
+            msg[i] = f"❌ CF '{valori[i]}' non valido (formato: 16 caratteri alfanumerici)."
+        elif c in motivo_per_caso:
+            msg[i] = CF_MESSAGGI_ERRORE[motivo_per_caso[c]].format(cf=valori[i], cin=righe['cf_cin'][i])
+        else:
+            msg[i] = f"✅ OK ({valori[i].upper().strip()})"
+            if c == CF_OK_ETA:
+                msg[i] += CF_AVVISO_ETA.format(eta=int(righe['cf_eta'][i]), eta_min=CF_ETA_PLAUSIBILE[0], eta_max=CF_ETA_PLAUSIBILE[1])
+    return msg
+
+def _messaggi_data(righe: dict) -> np.ndarray:
+    fmt_cache = {}
+    msg = []
+    for orig, parsata, caso in zip(righe['data_originale'].tolist(), righe['data_parsata'].tolist(), righe['data_caso'].tolist()):
+        orig = str(orig).strip()
+        if caso == DATA_NON_RICONOSCIUTA:
+            msg.append(f"❌ Data '{orig}' non riconosciuta.")
+        else:
+            fmt = _fmt_data_mandato(parsata, fmt_cache)
+            msg.append(f"✅ Data '{orig}' → {fmt}" if caso == DATA_CONVERTITA else f"✅ OK ({fmt})")
+    return np.array(msg, dtype=object)
+
+def seleziona_righe_esiti(esiti: dict, posizioni: np.ndarray) -> dict:
+    """Esiti compatti delle sole righe in posizioni (i controlli per bambino restano quelli dell'intero batch)."""
+    return {**esiti, 'righe': {k: v[posizioni] for k, v in esiti['righe'].items()}}
+
+def concatena_esiti(lista_esiti: list) -> dict:
+    """Esiti compatti di più blocchi di righe consecutivi (senza controlli per bambino), in ordine."""
+    righe = {k: np.concatenate([e['righe'][k] for e in lista_esiti]) for k in lista_esiti[0]['righe']}
+    return {'righe': righe, 'parametri': lista_esiti[0]['parametri'], 'bambini': None}
+
+def aggiungi_esiti_bambini(
+    esiti: dict, df: pd.DataFrame, cf_col_clean: str, historical_fse_by_cf: Union[dict, None] = None
+) -> tuple[dict, bool]:
+    """
+    Completa esiti calcolati con batch_checks=False (righe di df, nello stesso ordine) con i controlli
+    per bambino sull'intero df (un groupby). esiti non viene modificato (può essere condiviso, es. da una cache).
+    Returns: (esiti con i controlli per bambino, True se ci sono errori bloccanti)
+    """
+    group_of_row, per_child = _aggregate_per_child(df, cf_col_clean)
+    bambini = {'gruppo': group_of_row, **_esiti_per_bambino(per_child['righe'], per_child.get('fse'), historical_fse_by_cf)}
+    completi = {**esiti, 'bambini': bambini}
+    return completi, ha_errori_bloccanti(completi)
+
+def ha_errori_bloccanti(esiti: dict) -> bool:
+    """True se gli esiti compatti hanno errori bloccanti (per riga, CF duplicati o cap per bambino)."""
+    bambini = esiti['bambini']
+    if bambini is not None and (bambini['duplicati'] or _oltre_cap(bambini, regole_per_parametri(esiti['parametri'])).any()):
+        return True
+    return bool(esiti['righe']['errori'].any())
+
+def _cap_per_riga(esiti: dict, regole: dict) -> tuple[np.ndarray, np.ndarray]:
+    # Esito e errore del cap per ogni riga degli esiti, dal numero di gruppo del suo bambino
+    n = len(esiti['righe']['riga'])
+    bambini = esiti['bambini']
+    if bambini is None:
+        return np.full(n, '✅ OK', dtype=object), np.full(n, '', dtype=object)
+    return _messaggi_cap(bambini, regole, esiti['righe'].get('gruppo', bambini['gruppo']))
+
+def posizioni_con_errori(esiti: dict) -> np.ndarray:
+    """Posizioni delle righe con almeno un errore bloccante (controlli per riga o cap per bambino)."""
+    con_errori = esiti['righe']['errori'] != 0
+    bambini = esiti['bambini']
+    if bambini is not None and bambini['cap'] is not None:
+        oltre_cap = np.append(_oltre_cap(bambini, regole_per_parametri(esiti['parametri'])), False) # -1: righe senza CF
+        con_errori |= oltre_cap[bambini['gruppo']]
+    return np.flatnonzero(con_errori)
+
+def formatta_esiti(esiti: dict, posizioni: Union[np.ndarray, list, None] = None, includi_batch: bool = True) -> pd.DataFrame:
+    """
+    Risultati della validazione in italiano (stesse colonne e stessi valori di run_detailed_validations)
+    per le sole righe in posizioni (tutte se None), precedute, se includi_batch, dalle righe "Batch"
+    dei CF duplicati. I messaggi sono composti solo per le righe richieste.
+    """
+    regole = regole_per_parametri(esiti['parametri'])
+    if posizioni is not None:
+        posizioni = np.asarray(posizioni, dtype=np.int64)
+        if esiti['bambini'] is not None:
+            esiti = {**esiti, 'righe': {**esiti['righe'], 'gruppo': esiti['bambini']['gruppo']}}
+        esiti = seleziona_righe_esiti(esiti, posizioni)
+    righe = esiti['righe']
+    n = len(righe['riga'])
+
+    cf_msg, date_msg = _messaggi_cf(righe), _messaggi_data(righe)
+    ingressi = {k: righe[k] for k in ESITI_INGRESSI_REGOLE}
+    rule_msg = {}
+    for nome in REGOLE_PER_RIGA:
+        calcolati = {k.split('.', 1)[1]: v for k, v in righe.items() if k.startswith(nome + '.')}
+        rule_msg[nome] = regole['compilate'][nome]['messaggi'](righe[nome], {**ingressi, **calcolati})
+
+    # Errori bloccanti: messaggi dei controlli non superati, nell'ordine dei controlli
+    row_errors = np.full(n, "", dtype=object)
+    for nome, messages in [('cf', cf_msg), ('data', date_msg)] + list(rule_msg.items()):
+        failed = (righe['errori'] & ESITI_BIT[nome]) != 0
+        prev = row_errors[failed]
+        row_errors[failed] = np.where(prev == "", messages[failed], prev + " ; " + messages[failed])
+    row_errors[row_errors == ""] = "Nessuno"
+    cap_msg, cap_err = _cap_per_riga(esiti, regole)
+    row_errors = _append_cap_errors(row_errors, cap_err)
+
+    batch_errors = _messaggi_duplicati(esiti['bambini']['duplicati']) if includi_batch and esiti['bambini'] is not None else []
+    n_batch = len(batch_errors)
+    return pd.DataFrame({
+        'Riga': ["Batch"] * n_batch + righe['riga'].tolist(),
+        'Bambino': ["N/A"] * n_batch + righe['bambino'].tolist(),
+        'Esito CF': ["N/A"] * n_batch + cf_msg.tolist(),
+        'Esito Data Mandato': ["N/A"] * n_batch + date_msg.tolist(),
+        'Esito D=A+B+C': ["N/A"] * n_batch + rule_msg['somma_retta'].tolist(),
+        'Esito Regole Contr.FSE': ["N/A"] * n_batch + rule_msg['contributo_fse'].tolist(),
+        'Esito Contr.Formali': ["N/A"] * n_batch + rule_msg['controlli_formali'].tolist(),
+        'Errori Bloccanti': batch_errors + row_errors.tolist(),
+        "Verifica Cap FSE per Bambino (batch)": ['✅ OK'] * n_batch + cap_msg.tolist(),
+    })
+
+RIGHE_PER_PAGINA = 500 # Righe dei risultati mostrate (e quindi formattate) per pagina
+
+def pagina_esiti(esiti: dict, solo_errori: bool = False, pagina: int = 1,
+                 righe_per_pagina: int = RIGHE_PER_PAGINA) -> tuple[pd.DataFrame, int, int]:
+    """
+    Una pagina dei risultati da mostrare: tutte le righe o solo quelle con errori bloccanti. Le righe
+    "Batch" dei CF duplicati sono in testa alla prima pagina.
+    Returns: (risultati formattati della pagina, righe selezionate in totale, numero di pagine)
+    """
+    posizioni = posizioni_con_errori(esiti) if solo_errori else np.arange(len(esiti['righe']['riga']))
+    n_pagine = max(1, -(-len(posizioni) // righe_per_pagina))
+    pagina = min(max(1, pagina), n_pagine)
+    inizio = (pagina - 1) * righe_per_pagina
+    df_pagina = formatta_esiti(esiti, posizioni[inizio:inizio + righe_per_pagina], includi_batch=pagina == 1)
+    return df_pagina, len(posizioni), n_pagine
+
+def _run_detailed_validations_vectorized(
+    df_to_validate: pd.DataFrame,
+    cf_col_clean: str,
+    original_date_col: str,
+    parsed_date_col: str,
+    declared_formal_controls_col: str,
+    row_offset_for_messages: int = 1,
+    historical_fse_by_cf: Union[dict, None] = None,
+    age_reference_date: Union[date, None] = None,
+    batch_checks: bool = True
+) -> tuple[pd.DataFrame, bool]:
+    """Versione vettoriale di _run_detailed_validations_rowwise (stessi argomenti, stesso risultato)."""
+    esiti, has_blocking_errors = _valida_esiti_vettoriale(
+        df_to_validate, cf_col_clean, original_date_col, parsed_date_col, declared_formal_controls_col,
+        row_offset_for_messages, historical_fse_by_cf, age_reference_date, batch_checks)
+    return formatta_esiti(esiti), has_blocking_errors
+
+def _valida_esiti_vettoriale(
+    df: pd.DataFrame, cf_col_clean: str, original_date_col: str, parsed_date_col: str,
+    declared_formal_controls_col: str, row_offset_for_messages: int = 1, historical_fse_by_cf: Union[dict, None] = None,
+    age_reference_date: Union[date, None] = None, batch_checks: bool = True
+) -> tuple[dict, bool]:
+    righe = _valida_righe_compatto(df, cf_col_clean, original_date_col, parsed_date_col, declared_formal_controls_col,
+                                   row_offset_for_messages, age_reference_date)
+    esiti = {'righe': righe, 'parametri': get_regole()['parametri'], 'bambini': None}
+    if not batch_checks:
+        return esiti, bool(righe['errori'].any())
+    return aggiungi_esiti_bambini(esiti, df, cf_col_clean, historical_fse_by_cf)
+
+def _results_with_batch_rows(row_results: Union[pd.DataFrame, dict], batch_errors: list) -> pd.DataFrame:
+    """
+    Risultati per riga (colonne dei motori di validazione, DataFrame o dizionario colonna -> lista)
+    con in testa le righe "Batch" dei CF duplicati, costruiti da liste come nei motori: stessi valori
+    e stessi dtype del risultato seriale.
+    """
+    n_batch = len(batch_errors)
+    columns = list(row_results)
+    batch_values = {col: ["N/A"] * n_batch for col in columns}
+    batch_values['Riga'] = ["Batch"] * n_batch
+    batch_values['Errori Bloccanti'] = list(batch_errors)
+    batch_values["Verifica Cap FSE per Bambino (batch)"] = ['✅ OK'] * n_batch
+    as_list = lambda values: values.tolist() if isinstance(values, pd.Series) else list(values)
+    return pd.DataFrame({col: batch_values[col] + as_list(row_results[col]) for col in columns})
+
+# --- Esecuzione parallela su più processi ---
+# Le regole per riga sono indipendenti tra le righe: il DataFrame è diviso in intervalli di righe
+# contigui validati da un pool di processi; i controlli per bambino (duplicati, cap 300€) sono
+# calcolati una volta sull'intero batch nella fase di riduzione. I blocchi sono ricomposti
+# nell'ordine originale, quindi il risultato è identico a quello seriale.
+PARALLEL_SOGLIA_RIGHE = 50000      # Sotto questa soglia l'avvio dei processi costa più di quanto fa risparmiare
+PARALLEL_MIN_RIGHE_BLOCCO = 10000  # Righe minime per blocco
+PARALLEL_MAX_WORKERS = min(16, os.cpu_count() or 1)
+_parallel_executor = None
+_parallel_executor_lock = threading.Lock()
+
+def _get_parallel_executor() -> ProcessPoolExecutor:
+    # Pool unico per processo, creato al primo uso e riusato: l'avvio (import di pandas nei figli) si paga una volta.
+    # 'spawn' perché il processo principale ha thread attivi (Streamlit, scrittore del log): fork non è sicuro.
+    global _parallel_executor
+    with _parallel_executor_lock:
+        if _parallel_executor is None:
+            _parallel_executor = ProcessPoolExecutor(max_workers=PARALLEL_MAX_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            atexit.register(_parallel_executor.shutdown, wait=False, cancel_futures=True)
+        return _parallel_executor
+
+def _reset_parallel_executor():
+    global _parallel_executor
+    with _parallel_executor_lock:
+        if _parallel_executor is not None:
+            _parallel_executor.shutdown(wait=False, cancel_futures=True)
+        _parallel_executor = None
+
+def _validate_shard(df_shard: pd.DataFrame, validation_kwargs: dict) -> tuple[dict, bool]:
+    # Eseguita nei processi del pool: solo regole per riga (esiti compatti), i controlli per bambino sono nella riduzione
+    return _valida_esiti_vettoriale(df_shard, **validation_kwargs, batch_checks=False)
+
+def _valida_esiti_parallelo(
+    df_to_validate: pd.DataFrame,
+    cf_col_clean: str,
+    original_date_col: str,
+    parsed_date_col: str,
+    declared_formal_controls_col: str,
+    row_offset_for_messages: int = 1,
+    historical_fse_by_cf: Union[dict, None] = None,
+    age_reference_date: Union[date, None] = None,
+    batch_checks: bool = True,
+    n_shards: Union[int, None] = None # Default: un blocco per processo, con almeno PARALLEL_MIN_RIGHE_BLOCCO righe
+) -> tuple[dict, bool]:
+    """Versione a più processi di valida_esiti_compatti (stessi argomenti, stesso risultato)."""
+    n = len(df_to_validate)
+    if n_shards is None:
+        n_shards = min(PARALLEL_MAX_WORKERS, n // PARALLEL_MIN_RIGHE_BLOCCO)
+    n_shards = max(1, min(n_shards, n))
+    validation_kwargs = dict(
+        cf_col_clean=cf_col_clean, original_date_col=original_date_col, parsed_date_col=parsed_date_col,
+        declared_formal_controls_col=declared_formal_controls_col, row_offset_for_messages=row_offset_for_messages,
+        age_reference_date=age_reference_date,
+    )
+    shards = [df_to_validate.iloc[bounds[0]:bounds[-1] + 1] for bounds in np.array_split(np.arange(n), n_shards)]
+    try:
+        # map restituisce i risultati nell'ordine dei blocchi, indipendentemente da chi finisce prima
+        shard_results = list(_get_parallel_executor().map(_validate_shard, shards, [validation_kwargs] * n_shards))
+    except BrokenProcessPool:
+        _reset_parallel_executor() # Pool non utilizzabile (es. processo terminato): si ricade sul seriale
+        return _valida_esiti_vettoriale(df_to_validate, **validation_kwargs, historical_fse_by_cf=historical_fse_by_cf,
+                                        batch_checks=batch_checks)
+
+    # --- Riduzione: controlli per bambino sull'intero batch ---
+    esiti = concatena_esiti([esiti_shard for esiti_shard, _ in shard_results])
+    if not batch_checks:
+        return esiti, any(has_err for _, has_err in shard_results)
+    return aggiungi_esiti_bambini(esiti, df_to_validate, cf_col_clean, historical_fse_by_cf)
+
+def _run_detailed_validations_parallel(df_to_validate: pd.DataFrame, *args, **kwargs) -> tuple[pd.DataFrame, bool]:
+    """Versione a più processi di run_detailed_validations (stessi argomenti più n_shards, stesso risultato)."""
+    esiti, has_blocking_errors = _valida_esiti_parallelo(df_to_validate, *args, **kwargs)
+    return formatta_esiti(esiti), has_blocking_errors
+
+def valida_esiti_compatti(
+    df_to_validate: pd.DataFrame,
+    cf_col_clean: str,
+    original_date_col: str,
+    parsed_date_col: str,
+    declared_formal_controls_col: str,
+    row_offset_for_messages: int = 1,
+    historical_fse_by_cf: Union[dict, None] = None,
+    age_reference_date: Union[date, None] = None,
+    batch_checks: bool = True,
+    parallel: bool = False
+) -> tuple[dict, bool]:
+    """
+    Come run_detailed_validations (stessi argomenti), ma restituisce gli esiti compatti invece dei
+    messaggi: da tenere in sessione o in cache e formattare con formatta_esiti / pagina_esiti solo
+    per le righe mostrate o esportate. Richiede i tipi prodotti dal pre-processing delle pagine
+    (vedi _can_vectorize_validations).
+    Returns:
+        dict: esiti compatti: 'righe' (colonne per riga: 'riga', 'bambino', casi dei controlli come
+              'cf_caso', 'data_caso' e uno per regola, valori dei messaggi, maschera 'errori' con i
+              bit di ESITI_BIT), 'parametri' delle regole usate, 'bambini' (None se batch_checks=False).
+        bool: True se ci sono errori bloccanti, False altrimenti.
+    """
+    if len(df_to_validate) and not _can_vectorize_validations(df_to_validate, cf_col_clean, declared_formal_controls_col):
+        raise ValueError("Esiti compatti disponibili solo per dati pre-processati (importi numerici, settimane intere).")
+    args = (df_to_validate, cf_col_clean, original_date_col, parsed_date_col, declared_formal_controls_col,
+            row_offset_for_messages, historical_fse_by_cf, age_reference_date, batch_checks)
+    if parallel and len(df_to_validate) >= PARALLEL_SOGLIA_RIGHE and PARALLEL_MAX_WORKERS > 1:
+        return _valida_esiti_parallelo(*args)
+    return _valida_esiti_vettoriale(*args)
+
+def run_detailed_validations(
+    df_to_validate: pd.DataFrame,
+    cf_col_clean: str,  # Nome della colonna con CF pulito (es. 'codice_fiscale_bambino_pulito')
+    original_date_col: str, # Nome della colonna con la data originale stringa
+    parsed_date_col: str,   # Nome della colonna con la data parsata a oggetto date
+    declared_formal_controls_col: str, # Nome della colonna con i controlli formali dichiarati/da CSV
+    row_offset_for_messages: int = 1, # 1 per Richiedente (0-indexed +1), 2 per Controllore (CSV header + 0-indexed +1)
+    historical_fse_by_cf: Union[dict, None] = None, # CF -> FSE già registrato nel DB (altre trasmissioni)
+    age_reference_date: Union[date, None] = None, # Se fornita, avviso (⚠️) per età da CF non plausibili a quella data
+    batch_checks: bool = True, # False: niente controlli per bambino (duplicati, cap), calcolati dal chiamante
+    parallel: bool = False # True: su più processi se il batch ha almeno PARALLEL_SOGLIA_RIGHE righe
+) -> tuple[pd.DataFrame, bool]:
+    """
+    Esegue una serie di validazioni su un DataFrame pre-processato.
+    Le regole sono valutate per colonne intere (motore vettoriale); per input con tipi non
+    ancora parsati si usa il motore riga per riga. Il risultato è lo stesso in entrambi i casi.
+    Args:
+        df_to_validate: DataFrame con dati già parsati (date, valute, settimane come int).
+                        Deve contenere le colonne per CF, date, importi, settimane, etc.
+                        e la colonna cf_col_clean.
+        cf_col_clean: Il nome della colonna contenente i codici fiscali puliti e pronti per la validazione.
+        original_date_col: Nome della colonna stringa originale per la data.
+        parsed_date_col: Nome della colonna con la data già parsata a oggetto datetime.date.
+        declared_formal_controls_col: Nome della colonna per i controlli formali dichiarati.
+        row_offset_for_messages: Usato per numerare le righe nei messaggi di errore (es. riga Excel/CSV).
+        historical_fse_by_cf: Se fornito (es. da db.get_fse_totali_per_cf), il cap di 300€ per bambino
+                              è verificato sul totale batch + storico, mostrato nella colonna di verifica.
+        age_reference_date: Se fornita, l'età ricavata dal CF a quella data fuori da CF_ETA_PLAUSIBILE
+                            è segnalata nell'esito CF con un avviso non bloccante.
+        batch_checks: Se False omette i controlli per bambino sull'intero batch (CF duplicati e cap 300€):
+                      serve a chi valida il file a blocchi e li calcola sui totali (stream_validation).
+        parallel: Se True e il batch è abbastanza grande, le regole per riga sono valutate su intervalli
+                  di righe da un pool di processi (risultato identico all'esecuzione seriale).
+    Returns:
+        pd.DataFrame: DataFrame con i risultati della validazione per ogni riga.
+        bool: True se ci sono errori bloccanti, False altrimenti.
+    """
+    vectorizable = _can_vectorize_validations(df_to_validate, cf_col_clean, declared_formal_controls_col)
+    if parallel and vectorizable and len(df_to_validate) >= PARALLEL_SOGLIA_RIGHE and PARALLEL_MAX_WORKERS > 1:
+        return _run_detailed_validations_parallel(df_to_validate, cf_col_clean, original_date_col, parsed_date_col,
+                                                  declared_formal_controls_col, row_offset_for_messages,
+                                                  historical_fse_by_cf, age_reference_date, batch_checks)
+    engine = _run_detailed_validations_vectorized if vectorizable else _run_detailed_validations_rowwise
+    return engine(df_to_validate, cf_col_clean, original_date_col, parsed_date_col,
+                  declared_formal_controls_col, row_offset_for_messages, historical_fse_by_cf,
+                  age_reference_date, batch_checks)
+
+# --- Pre-processing del CSV del controllore ---
+CONTROLLORE_CURRENCY_COLS = ['importo_mandato','valore_contributo_fse','altri_contributi','quota_retta_destinatario','totale_retta', 'controlli_formali'] # 'controlli_formali' è quella dal CSV del richiedente
+
+def preprocess_controllore_df(df: pd.DataFrame) -> tuple[pd.DataFrame, str, list]:
+    """
+    Pre-processing e parsing dei tipi del CSV del controllore (letto con dtype=str): CF pulito,
+    data di mandato (l'originale resta in 'data_mandato_originale_csv' per i messaggi), importi
+    e settimane. Aggiunge le colonne sullo stesso DataFrame, senza copiarlo.
+    Returns:
+        pd.DataFrame: lo stesso df, pronto per run_detailed_validations.
+        str: formato delle date di mandato rilevato ('' se nessuna data riconosciuta).
+        list: colonne valuta attese ma assenti nel CSV, impostate a 0.0.
+    """
+    df['cf_pulito'] = df.get('codice_fiscale_bambino', pd.Series(dtype='str')).astype(str).str.upper().str.strip()
+    df['data_mandato_originale_csv'] = df.get('data_mandato', pd.Series(dtype='str'))
+    df['data_mandato'], formato_date = parse_data_mandato_series(df['data_mandato_originale_csv'])
+
+    # Valute (il CSV dovrebbe averle già come numeri, ma parsare per sicurezza se sono stringhe)
+    missing_currency_cols = []
+    for col in CONTROLLORE_CURRENCY_COLS:
+        if col in df.columns:
+            df[col] = parse_excel_currency_series(df[col])
+        else:
+            missing_currency_cols.append(col)
+            df[col] = 0.0 # Default se mancante
+
+    df['numero_settimane_frequenza'] = parse_numero_settimane_series(df.get('numero_settimane_frequenza', pd.Series(dtype='str')))
+    return df, formato_date, missing_currency_cols
+
+# --- Preparazione per il salvataggio nel DB (pagina del controllore e utils/batch_ingest.py) ---
+DB_COLS_ATTESE = [
+    'id_trasmissione', 'rif_pa', 'cup', 'distretto', 'comune_capofila', 
+    'numero_mandato', 'data_mandato', 'comune_titolare_mandato', 'importo_mandato',
+    'comune_centro_estivo', 'centro_estivo', 'genitore_cognome_nome', 
+    'bambino_cognome_nome', 'codice_fiscale_bambino', 'valore_contributo_fse', 
+    'altri_contributi', 'quota_retta_destinatario', 'totale_retta', 
+    'numero_settimane_frequenza', 'controlli_formali' # Calcolati e finali
+]
+# Colonne che potrebbero essere nel CSV e che non vanno direttamente nel DB o sono trasformate
+COLS_DA_RIMUOVERE_PER_DB = ['cf_pulito', 'data_mandato_originale_csv']
+
+
+def prepara_df_per_db(df_loaded: pd.DataFrame, id_trasmissione: Union[str, None] = None) -> tuple[pd.DataFrame, list]:
+    """
+    DataFrame pre-processato e validato -> colonne e valori finali per add_multiple_spese.
+    Args:
+        id_trasmissione: ID da assegnare alle righe (es. lo stesso per tutti i blocchi di un file);
+                         se None ne viene generato uno nuovo.
+    Returns:
+        pd.DataFrame: righe da salvare, con l'id_trasmissione.
+        list: (colonna, valore di default) delle colonne DB assenti nel CSV, impostate al default.
+    """
+    df_to_save_db = df_loaded.copy()
+
+    # Aggiungi ID Trasmissione (univoco per questo batch di caricamento)
+    df_to_save_db['id_trasmissione'] = id_trasmissione or str(uuid.uuid4())
+
+    # Ricalcola 'controlli_formali' come 5% FSE (verità ultima per DB)
+    # Questo sovrascrive la colonna 'controlli_formali' che era nel CSV del richiedente.
+    percentuale_cf = get_regole()['parametri']['controlli_formali']['percentuale'] # Stessa percentuale della validazione
+    df_to_save_db['controlli_formali'] = round(df_to_save_db['valore_contributo_fse'] * percentuale_cf, 2)
+
+    # Rinomina colonna CF pulita e rimuovi quella originale (se diversa)
+    if 'codice_fiscale_bambino' in df_to_save_db.columns and 'cf_pulito' in df_to_save_db.columns:
+         df_to_save_db.drop(columns=['codice_fiscale_bambino'], inplace=True, errors='ignore')
+    if 'cf_pulito' in df_to_save_db.columns:
+        df_to_save_db.rename(columns={'cf_pulito':'codice_fiscale_bambino'}, inplace=True)
+
+    # Assicura che tutte le colonne DB_COLS_ATTESE esistano, impostando None o default se necessario
+    # (anche se il CSV del richiedente dovrebbe averle tutte)
+    colonne_mancanti = []
+    for col_db in DB_COLS_ATTESE:
+        if col_db not in df_to_save_db.columns:
+            # Determina un default sensato in base al tipo atteso o None
+            default_val_db = 0.0 if col_db in ['importo_mandato','valore_contributo_fse','altri_contributi','quota_retta_destinatario','totale_retta', 'controlli_formali'] else \
+                           0 if col_db == 'numero_settimane_frequenza' else \
+                           None # Per stringhe o date (anche se data dovrebbe esserci)
+            colonne_mancanti.append((col_db, default_val_db))
+            df_to_save_db[col_db] = default_val_db
+
+    # Rimuovi colonne temporanee/ausiliarie non necessarie per il DB
+    df_to_save_db = df_to_save_db.drop(columns=COLS_DA_RIMUOVERE_PER_DB, errors='ignore')
+
+    # Seleziona solo le colonne attese dal DB nell'ordine corretto (se importante per DB, anche se ORM non lo richiede)
+    final_cols_for_db = [c for c in DB_COLS_ATTESE if c in df_to_save_db.columns]
+    df_final_for_db = df_to_save_db[final_cols_for_db]
+    return df_final_for_db, colonne_mancanti
+
+RICHIEDENTE_CURRENCY_COLS = ['importo_mandato','valore_contributo_fse','altri_contributi','quota_retta_destinatario','totale_retta','controlli_formali_dichiarati']
+
+def preprocess_richiedente_df(df: pd.DataFrame, formato_date: Union[str, None] = DATA_FORMATO_AUTO) -> tuple[pd.DataFrame, str, list]:
+    """
+    Pre-processing e parsing dei tipi dei dati incollati dal richiedente (colonne già nominate, dtype=str):
+    CF pulito, data di mandato (l'originale resta in 'data_mandato_originale'), importi e settimane.
+    formato_date: formato delle date già rilevato (chiave di DATA_MANDATO_FORMATI o None) o DATA_FORMATO_AUTO.
+    Returns: come preprocess_controllore_df (df modificato sul posto, formato date, colonne valuta mancanti).
+    """
+    df['codice_fiscale_bambino_pulito'] = df['codice_fiscale_bambino'].astype(str).str.upper().str.strip()
+    df['data_mandato_originale'] = df['data_mandato'] # Conserva originale per messaggi
+    df['data_mandato'], formato_date = parse_data_mandato_series(df['data_mandato_originale'], formato_date)
+
+    missing_currency_cols = []
+    for col in RICHIEDENTE_CURRENCY_COLS:
+        if col in df.columns:
+            df[col] = parse_excel_currency_series(df[col])
+        else: # Non dovrebbe accadere se le colonne incollate sono quelle attese
+            missing_currency_cols.append(col)
+            df[col] = 0.0
+
+    df['numero_settimane_frequenza'] = parse_numero_settimane_series(df['numero_settimane_frequenza'])
+    return df, formato_date, missing_currency_cols
+
+# cartella/utils/common_utils.py
@@ -4,23 +4,195 @@ import pandas as pd
 from datetime import datetime, date
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler
+import queue
+import time
+import gzip
+import io
+import shutil
+from functools import lru_cache
 import uuid
-from typing import Union # <<< IMPORTANTE: Aggiungi questo import
+import threading
+import atexit
+from contextlib import contextmanager
+from typing import Union, Iterator, Iterable
 
 # Configurazione del logger
 log_dir = "database"
 os.makedirs(log_dir, exist_ok=True,  mode=0o755)
 log_file_path = os.path.join(log_dir, "activity.log")
 
+# Il logging è asincrono: log_activity accoda il record (QueueHandler, coda limitata) e un unico
+# thread in background lo scrive su file a lotti, con un solo flush per lotto. Così una scrittura
+# lenta su disco non blocca i rerun di Streamlit. Se la coda è piena il record viene scartato e
+# conteggiato (il conteggio viene poi annotato nel log stesso).
+LOG_QUEUE_MAX_SIZE = 10000
+LOG_BATCH_MAX_RECORDS = 500
+LOG_SHUTDOWN_TIMEOUT_S = 5.0
+
+class _BatchFlushRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler il cui flush può essere rimandato alla fine di un lotto di record."""
+    defer_flush = False
+
+    def flush(self):
+        if not self.defer_flush:
+            super().flush()
+
+class _BoundedQueueHandler(QueueHandler):
+    """QueueHandler che non blocca mai il chiamante: a coda piena scarta il record e lo conta."""
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def _default_username_filter(record: logging.LogRecord) -> bool:
+    # I record emessi direttamente con logger.info (non da log_activity) non hanno lo username
+    if not hasattr(record, 'username'):
+        record.username = "System"
+    return True
+
+# Rotazione: alla soglia di LOG_MAX_BYTES il file attivo diventa activity.log.1.gz (compresso con
+# gzip) e i segmenti precedenti scalano di uno; ne vengono conservati LOG_BACKUP_COUNT (retention).
+# Un segmento da 5 MB di testo compresso occupa poche centinaia di KB.
+LOG_MAX_BYTES = 1024 * 1024 * 5
+LOG_BACKUP_COUNT = 200
+
+def _gzip_log_namer(name: str) -> str:
+    return name + ".gz"
+
+def _gzip_log_rotator(source: str, dest: str):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+_LOG_WRITER_STOP = object() # Sentinella di chiusura per il writer in background
+
+# Gli eventi vanno anche nella tabella activity_log dello stesso database: il writer può trovare il lock
+# di scrittura occupato (SQLITE_BUSY), ad esempio durante l'inserimento di una trasmissione. Per non
+# restare fermo fino a busy_timeout (con la coda che intanto si riempie e scarta record) attende il lock
+# al massimo LOG_STORE_BUSY_TIMEOUT_MS; se è ancora occupato tiene il lotto e riprova con backoff
+# esponenziale, continuando a scrivere il file di log. Gli eventi in attesa sono al più
+# LOG_STORE_MAX_PENDING (oltre si scartano i più vecchi, annotandolo nel file).
+LOG_STORE_BUSY_TIMEOUT_MS = 50
+LOG_STORE_RETRY_MIN_S = 0.05
+LOG_STORE_RETRY_MAX_S = 2.0
+LOG_STORE_MAX_PENDING = LOG_QUEUE_MAX_SIZE
+
+def _is_db_busy(e: sqlite3.Error) -> bool:
+    return (getattr(e, 'sqlite_errorcode', None) in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+            or 'database is locked' in str(e) or 'database is busy' in str(e))
+
+def _log_warning(file_handler: logging.Handler, message: str):
+    record = logging.LogRecord(__name__, logging.WARNING, __file__, 0, message, (), None)
+    record.username = "System"
+    file_handler.handle(record)
+
+def _activity_log_writer(queue_handler: "_BoundedQueueHandler"):
+    """Loop del thread writer: preleva i record a lotti, li scrive e fa un solo flush per lotto."""
+    log_queue, file_handler = queue_handler.queue, queue_handler.file_handler
+    dropped_reported = 0
+    pending = []          # Eventi non ancora salvati in activity_log (DB occupato)
+    retry_delay, next_retry = 0.0, 0.0
+    stop = False
+    while not stop:
+        if pending: # Attende nuovi record solo fino al prossimo tentativo
+            try:
+                batch = [log_queue.get(timeout=max(0.0, next_retry - time.monotonic()))]
+            except queue.Empty:
+                batch = []
+        else:
+            batch = [log_queue.get()]
+        while batch and len(batch) < LOG_BATCH_MAX_RECORDS:
+            try:
+                batch.append(log_queue.get_nowait())
+            except queue.Empty:
+                break
+        file_handler.defer_flush = True
+        try:
+            if queue_handler.dropped > dropped_reported:
+                _log_warning(file_handler, f"LOG_QUEUE_OVERFLOW - {queue_handler.dropped - dropped_reported} eventi di log scartati (coda piena).")
+                dropped_reported = queue_handler.dropped
+            for record in batch:
+                if record is _LOG_WRITER_STOP:
+                    stop = True
+                    continue
+                file_handler.handle(record)
+                if hasattr(record, 'action'): # Evento di log_activity: va anche nella tabella strutturata
+                    pending.append(_activity_event_values(record))
+            if len(pending) > LOG_STORE_MAX_PENDING:
+                _log_warning(file_handler, f"ACTIVITY_STORE_OVERFLOW - {len(pending) - LOG_STORE_MAX_PENDING} eventi non salvati nella tabella strutturata (DB occupato).")
+                pending = pending[-LOG_STORE_MAX_PENDING:]
+            if pending and (stop or time.monotonic() >= next_retry):
+                try:
+                    # Alla chiusura un ultimo tentativo con l'attesa normale (busy_timeout della connessione)
+                    _store_activity_events(pending, busy_timeout_ms=None if stop else LOG_STORE_BUSY_TIMEOUT_MS)
+                    pending, retry_delay = [], 0.0
+                except sqlite3.Error as e:
+                    if _is_db_busy(e) and not stop:
+                        retry_delay = min(LOG_STORE_RETRY_MAX_S, max(LOG_STORE_RETRY_MIN_S, retry_delay * 2))
+                        next_retry = time.monotonic() + retry_delay
+                    else:
+                        _log_warning(file_handler, f"ACTIVITY_STORE_ERROR - {len(pending)} eventi non salvati nella tabella strutturata: {e}")
+                        pending = []
+        finally:
+            file_handler.defer_flush = False
+            file_handler.flush()
+            for _ in batch:
+                log_queue.task_done()
+
 logger = logging.getLogger(__name__)
 if not logger.handlers:
     logger.setLevel(logging.INFO)
-    file_handler = RotatingFileHandler(log_file_path, maxBytes=1024*1024*5, backupCount=2, encoding='utf-8')
+    file_handler = _BatchFlushRotatingFileHandler(log_file_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    file_handler.namer = _gzip_log_namer
+    file_handler.rotator = _gzip_log_rotator
     file_handler.setFormatter(logging.Formatter('%(asctime)s - %(username)s - %(levelname)s - %(message)s'))
-    logger.addHandler(file_handler)
+    file_handler.addFilter(_default_username_filter)
+    _queue_handler = _BoundedQueueHandler(queue.Queue(maxsize=LOG_QUEUE_MAX_SIZE))
+    _queue_handler.file_handler = file_handler
+    _queue_handler.writer_thread = threading.Thread(target=_activity_log_writer, args=(_queue_handler,), name="activity-log-writer", daemon=True)
+    _queue_handler.writer_thread.start()
+    logger.addHandler(_queue_handler)
     logger.propagate = False
 
+def _get_activity_queue_handler() -> Union[QueueHandler, None]:
+    # Cercato sul logger (e non in una globale) così funziona anche se il modulo viene ricaricato
+    return next((h for h in logger.handlers if hasattr(h, 'writer_thread')), None)
+
+def flush_activity_log(timeout: float = LOG_SHUTDOWN_TIMEOUT_S) -> bool:
+    """Attende (fino a timeout secondi) che tutti i record accodati siano scritti su file."""
+    queue_handler = _get_activity_queue_handler()
+    if queue_handler is None or not queue_handler.writer_thread.is_alive():
+        return True
+    deadline = time.monotonic() + timeout
+    while queue_handler.queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return queue_handler.queue.unfinished_tasks == 0
+
+def get_activity_log_stats() -> dict:
+    """Stato della pipeline di logging: record in coda e record scartati per coda piena."""
+    queue_handler = _get_activity_queue_handler()
+    if queue_handler is None:
+        return {'in_coda': 0, 'scartati': 0}
+    return {'in_coda': queue_handler.queue.qsize(), 'scartati': queue_handler.dropped}
+
+def shutdown_activity_log(timeout: float = LOG_SHUTDOWN_TIMEOUT_S):
+    """Svuota la coda, ferma il writer e chiude il file di log (registrata con atexit)."""
+    queue_handler = _get_activity_queue_handler()
+    if queue_handler is None or not queue_handler.writer_thread.is_alive():
+        return
+    try:
+        queue_handler.queue.put(_LOG_WRITER_STOP, timeout=timeout)
+    except queue.Full:
+        pass
+    queue_handler.writer_thread.join(timeout)
+    queue_handler.file_handler.close()
+
+atexit.register(shutdown_activity_log)
+
 DATABASE_PATH = os.path.join(log_dir, 'spese.db')
 TABLE_NAME = 'spese_sostenute'
 
@@ -61,189 +233,902 @@ sqlite3.register_converter("DATE", convert_date_from_db)
 sqlite3.register_adapter(datetime, adapt_datetime_iso)
 sqlite3.register_converter("DATETIME", convert_datetime_from_db)
 
+# Parametri di connessione: WAL permette ai lettori (dashboard) di non bloccare lo scrittore
+# (controllore) e viceversa; busy_timeout fa attendere invece di fallire con "database is locked".
+DB_BUSY_TIMEOUT_MS = 10000
+DB_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',     # Sicuro in WAL: fsync solo ai checkpoint
+    'cache_size': -32000,        # ~32 MB di page cache per connessione
+    'mmap_size': 268435456,      # 256 MB di I/O memory-mapped
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+}
+DB_POOL_MAX_IDLE = 8 # Connessioni inattive conservate per percorso DB
+
+_pool_lock = threading.Lock()
+_idle_connections: dict[str, list[sqlite3.Connection]] = {}
+
 def get_db_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DATABASE_PATH, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+    """
+    Apre una nuova connessione configurata (WAL, busy_timeout, pragma di tuning).
+    La connessione è in autocommit: le transazioni si aprono esplicitamente con db_transaction().
+    Per l'uso normale preferire i context manager db_connection()/db_transaction(),
+    che riutilizzano le connessioni del pool invece di aprirne una per chiamata.
+    """
+    conn = sqlite3.connect(
+        DATABASE_PATH, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None, check_same_thread=False
+    )
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS};")
+    for pragma, value in DB_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value};")
     return conn
 
+@contextmanager
+def db_connection() -> Iterator[sqlite3.Connection]:
+    """
+    Presta una connessione del pool (una per thread/sessione alla volta) e la restituisce
+    al termine. Se il chiamante lascia una transazione aperta viene annullata.
+    """
+    db_path = DATABASE_PATH
+    conn = None
+    with _pool_lock:
+        idle = _idle_connections.get(db_path)
+        if idle:
+            conn = idle.pop()
+    if conn is None:
+        conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        with _pool_lock:
+            idle = _idle_connections.setdefault(db_path, [])
+            if len(idle) < DB_POOL_MAX_IDLE:
+                idle.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+
+@contextmanager
+def db_transaction() -> Iterator[sqlite3.Connection]:
+    """
+    Come db_connection(), ma dentro una transazione BEGIN IMMEDIATE: il lock di scrittura
+    è preso subito (attendendo fino a busy_timeout), evitando deadlock lettore→scrittore.
+    Commit all'uscita, rollback in caso di eccezione. Il chiamante può fare rollback
+    anticipato (es. modalità tutto-o-niente): in quel caso all'uscita non si committa nulla.
+    """
+    with db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        if conn.in_transaction:
+            conn.commit()
+
+def close_all_db_connections():
+    """Chiude tutte le connessioni inattive del pool (chiamata anche all'uscita del processo)."""
+    with _pool_lock:
+        connections = [c for idle in _idle_connections.values() for c in idle]
+        _idle_connections.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+atexit.register(close_all_db_connections)
+
 def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(f"""
-    CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        id_trasmissione TEXT NOT NULL,      
-        rif_pa TEXT NOT NULL,                          
-        cup TEXT,                             
-        distretto TEXT,                       
-        comune_capofila TEXT,                 
-        numero_mandato TEXT,
-        data_mandato DATE, 
-        comune_titolare_mandato TEXT,
-        importo_mandato REAL DEFAULT 0.0,
-        comune_centro_estivo TEXT,
-        centro_estivo TEXT,
-        genitore_cognome_nome TEXT,
-        bambino_cognome_nome TEXT NOT NULL,
-        codice_fiscale_bambino TEXT NOT NULL,
-        valore_contributo_fse REAL DEFAULT 0.0,           
-        altri_contributi REAL DEFAULT 0.0,                
-        quota_retta_destinatario REAL DEFAULT 0.0,        
-        totale_retta REAL DEFAULT 0.0,                    
-        numero_settimane_frequenza INTEGER DEFAULT 0,
-        controlli_formali REAL DEFAULT 0.0,          
-        timestamp_caricamento DATETIME NOT NULL, 
-        utente_caricamento TEXT NOT NULL,
-        UNIQUE(id_trasmissione, codice_fiscale_bambino, data_mandato, centro_estivo, valore_contributo_fse) 
-    )
-    """)
-    conn.commit()
-    conn.close()
-    logger.info("Database schema verificato/inizializzato.")
+    with db_transaction() as conn:
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_trasmissione TEXT NOT NULL,      
+            rif_pa TEXT NOT NULL,                          
+            cup TEXT,                             
+            distretto TEXT,                       
+            comune_capofila TEXT,                 
+            numero_mandato TEXT,
+            data_mandato DATE, 
+            comune_titolare_mandato TEXT,
+            importo_mandato REAL DEFAULT 0.0,
+            comune_centro_estivo TEXT,
+            centro_estivo TEXT,
+            genitore_cognome_nome TEXT,
+            bambino_cognome_nome TEXT NOT NULL,
+            codice_fiscale_bambino TEXT NOT NULL,
+            valore_contributo_fse REAL DEFAULT 0.0,           
+            altri_contributi REAL DEFAULT 0.0,                
+            quota_retta_destinatario REAL DEFAULT 0.0,        
+            totale_retta REAL DEFAULT 0.0,                    
+            numero_settimane_frequenza INTEGER DEFAULT 0,
+            controlli_formali REAL DEFAULT 0.0,          
+            timestamp_caricamento DATETIME NOT NULL, 
+            utente_caricamento TEXT NOT NULL,
+            UNIQUE(id_trasmissione, codice_fiscale_bambino, data_mandato, centro_estivo, valore_contributo_fse) 
+        )
+        """)
+    applied = apply_migrations()
+    logger.info(f"Database schema verificato/inizializzato (versione {get_schema_version()}, migrazioni applicate: {applied or 'nessuna'}).")
+
+# --- Tabelle di riepilogo mantenute da trigger ---
+# Per ogni dimensione una tabella riepilogo_<dim> con i totali (A, B, C, D, controlli formali,
+# numero righe, bambini distinti) e una tabella riepilogo_<dim>_bambini con il conteggio righe
+# per bambino, necessaria a mantenere incrementalmente il numero di bambini distinti.
+# I trigger su spese_sostenute le aggiornano a ogni INSERT/DELETE (e UPDATE), quindi la lettura
+# dei totali costa O(gruppi) indipendentemente dal numero di righe. Chiavi NULL salvate come ''.
+RIEPILOGO_DIMENSIONI = {
+    'rif_pa': ['rif_pa'],
+    'comune': ['comune_centro_estivo'],
+    'centro': ['comune_centro_estivo', 'centro_estivo'],
+    'distretto': ['distretto'],
+}
+RIEPILOGO_IMPORTI = ['valore_contributo_fse', 'altri_contributi', 'quota_retta_destinatario', 'totale_retta', 'controlli_formali']
+
+def _riepilogo_statements(dimensione: str, key_cols: list[str]) -> list[str]:
+    """Genera DDL, backfill e trigger per la tabella di riepilogo di una dimensione."""
+    tab, tab_b = f"riepilogo_{dimensione}", f"riepilogo_{dimensione}_bambini"
+    keys = ", ".join(key_cols)
+    tot_cols = [f"tot_{c}" for c in RIEPILOGO_IMPORTI]
+
+    def key_vals(ref: str) -> str:
+        return ", ".join(f"COALESCE({ref}.{k}, '')" for k in key_cols)
+
+    def key_match(ref: str) -> str:
+        return " AND ".join(f"{k} = COALESCE({ref}.{k}, '')" for k in key_cols)
+
+    def body_insert(ref: str) -> str:
+        return f"""
+        INSERT INTO {tab_b} ({keys}, codice_fiscale_bambino, n_righe) VALUES ({key_vals(ref)}, {ref}.codice_fiscale_bambino, 1)
+            ON CONFLICT({keys}, codice_fiscale_bambino) DO UPDATE SET n_righe = n_righe + 1;
+        INSERT INTO {tab} ({keys}, {', '.join(tot_cols)}, n_righe, n_bambini)
+            VALUES ({key_vals(ref)}, {', '.join(f'COALESCE({ref}.{c}, 0)' for c in RIEPILOGO_IMPORTI)}, 1,
+                    (SELECT n_righe = 1 FROM {tab_b} WHERE {key_match(ref)} AND codice_fiscale_bambino = {ref}.codice_fiscale_bambino))
+            ON CONFLICT({keys}) DO UPDATE SET {', '.join(f'{t} = {t} + excluded.{t}' for t in tot_cols)},
+                n_righe = n_righe + 1, n_bambini = n_bambini + excluded.n_bambini;"""
 
-def log_activity(username: Union[str, None], action: str, details: str = ""): # MODIFICATO QUI
+    def body_delete(ref: str) -> str:
+        return f"""
+        UPDATE {tab_b} SET n_righe = n_righe - 1 WHERE {key_match(ref)} AND codice_fiscale_bambino = {ref}.codice_fiscale_bambino;
+        UPDATE {tab} SET {', '.join(f'tot_{c} = tot_{c} - COALESCE({ref}.{c}, 0)' for c in RIEPILOGO_IMPORTI)},
+            n_righe = n_righe - 1,
+            n_bambini = n_bambini - (SELECT n_righe <= 0 FROM {tab_b} WHERE {key_match(ref)} AND codice_fiscale_bambino = {ref}.codice_fiscale_bambino)
+            WHERE {key_match(ref)};
+        DELETE FROM {tab_b} WHERE {key_match(ref)} AND codice_fiscale_bambino = {ref}.codice_fiscale_bambino AND n_righe <= 0;
+        DELETE FROM {tab} WHERE {key_match(ref)} AND n_righe <= 0;"""
+
+    group_by = ", ".join(str(i + 1) for i in range(len(key_cols)))
+    return [
+        f"""CREATE TABLE IF NOT EXISTS {tab} (
+            {', '.join(f'{k} TEXT NOT NULL' for k in key_cols)},
+            {', '.join(f'{t} REAL NOT NULL DEFAULT 0.0' for t in tot_cols)},
+            n_righe INTEGER NOT NULL DEFAULT 0,
+            n_bambini INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY ({keys}))""",
+        f"""CREATE TABLE IF NOT EXISTS {tab_b} (
+            {', '.join(f'{k} TEXT NOT NULL' for k in key_cols)},
+            codice_fiscale_bambino TEXT NOT NULL,
+            n_righe INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY ({keys}, codice_fiscale_bambino))""",
+        f"""INSERT INTO {tab_b} ({keys}, codice_fiscale_bambino, n_righe)
+            SELECT {', '.join(f"COALESCE({k}, '')" for k in key_cols)}, codice_fiscale_bambino, COUNT(*)
+            FROM {TABLE_NAME} GROUP BY {group_by}, {len(key_cols) + 1}""",
+        f"""INSERT INTO {tab} ({keys}, {', '.join(tot_cols)}, n_righe, n_bambini)
+            SELECT {', '.join(f"COALESCE({k}, '')" for k in key_cols)}, {', '.join(f'SUM(COALESCE({c}, 0))' for c in RIEPILOGO_IMPORTI)},
+                   COUNT(*), COUNT(DISTINCT codice_fiscale_bambino)
+            FROM {TABLE_NAME} GROUP BY {group_by}""",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{tab}_ai AFTER INSERT ON {TABLE_NAME} BEGIN {body_insert('NEW')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{tab}_ad AFTER DELETE ON {TABLE_NAME} BEGIN {body_delete('OLD')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{tab}_au AFTER UPDATE ON {TABLE_NAME} BEGIN {body_delete('OLD')} {body_insert('NEW')} END",
+    ]
+
+# Totale progressivo del contributo FSE per bambino (su tutte le trasmissioni salvate), mantenuto
+# da trigger: il controllo del cap per bambino sull'intero storico è una lookup per chiave primaria.
+TOTALI_FSE_BAMBINO_TABLE = 'totali_fse_bambino'
+_TOTALI_FSE_INSERT = f"""
+        INSERT INTO {TOTALI_FSE_BAMBINO_TABLE} (codice_fiscale_bambino, tot_valore_contributo_fse, n_righe)
+            VALUES (NEW.codice_fiscale_bambino, COALESCE(NEW.valore_contributo_fse, 0), 1)
+            ON CONFLICT(codice_fiscale_bambino) DO UPDATE SET
+                tot_valore_contributo_fse = tot_valore_contributo_fse + excluded.tot_valore_contributo_fse, n_righe = n_righe + 1;"""
+_TOTALI_FSE_DELETE = f"""
+        UPDATE {TOTALI_FSE_BAMBINO_TABLE} SET tot_valore_contributo_fse = tot_valore_contributo_fse - COALESCE(OLD.valore_contributo_fse, 0),
+            n_righe = n_righe - 1 WHERE codice_fiscale_bambino = OLD.codice_fiscale_bambino;
+        DELETE FROM {TOTALI_FSE_BAMBINO_TABLE} WHERE codice_fiscale_bambino = OLD.codice_fiscale_bambino AND n_righe <= 0;"""
+
+# --- Migrazioni dello schema ---
+# Ogni migrazione è (versione, descrizione, lista di istruzioni SQL). La versione applicata
+# è salvata in PRAGMA user_version del file DB, quindi i database esistenti vengono aggiornati
+# sul posto all'avvio. Non modificare mai una migrazione già rilasciata: aggiungerne una nuova.
+SCHEMA_MIGRATIONS: list[tuple[int, str, list[str]]] = [
+    (1, "Indice su rif_pa (check_rif_pa_exists, filtri dashboard)",
+     [f"CREATE INDEX IF NOT EXISTS idx_spese_rif_pa ON {TABLE_NAME}(rif_pa)"]),
+    (2, "Indice su codice_fiscale_bambino",
+     [f"CREATE INDEX IF NOT EXISTS idx_spese_cf_bambino ON {TABLE_NAME}(codice_fiscale_bambino)"]),
+    (3, "Indice su comune/centro estivo (filtri dashboard)",
+     [f"CREATE INDEX IF NOT EXISTS idx_spese_comune_centro ON {TABLE_NAME}(comune_centro_estivo, centro_estivo)"]),
+    (4, "Indice su timestamp_caricamento (ordinamento elenco spese)",
+     [f"CREATE INDEX IF NOT EXISTS idx_spese_timestamp ON {TABLE_NAME}(timestamp_caricamento, id)"]),
+    (5, "Tabella metadati con contatore di versione dei dati (invalidazione cache su eliminazioni)",
+     ["CREATE TABLE IF NOT EXISTS db_metadata (chiave TEXT PRIMARY KEY, valore INTEGER NOT NULL DEFAULT 0)",
+      "INSERT OR IGNORE INTO db_metadata (chiave, valore) VALUES ('data_version', 0)"]),
+    (6, "Tabelle di riepilogo per Rif. PA, comune, centro estivo e distretto mantenute da trigger",
+     [stmt for dim, key_cols in RIEPILOGO_DIMENSIONI.items() for stmt in _riepilogo_statements(dim, key_cols)]),
+    (7, "Totale progressivo FSE per codice fiscale (cap 300€ per bambino su tutte le trasmissioni)",
+     [f"""CREATE TABLE IF NOT EXISTS {TOTALI_FSE_BAMBINO_TABLE} (
+            codice_fiscale_bambino TEXT PRIMARY KEY,
+            tot_valore_contributo_fse REAL NOT NULL DEFAULT 0.0,
+            n_righe INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID""",
+      f"""INSERT INTO {TOTALI_FSE_BAMBINO_TABLE} (codice_fiscale_bambino, tot_valore_contributo_fse, n_righe)
+            SELECT codice_fiscale_bambino, SUM(COALESCE(valore_contributo_fse, 0)), COUNT(*) FROM {TABLE_NAME} GROUP BY codice_fiscale_bambino""",
+      f"CREATE TRIGGER IF NOT EXISTS trg_{TOTALI_FSE_BAMBINO_TABLE}_ai AFTER INSERT ON {TABLE_NAME} BEGIN {_TOTALI_FSE_INSERT} END",
+      f"CREATE TRIGGER IF NOT EXISTS trg_{TOTALI_FSE_BAMBINO_TABLE}_ad AFTER DELETE ON {TABLE_NAME} BEGIN {_TOTALI_FSE_DELETE} END",
+      f"CREATE TRIGGER IF NOT EXISTS trg_{TOTALI_FSE_BAMBINO_TABLE}_au AFTER UPDATE ON {TABLE_NAME} BEGIN {_TOTALI_FSE_DELETE} {_TOTALI_FSE_INSERT} END"]),
+    (8, "Archivio strutturato degli eventi di attività con indici per utente, azione e Rif. PA",
+     ["""CREATE TABLE IF NOT EXISTS activity_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TEXT NOT NULL,
+            username TEXT NOT NULL,
+            action TEXT NOT NULL,
+            details TEXT,
+            rif_pa TEXT,
+            id_trasmissione TEXT
+        )""",
+      "CREATE INDEX IF NOT EXISTS idx_activity_ts ON activity_log(ts)",
+      "CREATE INDEX IF NOT EXISTS idx_activity_username_ts ON activity_log(username, ts)",
+      "CREATE INDEX IF NOT EXISTS idx_activity_action_ts ON activity_log(action, ts)",
+      "CREATE INDEX IF NOT EXISTS idx_activity_rif_pa_ts ON activity_log(rif_pa, ts) WHERE rif_pa IS NOT NULL"]),
+]
+
+def get_schema_version() -> int:
+    with db_connection() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def apply_migrations(migrations: list[tuple[int, str, list[str]]] = SCHEMA_MIGRATIONS) -> list[int]:
+    """
+    Applica, in ordine e ciascuna nella propria transazione, le migrazioni con versione
+    maggiore di PRAGMA user_version. Se almeno una è stata applicata esegue ANALYZE,
+    così il query planner dispone delle statistiche sui nuovi indici.
+    Restituisce le versioni applicate.
+    """
+    applied = []
+    for version, description, statements in sorted(migrations, key=lambda m: m[0]):
+        with db_transaction() as conn:
+            # Riletta dentro la transazione (BEGIN IMMEDIATE): un'altra sessione potrebbe averla già applicata
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+        applied.append(version)
+        logger.info(f"Migrazione schema {version} applicata: {description}")
+    if applied:
+        with db_connection() as conn:
+            conn.execute("ANALYZE")
+    return applied
+
+def log_activity(username: Union[str, None], action: str, details: str = "",
+                 rif_pa: Union[str, None] = None, id_trasmissione: Union[str, None] = None):
+    """
+    Registra un evento di attività. Oltre alla riga nel file activity.log, l'evento viene
+    salvato (in background, dal writer del log) nella tabella strutturata activity_log,
+    interrogabile per utente, azione, intervallo temporale e Rif. PA (vedi query_activity_log).
+    """
     effective_username = username if username else "System"
     log_record = logging.LogRecord(
         name=__name__, level=logging.INFO, pathname=__file__, lineno=0, 
         msg=f"{action} - {details}", args=(), exc_info=None, func=''
     )
     log_record.username = effective_username
+    log_record.action = action
+    log_record.details = details
+    log_record.rif_pa = rif_pa
+    log_record.id_trasmissione = id_trasmissione
     logger.handle(log_record)
 
-def add_spesa(data_dict: dict, username: str) -> tuple[bool, str]:
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    id_trasmissione = data_dict.get('id_trasmissione')
-    if not id_trasmissione:
-        log_activity(username, "DB_INSERT_ERROR", "id_trasmissione mancante nel data_dict per add_spesa.")
-        return False, "Errore interno: ID Trasmissione mancante."
+# --- Archivio strutturato degli eventi (tabella activity_log) ---
+ACTIVITY_LOG_TABLE = 'activity_log'
+ACTIVITY_LOG_COLS = ['ts', 'username', 'action', 'details', 'rif_pa', 'id_trasmissione']
+
+def _activity_ts(ts: datetime) -> str:
+    # ts in formato ISO con millisecondi: l'ordinamento lessicografico coincide con quello temporale
+    # (anche i limiti dei filtri vanno nello stesso formato, altrimenti '... 08:00:00' < '... 08:00:00.000')
+    return ts.isoformat(sep=' ', timespec='milliseconds')
 
+def _activity_event_values(record: logging.LogRecord) -> tuple:
+    ts = _activity_ts(datetime.fromtimestamp(record.created))
+    return (ts, record.username, record.action, record.details, record.rif_pa, record.id_trasmissione)
+
+def _store_activity_events(events: list[tuple], busy_timeout_ms: Union[int, None] = None):
+    """
+    Salva un lotto di eventi in un'unica transazione (chiamata dal writer del log).
+    busy_timeout_ms: attesa massima del lock di scrittura (default quella della connessione);
+    se scade solleva sqlite3.OperationalError (SQLITE_BUSY) e il lotto non è salvato.
+    """
+    try:
+        with db_connection() as conn:
+            if busy_timeout_ms is not None:
+                conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)};")
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(f"INSERT INTO {ACTIVITY_LOG_TABLE} ({', '.join(ACTIVITY_LOG_COLS)}) VALUES ({', '.join(['?'] * len(ACTIVITY_LOG_COLS))})", events)
+                conn.commit()
+            finally:
+                if busy_timeout_ms is not None:
+                    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS};")
+    except sqlite3.OperationalError as e:
+        if f"no such table: {ACTIVITY_LOG_TABLE}" in str(e):
+            return # Eventi precedenti alla migrazione (es. prima di init_db): restano solo nel file di log
+        raise
+
+def _build_activity_where(username: Union[str, None] = None, actions: Union[list, None] = None,
+                          ts_from: Union[datetime, date, None] = None, ts_to: Union[datetime, date, None] = None,
+                          rif_pa: Union[str, None] = None) -> tuple[str, list]:
+    """
+    Costruisce la clausola WHERE per activity_log. Le date senza orario valgono come giorno
+    intero (ts_to incluso). I filtri su username e action usano gli indici (username, ts) e (action, ts).
+    """
+    conditions, params = [], []
+    if username:
+        conditions.append("username = ?")
+        params.append(username)
+    if actions:
+        conditions.append(f"action IN ({', '.join(['?'] * len(actions))})")
+        params.extend(actions)
+    if rif_pa:
+        conditions.append("rif_pa = ?")
+        params.append(rif_pa)
+    if ts_from is not None:
+        conditions.append("ts >= ?")
+        params.append(_activity_ts(ts_from) if isinstance(ts_from, datetime) else ts_from.isoformat())
+    if ts_to is not None:
+        if isinstance(ts_to, datetime):
+            conditions.append("ts <= ?")
+            params.append(_activity_ts(ts_to))
+        else:
+            conditions.append("ts < date(?, '+1 day')")
+            params.append(ts_to.isoformat())
+    return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+def query_activity_log(username: Union[str, None] = None, actions: Union[list, None] = None,
+                       ts_from: Union[datetime, date, None] = None, ts_to: Union[datetime, date, None] = None,
+                       rif_pa: Union[str, None] = None, limit: int = 200,
+                       cursor: Union[tuple, None] = None) -> tuple[pd.DataFrame, Union[tuple, None]]:
+    """
+    Eventi di attività filtrati, dal più recente. Paginazione a cursore (keyset) su (ts, id):
+    ogni pagina costa una lettura di indice indipendentemente da quante pagine la precedono.
+    Args:
+        cursor: None per la prima pagina, altrimenti il next_cursor restituito dalla pagina precedente.
+    Returns:
+        (DataFrame della pagina, next_cursor oppure None se non ci sono eventi più vecchi).
+    """
+    where_sql, params = _build_activity_where(username, actions, ts_from, ts_to, rif_pa)
+    if cursor is not None:
+        where_sql += (" AND " if where_sql else " WHERE ") + "(ts, id) < (?, ?)"
+        params = params + list(cursor)
+    sql = (f"SELECT id, {', '.join(ACTIVITY_LOG_COLS)} FROM {ACTIVITY_LOG_TABLE}{where_sql} "
+           f"ORDER BY ts DESC, id DESC LIMIT ?")
+    try:
+        with db_connection() as conn:
+            df = pd.read_sql_query(sql, conn, params=params + [int(limit) + 1])
+    except sqlite3.Error as e:
+        log_activity("System", "DB_ERROR_QUERY_ACTIVITY_LOG", f"Errore interrogazione log attività: {e}")
+        return pd.DataFrame(columns=['id'] + ACTIVITY_LOG_COLS), None
+    next_cursor = None
+    if len(df) > limit: # Una riga in più del necessario indica che esiste una pagina successiva
+        df = df.iloc[:limit]
+        next_cursor = (df['ts'].iloc[-1], int(df['id'].iloc[-1]))
+    return df, next_cursor
+
+def count_activity_log(username: Union[str, None] = None, actions: Union[list, None] = None,
+                       ts_from: Union[datetime, date, None] = None, ts_to: Union[datetime, date, None] = None,
+                       rif_pa: Union[str, None] = None) -> int:
+    where_sql, params = _build_activity_where(username, actions, ts_from, ts_to, rif_pa)
+    with db_connection() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {ACTIVITY_LOG_TABLE}{where_sql}", params).fetchone()[0]
+
+def get_activity_log_filter_options() -> tuple[list, list]:
+    """Utenti e azioni distinti presenti in activity_log (per i filtri della pagina Log)."""
+    with db_connection() as conn:
+        usernames = [r[0] for r in conn.execute(f"SELECT DISTINCT username FROM {ACTIVITY_LOG_TABLE} ORDER BY username")]
+        actions = [r[0] for r in conn.execute(f"SELECT DISTINCT action FROM {ACTIVITY_LOG_TABLE} ORDER BY action")]
+    return usernames, actions
+
+SPESE_INSERT_COLS = [
+    'id_trasmissione', 'rif_pa', 'cup', 'distretto', 'comune_capofila', 
+    'numero_mandato', 'data_mandato', 'comune_titolare_mandato', 'importo_mandato',
+    'comune_centro_estivo', 'centro_estivo', 'genitore_cognome_nome', 'bambino_cognome_nome',
+    'codice_fiscale_bambino', 'valore_contributo_fse', 'altri_contributi',
+    'quota_retta_destinatario', 'totale_retta', 'numero_settimane_frequenza',
+    'controlli_formali', 
+    'timestamp_caricamento', 'utente_caricamento'
+]
+# Colonne del vincolo UNIQUE della tabella (stesso ordine della definizione in init_db)
+SPESE_UNIQUE_COLS = ['id_trasmissione', 'codice_fiscale_bambino', 'data_mandato', 'centro_estivo', 'valore_contributo_fse']
+SPESE_INSERT_SQL = f"INSERT INTO {TABLE_NAME} ({', '.join(SPESE_INSERT_COLS)}) VALUES ({', '.join(['?'] * len(SPESE_INSERT_COLS))})"
+
+def _build_spesa_values(data_dict: dict, username: str, timestamp: datetime) -> tuple:
+    """Costruisce la tupla di valori (ordine SPESE_INSERT_COLS) per l'INSERT di una riga."""
     data_mandato_obj = data_dict.get('data_mandato')
-    if data_mandato_obj is not None and not isinstance(data_mandato_obj, date):
-         log_activity(username, "DB_INSERT_WARNING", f"data_mandato non era oggetto date per {data_dict.get('bambino_cognome_nome')}, tipo: {type(data_mandato_obj)}. Sarà NULL.")
-         data_mandato_obj = None
-
-    query_cols = [
-        'id_trasmissione', 'rif_pa', 'cup', 'distretto', 'comune_capofila', 
-        'numero_mandato', 'data_mandato', 'comune_titolare_mandato', 'importo_mandato',
-        'comune_centro_estivo', 'centro_estivo', 'genitore_cognome_nome', 'bambino_cognome_nome',
-        'codice_fiscale_bambino', 'valore_contributo_fse', 'altri_contributi',
-        'quota_retta_destinatario', 'totale_retta', 'numero_settimane_frequenza',
-        'controlli_formali', 
-        'timestamp_caricamento', 'utente_caricamento'
-    ]
-    
-    values_tuple = (
-        id_trasmissione, data_dict.get('rif_pa'), data_dict.get('cup'), data_dict.get('distretto'), data_dict.get('comune_capofila'),
+    if data_mandato_obj is not None and (not isinstance(data_mandato_obj, date) or pd.isna(data_mandato_obj)): # NaT è istanza di date
+        data_mandato_obj = None
+    return (
+        data_dict.get('id_trasmissione'), data_dict.get('rif_pa'), data_dict.get('cup'), data_dict.get('distretto'), data_dict.get('comune_capofila'),
         data_dict.get('numero_mandato'), data_mandato_obj, data_dict.get('comune_titolare_mandato'), data_dict.get('importo_mandato', 0.0),
         data_dict.get('comune_centro_estivo'), data_dict.get('centro_estivo'), data_dict.get('genitore_cognome_nome'), data_dict.get('bambino_cognome_nome'),
         data_dict.get('codice_fiscale_bambino'), data_dict.get('valore_contributo_fse', 0.0), data_dict.get('altri_contributi', 0.0),
         data_dict.get('quota_retta_destinatario', 0.0), data_dict.get('totale_retta', 0.0), data_dict.get('numero_settimane_frequenza', 0),
         data_dict.get('controlli_formali', 0.0), 
-        datetime.now(), username
+        timestamp, username
     )
 
+def _unique_key(values: tuple) -> Union[tuple, None]:
+    """
+    Chiave del vincolo UNIQUE per una tupla di valori. Restituisce None se una delle
+    colonne è NULL (o NaN, salvato come NULL): in SQLite i NULL non collidono mai.
+    """
+    key = tuple(values[SPESE_INSERT_COLS.index(c)] for c in SPESE_UNIQUE_COLS)
+    if any(v is None or (isinstance(v, float) and v != v) for v in key):
+        return None
+    return key
+
+def _unique_violation_detail() -> str:
+    return "UNIQUE constraint failed: " + ", ".join(f"{TABLE_NAME}.{c}" for c in SPESE_UNIQUE_COLS)
+
+def _insert_spese_bulk(conn: sqlite3.Connection, df_spese: pd.DataFrame, username: str, timestamp: datetime) -> list[tuple[int, str]]:
+    """
+    Inserisce le righe di df_spese sulla connessione data, all'interno della transazione
+    già aperta dal chiamante (nessun commit qui).
+    I duplicati rispetto al vincolo UNIQUE (nel batch o già presenti nel DB per lo stesso
+    id_trasmissione) sono individuati prima dell'INSERT; le righe pulite vanno in un unico
+    executemany. Se l'executemany fallisce comunque (es. NOT NULL), si ripiega su un
+    inserimento riga per riga con SAVEPOINT per isolare le righe colpevoli.
+    Restituisce la lista (posizione_riga, messaggio_errore) delle righe non inserite.
+    """
+    records = df_spese.to_dict('records')
+    rows_values = [_build_spesa_values(r, username, timestamp) for r in records]
+    failures = []
+
+    for pos, (rec, values) in enumerate(zip(records, rows_values)):
+        if pd.isna(rec.get('id_trasmissione')) or not rec.get('id_trasmissione'): # NaN (cella mancante) è truthy
+            failures.append((pos, "Errore interno: ID Trasmissione mancante."))
+        elif rec.get('data_mandato') is not None and values[SPESE_INSERT_COLS.index('data_mandato')] is None:
+            log_activity(username, "DB_INSERT_WARNING", f"data_mandato non era oggetto date per {rec.get('bambino_cognome_nome')}, tipo: {type(rec.get('data_mandato'))}. Sarà NULL.")
+
+    # Pre-check vincolo UNIQUE: chiavi già presenti nel DB per le trasmissioni del batch + duplicati interni
+    failed_pos = {pos for pos, _ in failures}
+    ids_trasmissione = sorted({v[0] for pos, v in enumerate(rows_values) if pos not in failed_pos})
+    seen_keys = set()
+    key_cols_sql = ", ".join(SPESE_UNIQUE_COLS)
+    for id_tr in ids_trasmissione:
+        for row in conn.execute(f"SELECT {key_cols_sql} FROM {TABLE_NAME} WHERE id_trasmissione = ?", (id_tr,)):
+            seen_keys.add(tuple(row))
+
+    clean_positions = []
+    for pos, values in enumerate(rows_values):
+        if pos in failed_pos:
+            continue
+        key = _unique_key(values)
+        if key is not None and key in seen_keys:
+            rec = records[pos]
+            log_activity(username, "DB_ERROR_INTEGRITY", f"TransID {str(values[0])[:8]}..., Errore: {_unique_violation_detail()}. CF={rec.get('codice_fiscale_bambino')}, Data={values[SPESE_INSERT_COLS.index('data_mandato')]}, RifPA={rec.get('rif_pa')}")
+            failures.append((pos, f"Errore: Violazione vincolo di unicità per {rec.get('bambino_cognome_nome', 'N/D')} (possibile duplicato). Dettaglio: {_unique_violation_detail()}"))
+            continue
+        if key is not None:
+            seen_keys.add(key)
+        clean_positions.append(pos)
+
+    if not conn.in_transaction: # Un SAVEPOINT esterno, se rilasciato, farebbe commit: serve una transazione aperta
+        conn.execute("BEGIN IMMEDIATE")
+    conn.execute("SAVEPOINT bulk_insert")
     try:
-        placeholders = ", ".join(["?"] * len(query_cols))
-        cursor.execute(f"INSERT INTO {TABLE_NAME} ({', '.join(query_cols)}) VALUES ({placeholders})", values_tuple)
-        conn.commit()
-        return True, f"Riga per {data_dict.get('bambino_cognome_nome', 'N/D')} aggiunta (ID DB: {cursor.lastrowid})."
-    except sqlite3.IntegrityError as e:
-        conn.rollback()
-        log_activity(username, "DB_ERROR_INTEGRITY", f"TransID {id_trasmissione[:8]}..., Errore: {e}. CF={data_dict.get('codice_fiscale_bambino')}, Data={data_mandato_obj}, RifPA={data_dict.get('rif_pa')}")
-        return False, f"Errore: Violazione vincolo di unicità per {data_dict.get('bambino_cognome_nome', 'N/D')} (possibile duplicato). Dettaglio: {e}"
+        conn.executemany(SPESE_INSERT_SQL, [rows_values[pos] for pos in clean_positions])
+        conn.execute("RELEASE SAVEPOINT bulk_insert")
+    except sqlite3.IntegrityError:
+        conn.execute("ROLLBACK TO SAVEPOINT bulk_insert")
+        conn.execute("RELEASE SAVEPOINT bulk_insert")
+        for pos in clean_positions:
+            conn.execute("SAVEPOINT riga_spesa")
+            try:
+                conn.execute(SPESE_INSERT_SQL, rows_values[pos])
+                conn.execute("RELEASE SAVEPOINT riga_spesa")
+            except sqlite3.IntegrityError as e:
+                conn.execute("ROLLBACK TO SAVEPOINT riga_spesa")
+                conn.execute("RELEASE SAVEPOINT riga_spesa")
+                rec = records[pos]
+                log_activity(username, "DB_ERROR_INTEGRITY", f"TransID {str(rows_values[pos][0])[:8]}..., Errore: {e}. CF={rec.get('codice_fiscale_bambino')}, RifPA={rec.get('rif_pa')}")
+                if "UNIQUE" in str(e):
+                    failures.append((pos, f"Errore: Violazione vincolo di unicità per {rec.get('bambino_cognome_nome', 'N/D')} (possibile duplicato). Dettaglio: {e}"))
+                else:
+                    failures.append((pos, f"Errore: Violazione vincolo di integrità per {rec.get('bambino_cognome_nome', 'N/D')}. Dettaglio: {e}"))
+
+    return sorted(failures)
+
+def add_multiple_spese(df_spese: pd.DataFrame, username: str, atomic: bool = False) -> tuple[bool, str]:
+    """
+    Inserisce un'intera trasmissione in un'unica transazione (executemany).
+    Args:
+        atomic: se True (tutto-o-niente) basta una riga non valida per annullare l'intero
+                inserimento; se False (default, comportamento storico) vengono salvate
+                le righe valide e riportate quelle scartate.
+    """
+    return add_spese_a_blocchi([df_spese], username, atomic=atomic)
+
+def add_spese_a_blocchi(blocchi: Iterable[pd.DataFrame], username: str, atomic: bool = False) -> tuple[bool, str]:
+    """
+    Come add_multiple_spese, per una trasmissione divisa in blocchi (es. un CSV grande letto a
+    blocchi): ogni blocco è inserito appena prodotto, tutti nella stessa transazione, quindi in
+    memoria c'è un blocco alla volta. I blocchi hanno lo stesso id_trasmissione; gli indici dei
+    DataFrame (continui tra i blocchi) danno il numero di riga nei messaggi di errore.
+    """
+    id_trasmissione_batch, rif_pa_batch = 'N/A_BATCH', None
+    errors_detail, n_righe = [], 0
+    try:
+        with db_transaction() as conn:
+            timestamp = datetime.now()
+            for df_spese in blocchi:
+                if df_spese.empty:
+                    continue
+                if n_righe == 0:
+                    id_trasmissione_batch = df_spese['id_trasmissione'].iloc[0] if 'id_trasmissione' in df_spese.columns else 'N/A_BATCH'
+                    rif_pa_batch = df_spese['rif_pa'].iloc[0] if 'rif_pa' in df_spese.columns else None
+                n_righe += len(df_spese)
+                failures = _insert_spese_bulk(conn, df_spese, username, timestamp)
+                errors_detail += [f"Riga Dati {df_spese.index[pos] + 1}: {msg}" for pos, msg in failures]
+            if errors_detail and atomic:
+                conn.rollback()
     except sqlite3.Error as e:
-        conn.rollback()
-        log_activity(username, "DB_ERROR_INSERT", f"TransID {id_trasmissione[:8]}..., Errore SQL: {e}")
+        log_activity(username, "DB_ERROR_INSERT", f"TransID {str(id_trasmissione_batch)[:8]}..., Errore SQL: {e}", rif_pa=rif_pa_batch, id_trasmissione=id_trasmissione_batch)
         return False, f"Errore Database durante l'inserimento: {e}"
-    finally:
-        if conn:
-            conn.close()
 
-def add_multiple_spese(df_spese: pd.DataFrame, username: str) -> tuple[bool, str]:
-    if df_spese.empty:
+    if n_righe == 0:
         return True, "Nessuna riga da importare."
 
-    id_trasmissione_batch = df_spese['id_trasmissione'].iloc[0] if 'id_trasmissione' in df_spese.columns and not df_spese.empty else 'N/A_BATCH'
-    
-    successful_inserts = 0
-    failed_inserts = 0
-    errors_detail = []
-
-    for index, row_data in df_spese.iterrows():
-        data_dict = row_data.to_dict()
-        success, msg = add_spesa(data_dict, username)
-        if success:
-            successful_inserts += 1
-        else:
-            failed_inserts += 1
-            errors_detail.append(f"Riga Dati {index + 1}: {msg}") 
+    failed_inserts = len(errors_detail)
+    successful_inserts = 0 if (errors_detail and atomic) else n_righe - failed_inserts
 
     if failed_inserts > 0:
         details_str = '; '.join(errors_detail)
-        log_activity(username, "DATA_BULK_INSERT_PARTIAL", f"TransID {id_trasmissione_batch[:8]}..., Aggiunte {successful_inserts}, Fallite: {failed_inserts}. Errori: {details_str[:500]}")
-        error_summary = f"ID Trasmissione: {id_trasmissione_batch[:8]}...\nParzialmente completato: Aggiunte {successful_inserts} righe. {failed_inserts} righe non importate."
-        if errors_detail:
-            error_summary += "\nErrori dettaglio:\n- " + "\n- ".join(errors_detail)
+        if atomic:
+            log_activity(username, "DATA_BULK_INSERT_ABORTED", f"TransID {id_trasmissione_batch[:8]}..., Nessuna riga importata, Fallite: {failed_inserts}. Errori: {details_str[:500]}", rif_pa=rif_pa_batch, id_trasmissione=id_trasmissione_batch)
+            error_summary = f"ID Trasmissione: {id_trasmissione_batch[:8]}...\nNessuna riga importata (modalità tutto-o-niente): {failed_inserts} righe non valide."
+        else:
+            log_activity(username, "DATA_BULK_INSERT_PARTIAL", f"TransID {id_trasmissione_batch[:8]}..., Aggiunte {successful_inserts}, Fallite: {failed_inserts}. Errori: {details_str[:500]}", rif_pa=rif_pa_batch, id_trasmissione=id_trasmissione_batch)
+            error_summary = f"ID Trasmissione: {id_trasmissione_batch[:8]}...\nParzialmente completato: Aggiunte {successful_inserts} righe. {failed_inserts} righe non importate."
+        error_summary += "\nErrori dettaglio:\n- " + "\n- ".join(errors_detail)
         return False, error_summary
     
-    log_activity(username, "DATA_BULK_INSERTED", f"TransID {id_trasmissione_batch[:8]}..., Aggiunte {successful_inserts} righe.")
+    log_activity(username, "DATA_BULK_INSERTED", f"TransID {id_trasmissione_batch[:8]}..., Aggiunte {successful_inserts} righe.", rif_pa=rif_pa_batch, id_trasmissione=id_trasmissione_batch)
     return True, f"Aggiunte {successful_inserts} righe con successo (ID Trasmissione: {id_trasmissione_batch[:8]}...)."
 
 def check_rif_pa_exists(rif_pa: str) -> bool:
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute(f"SELECT 1 FROM {TABLE_NAME} WHERE rif_pa = ? LIMIT 1", (rif_pa,))
-        exists = cursor.fetchone()
+    with db_connection() as conn:
+        exists = conn.execute(f"SELECT 1 FROM {TABLE_NAME} WHERE rif_pa = ? LIMIT 1", (rif_pa,)).fetchone()
         return exists is not None
-    finally:
-        if conn:
-            conn.close()
 
-def delete_spese_by_ids(list_of_ids: list[int], username: str) -> tuple[int, str]:
-    if not list_of_ids:
-        return 0, "Nessun ID fornito per l'eliminazione."
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def _bump_data_version(conn: sqlite3.Connection):
+    """Incrementa il contatore di versione dei dati (nella transazione del chiamante)."""
+    conn.execute("UPDATE db_metadata SET valore = valore + 1 WHERE chiave = 'data_version'")
+
+def get_data_version() -> int:
+    """
+    Versione dei dati: cambia solo quando vengono eliminate righe. Gli inserimenti non la
+    modificano perché sono rilevabili tramite id crescente (AUTOINCREMENT non riusa gli id).
+    """
+    with db_connection() as conn:
+        row = conn.execute("SELECT valore FROM db_metadata WHERE chiave = 'data_version'").fetchone()
+        return row[0] if row else 0
+
+def get_spese_data_key() -> tuple[int, int]:
+    """
+    (versione dei dati, id massimo delle spese): cambia a ogni eliminazione e a ogni inserimento.
+    Chiave di cache per ciò che si legge dalla tabella delle spese (es. opzioni dei filtri).
+    """
+    with db_connection() as conn:
+        max_id = conn.execute(f"SELECT MAX(id) FROM {TABLE_NAME}").fetchone()[0]
+    return get_data_version(), max_id or 0
+
+# Numero massimo di righe (e di parametri "?") per singola istruzione DELETE / lookup IN (...):
+# resta ben sotto il limite di variabili di SQLite e tiene brevi le singole istruzioni.
+SQL_BATCH_SIZE = 500
+
+def _chunks(values: list, size: int) -> Iterator[list]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def delete_spese_by_filters(
+    username: str, rif_pa: Union[list, None] = None, comuni: Union[list, None] = None, centri: Union[list, None] = None,
+    batch_size: int = SQL_BATCH_SIZE, progress_callback=None
+) -> tuple[int, str]:
+    """
+    Elimina le righe che soddisfano gli stessi filtri della dashboard (vedi query_spese),
+    interamente lato server: nessuna lista di id transita dall'applicazione.
+    L'eliminazione avviene a blocchi di batch_size righe dentro un'unica transazione
+    (tutto-o-niente). progress_callback(eliminate, totale), se fornita, è chiamata dopo ogni blocco.
+    Restituisce (numero esatto di righe eliminate, messaggio).
+    """
+    where_sql, params = _build_spese_where(rif_pa, comuni, centri)
+    filtri_descr = f"RifPA={rif_pa or []}, ComuneCE={comuni or []}, Centro={centri or []}"
     try:
-        placeholders = ', '.join(['?'] * len(list_of_ids))
-        query = f"DELETE FROM {TABLE_NAME} WHERE id IN ({placeholders})"
-        cursor.execute(query, list_of_ids)
-        conn.commit()
-        deleted_count = cursor.rowcount
-        log_activity(username, "DATA_BULK_DELETED", f"{deleted_count} record eliminati. IDs (fino a 10): {list_of_ids[:10]}")
+        deleted_count = 0
+        with db_transaction() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}{where_sql}", params).fetchone()[0]
+            while deleted_count < total:
+                deleted_batch = conn.execute(
+                    f"DELETE FROM {TABLE_NAME} WHERE id IN (SELECT id FROM {TABLE_NAME}{where_sql} LIMIT ?)",
+                    params + [int(batch_size)]
+                ).rowcount
+                if deleted_batch == 0:
+                    break
+                deleted_count += deleted_batch
+                if progress_callback:
+                    progress_callback(deleted_count, total)
+            if deleted_count > 0:
+                _bump_data_version(conn)
+        log_activity(username, "DATA_BULK_DELETED", f"{deleted_count} record eliminati. Filtri: {filtri_descr}")
         return deleted_count, f"{deleted_count} record eliminati con successo."
     except sqlite3.Error as e:
-        conn.rollback()
-        log_activity(username, "DB_ERROR_BULK_DELETE", f"Errore eliminazione massiva: {e}")
+        log_activity(username, "DB_ERROR_BULK_DELETE", f"Errore eliminazione massiva (filtri {filtri_descr}): {e}")
         return 0, f"Errore database durante l'eliminazione: {e}"
-    finally:
-        if conn:
-            conn.close()
 
-def get_all_spese() -> pd.DataFrame:
-    conn = get_db_connection()
+# Colonne ammesse per l'ordinamento server-side (whitelist: il nome finisce nel testo SQL)
+SPESE_SORTABLE_COLS = [
+    'id', 'timestamp_caricamento', 'rif_pa', 'comune_centro_estivo', 'centro_estivo', 'data_mandato',
+    'bambino_cognome_nome', 'codice_fiscale_bambino', 'valore_contributo_fse', 'totale_retta'
+]
+# Colonne filtrabili dalla dashboard: chiave del filtro -> colonna DB
+SPESE_FILTER_COLS = {'rif_pa': 'rif_pa', 'comuni': 'comune_centro_estivo', 'centri': 'centro_estivo'}
+
+def _build_spese_where(rif_pa: Union[list, None] = None, comuni: Union[list, None] = None, centri: Union[list, None] = None) -> tuple[str, list]:
+    """Costruisce la clausola WHERE parametrizzata per i filtri della dashboard (liste vuote/None = nessun filtro)."""
+    clauses, params = [], []
+    for values, col in ((rif_pa, SPESE_FILTER_COLS['rif_pa']), (comuni, SPESE_FILTER_COLS['comuni']), (centri, SPESE_FILTER_COLS['centri'])):
+        if values:
+            values = list(values)
+            clauses.append(f"{col} IN ({', '.join(['?'] * len(values))})")
+            params.extend(values)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def query_spese(
+    rif_pa: Union[list, None] = None, comuni: Union[list, None] = None, centri: Union[list, None] = None,
+    offset: int = 0, limit: Union[int, None] = 100,
+    sort_by: str = 'timestamp_caricamento', descending: bool = True,
+    columns: Union[list, None] = None
+) -> tuple[pd.DataFrame, int]:
+    """
+    Interroga spese_sostenute con filtri, ordinamento e paginazione eseguiti in SQL,
+    così solo la pagina richiesta esce dal database.
+    Args:
+        rif_pa, comuni, centri: liste di valori ammessi (in AND tra loro); None/vuota = nessun filtro.
+        offset, limit: finestra di righe da restituire (limit=None = tutte, es. per export).
+        sort_by: colonna di ordinamento (deve essere in SPESE_SORTABLE_COLS); id come criterio secondario.
+        columns: colonne da leggere (default tutte).
+    Returns:
+        pd.DataFrame: le righe della pagina.
+        int: numero totale di righe che soddisfano i filtri.
+    """
+    if sort_by not in SPESE_SORTABLE_COLS:
+        raise ValueError(f"Colonna di ordinamento non ammessa: {sort_by}")
+    if columns is not None and not set(columns) <= set(SPESE_INSERT_COLS + ['id']):
+        raise ValueError(f"Colonne non valide: {sorted(set(columns) - set(SPESE_INSERT_COLS + ['id']))}")
+
+    where_sql, params = _build_spese_where(rif_pa, comuni, centri)
+    direction = "DESC" if descending else "ASC"
+    select_cols = ", ".join(columns) if columns else "*"
+    query = f"SELECT {select_cols} FROM {TABLE_NAME}{where_sql} ORDER BY {sort_by} {direction}, id {direction}"
+    page_params = list(params)
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        page_params += [int(limit), int(offset)]
     try:
-        df = pd.read_sql_query(f"SELECT * FROM {TABLE_NAME} ORDER BY timestamp_caricamento DESC, id DESC", conn)
-        return df
-    except Exception as e:
-        log_activity("System", "DB_ERROR_GET_ALL", f"Errore recupero dati: {e}")
+        with db_connection() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}{where_sql}", params).fetchone()[0]
+            df_page = pd.read_sql_query(query, conn, params=page_params)
+        return df_page, total
+    except sqlite3.Error as e:
+        log_activity("System", "DB_ERROR_QUERY_SPESE", f"Errore interrogazione spese: {e}")
+        return pd.DataFrame(), 0
+
+def get_spese_filter_options(comuni: Union[list, None] = None) -> dict[str, list]:
+    """
+    Valori distinti per i filtri della dashboard (letti dagli indici, senza caricare le righe).
+    Se comuni è indicato, i centri estivi proposti sono solo quelli di quei comuni.
+    """
+    where_centri, params_centri = _build_spese_where(comuni=comuni)
+    with db_connection() as conn:
+        rif_pa_opts = [r[0] for r in conn.execute(f"SELECT DISTINCT rif_pa FROM {TABLE_NAME} WHERE rif_pa IS NOT NULL ORDER BY rif_pa")]
+        comuni_opts = [r[0] for r in conn.execute(f"SELECT DISTINCT comune_centro_estivo FROM {TABLE_NAME} WHERE comune_centro_estivo IS NOT NULL ORDER BY comune_centro_estivo")]
+        centri_where = (where_centri + " AND" if where_centri else " WHERE") + " centro_estivo IS NOT NULL"
+        centri_opts = [r[0] for r in conn.execute(f"SELECT DISTINCT centro_estivo FROM {TABLE_NAME}{centri_where} ORDER BY centro_estivo", params_centri)]
+    return {'rif_pa': rif_pa_opts, 'comuni': comuni_opts, 'centri': centri_opts}
+
+def get_riepilogo(dimensione: str, rif_pa: Union[list, None] = None, comuni: Union[list, None] = None, centri: Union[list, None] = None) -> pd.DataFrame:
+    """
+    Totali di una dimensione (vedi RIEPILOGO_DIMENSIONI) con tutti i filtri della dashboard applicati.
+    Se i filtri attivi riguardano solo colonne della dimensione (o non ce ne sono) si leggono i totali
+    precalcolati, in O(gruppi); altrimenti GROUP BY sulle sole righe filtrate di spese (stessa WHERE di
+    query_spese), così i totali corrispondono sempre alla tabella filtrata.
+    """
+    if dimensione not in RIEPILOGO_DIMENSIONI:
+        raise ValueError(f"Dimensione di riepilogo non valida: {dimensione}")
+    key_cols = RIEPILOGO_DIMENSIONI[dimensione]
+    filtri = {'rif_pa': rif_pa, 'comuni': comuni, 'centri': centri}
+    where_sql, params = _build_spese_where(**filtri)
+    if all(SPESE_FILTER_COLS[k] in key_cols for k, v in filtri.items() if v):
+        tot_cols = ", ".join(f"ROUND(tot_{c}, 2) AS tot_{c}" for c in RIEPILOGO_IMPORTI)
+        query = f"SELECT {', '.join(key_cols)}, {tot_cols}, n_righe, n_bambini FROM riepilogo_{dimensione}{where_sql} ORDER BY {', '.join(key_cols)}"
+    else: # Filtri su colonne fuori dal raggruppamento: stessi valori delle tabelle di riepilogo, dalle righe filtrate
+        group_by = ", ".join(str(i + 1) for i in range(len(key_cols)))
+        query = (f"SELECT {', '.join(f'COALESCE({k}, {chr(39) * 2}) AS {k}' for k in key_cols)}, "
+                 f"{', '.join(f'ROUND(SUM(COALESCE({c}, 0)), 2) AS tot_{c}' for c in RIEPILOGO_IMPORTI)}, "
+                 f"COUNT(*) AS n_righe, COUNT(DISTINCT codice_fiscale_bambino) AS n_bambini "
+                 f"FROM {TABLE_NAME}{where_sql} GROUP BY {group_by} ORDER BY {group_by}")
+    try:
+        with db_connection() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        log_activity("System", "DB_ERROR_RIEPILOGO", f"Errore lettura riepilogo '{dimensione}': {e}")
         return pd.DataFrame()
-    finally:
-        if conn:
-            conn.close()
 
-def get_log_content() -> str:
+def get_fse_totali_per_cf(codici_fiscali: list[str]) -> dict[str, float]:
+    """
+    Contributo FSE già registrato nel DB (tutte le trasmissioni) per ciascun codice fiscale,
+    letto dalla tabella dei totali progressivi con query a blocchi per chiave primaria.
+    I CF senza righe salvate non compaiono nel dizionario restituito.
+    """
+    cf_list = sorted({cf for cf in codici_fiscali if isinstance(cf, str) and cf.strip() != ''})
+    totali = {}
+    with db_connection() as conn:
+        for chunk_cf in _chunks(cf_list, SQL_BATCH_SIZE):
+            placeholders = ', '.join(['?'] * len(chunk_cf))
+            for row in conn.execute(
+                f"SELECT codice_fiscale_bambino, tot_valore_contributo_fse FROM {TOTALI_FSE_BAMBINO_TABLE} WHERE codice_fiscale_bambino IN ({placeholders})",
+                chunk_cf
+            ):
+                totali[row[0]] = round(row[1], 2)
+    return totali
+
+# --- Lettura paginata del log (dal fondo del file) ---
+LOG_READ_BLOCK_SIZE = 64 * 1024 # Byte letti per ogni passo all'indietro
+
+def _iter_log_lines_reverse(f, end: int) -> Iterator[tuple[bytes, int]]:
+    """
+    Scorre all'indietro il file binario f a blocchi, a partire dal byte end (escluso),
+    restituendo (riga, offset di inizio riga) dalla più recente alla più vecchia.
+    Le righe vuote vengono saltate.
+    """
+    pos = end
+    tail = b''
+    while pos > 0:
+        read_size = min(LOG_READ_BLOCK_SIZE, pos)
+        pos -= read_size
+        f.seek(pos)
+        chunk = f.read(read_size) + tail
+        parts = chunk.split(b'\n')
+        tail = parts[0] # Potenzialmente incompleta: si completa col blocco precedente
+        line_end = pos + len(chunk)
+        for line in reversed(parts[1:]):
+            line_start = line_end - len(line)
+            if line.strip():
+                yield line, line_start
+            line_end = line_start - 1 # Salta il '\n' che precede la riga
+    if tail.strip():
+        yield tail, 0
+
+def _log_segment_paths() -> list[str]:
+    """
+    Percorsi dei segmenti di log dal più recente al più vecchio: il file attivo, poi
+    activity.log.1.gz, .2.gz, ... (accetta anche i vecchi backup non compressi activity.log.N).
+    """
+    paths = [log_file_path]
+    for i in range(1, LOG_BACKUP_COUNT + 1):
+        for candidate in (f"{log_file_path}.{i}.gz", f"{log_file_path}.{i}"):
+            if os.path.exists(candidate):
+                paths.append(candidate)
+                break
+        else:
+            break
+    return paths
+
+# Un segmento compresso non si può leggere all'indietro a blocchi (gzip non è seekable a ritroso senza
+# ridecomprimere dall'inizio): si decomprime per intero, al più LOG_MAX_BYTES. In cache resta solo il
+# segmento che la pagina sta leggendo: la pagina successiva di solito prosegue nello stesso.
+@lru_cache(maxsize=1)
+def _read_gz_segment(path: str, mtime_ns: int, size: int) -> bytes:
+    # mtime e dimensione fanno parte della chiave: se il segmento viene riscritto (rotazione) la cache si invalida
+    with gzip.open(path, 'rb') as f:
+        return f.read()
+
+LOG_IDENTITY_HEAD_BYTES = 256 # Massimo di byte della prima riga del file attivo salvati nell'identità
+
+def _log_segment_identity(path: str) -> tuple:
+    """
+    Identità di un segmento, salvata nei cursori: (device, inode), più mtime per i segmenti compressi,
+    che non cambiano più dopo la rotazione. Una rotazione rinomina i segmenti (activity.log.1.gz diventa
+    .2.gz, il file attivo diventa .1.gz): allo stesso indice si trova allora un file con un'altra identità.
+    Il file attivo compresso viene eliminato e il nuovo file attivo può riusarne l'inode: per il file
+    attivo l'identità comprende quindi la prima riga (data e ora del primo evento), che non cambia finché il file cresce.
+    """
+    stat = os.stat(path)
+    if path.endswith('.gz'):
+        return (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+    with open(path, 'rb') as f:
+        return (stat.st_dev, stat.st_ino, f.readline(LOG_IDENTITY_HEAD_BYTES))
+
+def _open_log_segment(path: str):
+    if path.endswith('.gz'):
+        stat = os.stat(path)
+        return io.BytesIO(_read_gz_segment(path, stat.st_mtime_ns, stat.st_size))
+    return open(path, 'rb')
+
+def log_cursor_valido(cursor: Union[tuple, None]) -> bool:
+    """False se dopo la creazione del cursore una rotazione ha spostato il segmento a cui si riferisce."""
+    if cursor is None:
+        return True
+    if len(cursor) != 3: # Cursore nel vecchio formato (senza identità del segmento)
+        return False
+    segments = _log_segment_paths()
+    segment_idx, _, identity = cursor
     try:
-        with open(log_file_path, 'r', encoding='utf-8') as f: 
-            lines = f.readlines()
-        return "".join(lines[::-1])
-    except FileNotFoundError: 
-        return "File di log non ancora creato o non trovato."
-    except Exception as e: 
-        return f"Errore durante la lettura del file di log: {e}"
+        return segment_idx < len(segments) and _log_segment_identity(segments[segment_idx]) == identity
+    except FileNotFoundError:
+        return False
+
+def iter_log_lines(cursor: Union[tuple, None] = None) -> Iterator[tuple[str, tuple]]:
+    """
+    Scorre le righe del log dalla più recente alla più vecchia attraverso il file attivo e tutti
+    i segmenti ruotati. I segmenti compressi vengono aperti (e decompressi) solo quando la
+    lettura li raggiunge, quindi chi smette di iterare non paga quelli più vecchi.
+    Args:
+        cursor: (indice segmento, offset in byte, identità del segmento) da cui proseguire,
+                None = righe più recenti. Solleva ValueError se non è più valido (vedi log_cursor_valido).
+    Yields:
+        (riga, cursore della riga): il cursore, passato di nuovo, riprende dalla riga precedente.
+    """
+    if not log_cursor_valido(cursor):
+        raise ValueError("Cursore del log non più valido: il log è stato ruotato.")
+    segment_idx, end = cursor[:2] if cursor is not None else (0, None)
+    segments = _log_segment_paths()
+    while segment_idx < len(segments):
+        try:
+            identity = _log_segment_identity(segments[segment_idx])
+            with _open_log_segment(segments[segment_idx]) as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                start = size if end is None else min(int(end), size)
+                for line, line_start in _iter_log_lines_reverse(f, start):
+                    yield line.decode('utf-8', errors='replace').rstrip('\r'), (segment_idx, line_start, identity)
+        except FileNotFoundError:
+            pass # Segmento spostato da una rotazione concorrente
+        segment_idx, end = segment_idx + 1, None
+
+def read_log_page(n_lines: int = 200, cursor: Union[tuple, None] = None) -> tuple[list[str], Union[tuple, None]]:
+    """
+    Legge una pagina del log di attività, dalle righe più recenti alle più vecchie, proseguendo
+    nei segmenti compressi quando il file attivo è esaurito. Si ferma appena la pagina è piena.
+    Args:
+        n_lines: numero massimo di righe della pagina.
+        cursor: cursore restituito dalla pagina precedente (None = righe più recenti).
+                Se nel frattempo una rotazione ha spostato i segmenti solleva ValueError: il chiamante
+                controlla prima con log_cursor_valido e riparte da None.
+    Returns:
+        list[str]: righe della pagina, dalla più recente alla più vecchia.
+        tuple | None: cursore per la pagina successiva (più vecchia), None se il log è finito.
+    """
+    lines, next_cursor = [], None
+    line_iter = iter_log_lines(cursor)
+    for line, line_cursor in line_iter:
+        if len(lines) >= n_lines:
+            return lines, next_cursor # Esiste almeno un'altra riga: c'è una pagina successiva
+        lines.append(line)
+        next_cursor = line_cursor
+    return lines, None
+
 #cartella/utils/db.py
\ No newline at end of file
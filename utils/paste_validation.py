@@ -0,0 +1,142 @@
+#cartella/utils/paste_validation.py
+"""
+Validazione incrementale dei dati incollati dal richiedente.
+Streamlit riesegue la pagina a ogni interazione (expander, download, modifica del testo): invece di
+ripetere read_csv, parsing e validazione sull'intero incollato, si tiene una cache per contenuto di
+riga (la riga di testo è la chiave) con i valori parsati e gli esiti compatti dei controlli per riga
+(casi e valori, senza messaggi: vedi formatta_esiti in common_utils).
+A ogni esecuzione si parsano e validano solo le righe nuove o modificate; i controlli per bambino
+(CF duplicati, cap FSE) sono ricalcolati sull'intero incollato dai valori in cache, con un groupby.
+Gli esiti dipendono anche dal formato delle date (rilevato sull'intero incollato), dalla data di
+riferimento per l'età e dai limiti delle regole: se cambiano, la cache riparte da vuota.
+"""
+from datetime import date
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+from utils.common_utils import (
+    preprocess_richiedente_df, valida_esiti_compatti, aggiungi_esiti_bambini, ha_errori_bloccanti, DATA_MANDATO_FORMATI,
+    _campione_formato_data, _rileva_formato_data,
+)
+from utils.validation_rules import get_regole
+
+NOMI_COLONNE_PASTED_DATA = [
+    'numero_mandato','data_mandato','comune_titolare_mandato','importo_mandato',
+    'comune_centro_estivo','centro_estivo','genitore_cognome_nome','bambino_cognome_nome',
+    'codice_fiscale_bambino','valore_contributo_fse','altri_contributi',
+    'quota_retta_destinatario','totale_retta','numero_settimane_frequenza',
+    'controlli_formali_dichiarati' # Colonna 15
+]
+VALIDATION_KWARGS_RICHIEDENTE = dict(
+    cf_col_clean='codice_fiscale_bambino_pulito', original_date_col='data_mandato_originale', parsed_date_col='data_mandato',
+    declared_formal_controls_col='controlli_formali_dichiarati',
+    row_offset_for_messages=1, # Per il richiedente, le righe sono 1-based dall'incollato
+)
+
+def split_righe_incollate(testo: str, n_colonne: int) -> Union[list, None]:
+    """
+    Righe non vuote dell'incollato (celle separate da tabulazione), se ognuna ha esattamente
+    n_colonne celle. None se il testo richiede il parser completo (read_csv): virgolette (celle
+    Excel su più righe), righe con un numero di celle diverso, nessuna riga.
+    """
+    if '"' in testo or testo.startswith('\ufeff'):
+        return None
+    righe = [r for r in testo.replace('\r\n', '\n').replace('\r', '\n').split('\n') if r]
+    if not righe or any(r.count('\t') != n_colonne - 1 for r in righe):
+        return None
+    return righe
+
+def validate_richiedente_df(df_pasted: pd.DataFrame, age_reference_date: Union[date, None] = None) -> tuple[pd.DataFrame, dict, bool, str]:
+    """Percorso completo, senza cache (es. incollati con virgolette): stessi risultati di validate_righe_incrementale."""
+    df_check, formato_date, _ = preprocess_richiedente_df(df_pasted.copy())
+    esiti, has_blocking_errors = valida_esiti_compatti(
+        df_check, **VALIDATION_KWARGS_RICHIEDENTE, age_reference_date=age_reference_date,
+        parallel=True # Su più processi solo per incollati molto grandi (PARALLEL_SOGLIA_RIGHE)
+    )
+    return df_check, esiti, has_blocking_errors, formato_date
+
+def validate_righe_incrementale(
+    righe: list,
+    colonne: list, # Nomi delle colonne incollate, nell'ordine (NOMI_COLONNE_PASTED_DATA)
+    cache: dict,   # Stato tra le esecuzioni (es. in st.session_state), modificato sul posto
+    age_reference_date: Union[date, None] = None
+) -> tuple[pd.DataFrame, dict, bool, str]:
+    """
+    Equivalente di read_csv + preprocess_richiedente_df + valida_esiti_compatti sulle righe
+    (da split_righe_incollate), riusando i risultati in cache delle righe già viste.
+    La cache conserva solo le righe dell'ultimo incollato: la sua dimensione segue quella dei dati.
+    Dati ed esiti restituiti possono essere quelli dell'esecuzione precedente: non vanno modificati.
+    Returns:
+        pd.DataFrame: dati parsati (come df_check della pagina del richiedente).
+        dict: esiti compatti della validazione, come valida_esiti_compatti.
+        bool: True se ci sono errori bloccanti, False altrimenti.
+        str: descrizione del formato delle date di mandato rilevato ('' se nessuno).
+    """
+    ultimo = cache.get('ultimo')
+    if ultimo is not None and ultimo[0] == righe and ultimo[1] == (age_reference_date, get_regole()['parametri']):
+        return ultimo[2] # Rerun senza modifiche all'incollato (expander, download): stesso risultato
+
+    # Formato delle date sull'intero incollato (stesso campione di parse_data_mandato_series): si
+    # separano le celle delle righe solo fino a completare il campione
+    i_data = colonne.index('data_mandato')
+    campione = _campione_formato_data(r.split('\t', i_data + 1)[i_data] for r in righe)
+    if cache.get('campione_date') != campione:
+        cache['campione_date'], cache['formato_date'] = campione, _rileva_formato_data(campione)
+    formato = cache['formato_date']
+
+    contesto = (formato, age_reference_date, get_regole()['parametri'])
+    if cache.get('contesto') != contesto:
+        # Tipi delle colonne fissati una volta, da una riga vuota pre-processata e validata
+        df_tipi, _, _ = preprocess_richiedente_df(pd.DataFrame([[''] * len(colonne)], columns=colonne, dtype=str), formato)
+        esiti_tipi, _ = valida_esiti_compatti(df_tipi, **VALIDATION_KWARGS_RICHIEDENTE,
+                                              age_reference_date=age_reference_date, batch_checks=False)
+        cache.update(contesto=contesto, posizioni={}, df=df_tipi.iloc[:0],
+                     esiti={k: v[:0] for k, v in esiti_tipi['righe'].items() if k != 'riga'})
+    posizioni = cache['posizioni'] # Riga di testo -> posizione in cache['df'] e negli array di cache['esiti']
+
+    # --- Righe nuove o modificate: parsing e controlli per riga (senza quelli per bambino) ---
+    nuove, celle_nuove = {}, [] # Riga di testo -> posizione dopo quelle in cache (le righe ripetute si validano una volta)
+    for r in righe:
+        if r not in posizioni and r not in nuove:
+            nuove[r] = len(posizioni) + len(nuove)
+            celle_nuove.append(r.split('\t'))
+    df_tutte, esiti_tutte = cache['df'], cache['esiti']
+    if nuove:
+        df_nuove = pd.DataFrame(celle_nuove, columns=colonne, dtype=str)
+        df_nuove, _, _ = preprocess_richiedente_df(df_nuove, formato)
+        esiti_nuove, _ = valida_esiti_compatti(df_nuove, **VALIDATION_KWARGS_RICHIEDENTE,
+                                               age_reference_date=age_reference_date, batch_checks=False)
+        df_tutte = pd.concat([df_tutte, df_nuove], ignore_index=True)
+        # Il numero di riga dipende dalla posizione nell'incollato: non si conserva
+        esiti_tutte = {k: np.concatenate([v, esiti_nuove['righe'][k]]) for k, v in esiti_tutte.items()}
+        posizioni = {**posizioni, **nuove}
+
+    # --- Ricomposizione per posizione dai valori in cache ---
+    prese = np.fromiter((posizioni[r] for r in righe), dtype=np.intp, count=len(righe))
+    df_check = df_tutte.take(prese).reset_index(drop=True)
+    righe_esiti = {'riga': np.arange(1, len(righe) + 1)}
+    righe_esiti.update({k: v[prese] for k, v in esiti_tutte.items()})
+    esiti = {'righe': righe_esiti, 'parametri': contesto[2], 'bambini': None}
+
+    # In cache solo le righe distinte dell'incollato corrente: la sua dimensione segue quella dei dati
+    prime = {}
+    for j, r in enumerate(righe):
+        prime.setdefault(r, j)
+    prime_pos = np.fromiter(prime.values(), dtype=np.intp, count=len(prime))
+    cache.update(posizioni={r: i for i, r in enumerate(prime)}, df=df_check.take(prime_pos).reset_index(drop=True),
+                 esiti={k: v[prime_pos] for k, v in righe_esiti.items() if k != 'riga'})
+
+    # --- Controlli per bambino sull'intero incollato ---
+    # Dipendono solo da CF e contributo FSE delle righe: se nessuno dei due cambia si riusano
+    cf_col = VALIDATION_KWARGS_RICHIEDENTE['cf_col_clean']
+    chiave_batch = (tuple(df_check[cf_col].tolist()), tuple(df_check['valore_contributo_fse'].tolist()))
+    if cache.get('batch', (None,))[0] != chiave_batch:
+        cache['batch'] = (chiave_batch, aggiungi_esiti_bambini(esiti, df_check, cf_col)[0]['bambini'])
+    esiti['bambini'] = cache['batch'][1]
+    risultato = (df_check, esiti, ha_errori_bloccanti(esiti), DATA_MANDATO_FORMATI.get(formato, ''))
+    cache['ultimo'] = (righe, contesto[1:], risultato)
+    return risultato
+
+#cartella/utils/paste_validation.py
@@ -0,0 +1,133 @@
+#cartella/utils/stream_validation.py
+"""
+Validazione a blocchi (streaming) dei CSV del controllore molto grandi.
+Il file è letto a blocchi di righe: ogni blocco è pre-processato e validato riga per riga
+(esiti compatti, batch_checks=False); i messaggi sono composti solo per le righe con errori conservate. Per i controlli sull'intero file (CF duplicati,
+cap 300€ per bambino) si tengono solo accumulatori compatti per CF (numero di righe, FSE).
+Dei risultati si conservano solo le righe con errori bloccanti (fino a un massimo) e dei contatori:
+la memoria dipende dalla dimensione del blocco e dal numero di bambini, non dalle righe del file.
+Solo se qualche bambino supera il cap, un secondo passaggio rilegge il file per annotarne le righe.
+"""
+from datetime import date
+from typing import Callable, Union
+
+import pandas as pd
+
+from utils.common_utils import (
+    preprocess_controllore_df, valida_esiti_compatti, formatta_esiti, posizioni_con_errori, prepara_df_per_db,
+    _aggregate_per_child, _child_checks, _append_cap_errors, _results_with_batch_rows,
+)
+
+STREAMING_SOGLIA_BYTES = 20 * 1024 * 1024 # Sopra questa dimensione la pagina del controllore valida a blocchi
+STREAMING_CHUNK_RIGHE = 20000
+STREAMING_MAX_RIGHE_ERRORE = 10000 # Righe con errori di cui si conserva il dettaglio (le altre sono solo contate)
+CSV_CONTROLLORE_KWARGS = dict(sep=';', decimal=',', na_filter=False, dtype=str)
+COL_CAP = "Verifica Cap FSE per Bambino (batch)"
+VALIDATION_KWARGS_CONTROLLORE = dict(
+    cf_col_clean='cf_pulito', original_date_col='data_mandato_originale_csv', parsed_date_col='data_mandato',
+    declared_formal_controls_col='controlli_formali', # 'controlli_formali' nel CSV è il "dichiarato" per il controllore
+    row_offset_for_messages=2, # Riga CSV = indice + intestazione + 1
+)
+
+def _iter_chunks(source, chunk_rows: int):
+    """Blocchi pre-processati del CSV; l'indice prosegue tra i blocchi (numero di riga nel file)."""
+    if hasattr(source, 'seek'):
+        source.seek(0) # File caricato o aperto: ogni passaggio riparte dall'inizio
+    with pd.read_csv(source, chunksize=chunk_rows, **CSV_CONTROLLORE_KWARGS) as reader:
+        for chunk in reader:
+            yield preprocess_controllore_df(chunk)
+
+def iter_blocchi_per_db(source, id_trasmissione: str, chunk_rows: int = STREAMING_CHUNK_RIGHE):
+    """
+    Blocchi del CSV pronti per il DB (prepara_df_per_db), tutti con lo stesso id_trasmissione:
+    per salvare con db.add_spese_a_blocchi un file validato a blocchi senza leggerlo per intero.
+    """
+    for df_chunk, _, _ in _iter_chunks(source, chunk_rows):
+        yield prepara_df_per_db(df_chunk, id_trasmissione)[0]
+
+def _merge_per_child(acc: Union[pd.DataFrame, None], per_child: pd.DataFrame) -> pd.DataFrame:
+    # Somma dei totali per CF mantenendo l'ordine di prima apparizione nel file
+    if acc is None:
+        return per_child
+    return pd.concat([acc, per_child]).groupby(level=0, sort=False).sum()
+
+def _keep_failing(kept: pd.DataFrame, new_rows: pd.DataFrame, max_rows: int) -> pd.DataFrame:
+    # Le righe rivalidate nel secondo passaggio sostituiscono quelle del primo (stessa 'Riga')
+    merged = pd.concat([kept, new_rows], ignore_index=True).drop_duplicates('Riga', keep='last')
+    return merged.sort_values('Riga', kind='stable').head(max_rows).reset_index(drop=True)
+
+def validate_controllore_csv_streaming(
+    source,
+    historical_lookup: Union[Callable[[list], dict], None] = None, # Es. db.get_fse_totali_per_cf
+    age_reference_date: Union[date, None] = None,
+    chunk_rows: int = STREAMING_CHUNK_RIGHE,
+    max_error_rows: int = STREAMING_MAX_RIGHE_ERRORE,
+    on_progress: Union[Callable[[int], None], None] = None # Chiamata con le righe elaborate finora
+) -> tuple[pd.DataFrame, bool, dict]:
+    """
+    Valida un CSV del controllore (percorso o file-like riavvolgibile) a blocchi di chunk_rows righe.
+    Returns:
+        pd.DataFrame: come run_detailed_validations, ma solo righe "Batch" e righe con errori bloccanti
+                      (le prime max_error_rows per numero di riga).
+        bool: True se ci sono errori bloccanti, False altrimenti.
+        dict: riepilogo con 'righe', 'blocchi', 'righe_con_errori', 'bambini', 'cf_duplicati',
+              'bambini_oltre_cap', 'formati_date' (formato -> blocchi), 'colonne_valuta_mancanti'.
+    """
+    riepilogo = {'righe': 0, 'blocchi': 0, 'righe_con_errori': 0, 'bambini': 0, 'cf_duplicati': 0,
+                 'bambini_oltre_cap': 0, 'formati_date': {}, 'colonne_valuta_mancanti': []}
+    per_child, kept, columns = None, None, None
+
+    # --- Primo passaggio: validazioni per riga e accumulatori per bambino ---
+    for df_chunk, formato_date, missing_cols in _iter_chunks(source, chunk_rows):
+        esiti, _ = valida_esiti_compatti(df_chunk, **VALIDATION_KWARGS_CONTROLLORE,
+                                         age_reference_date=age_reference_date, batch_checks=False)
+        failing = posizioni_con_errori(esiti)
+        riepilogo['righe'] += len(df_chunk)
+        riepilogo['blocchi'] += 1
+        riepilogo['righe_con_errori'] += len(failing)
+        riepilogo['formati_date'][formato_date] = riepilogo['formati_date'].get(formato_date, 0) + 1
+        riepilogo['colonne_valuta_mancanti'] = sorted(set(riepilogo['colonne_valuta_mancanti']) | set(missing_cols))
+        # I blocchi arrivano in ordine di riga: servono solo le righe che entrano tra le prime max_error_rows
+        failing = failing[:max_error_rows - (0 if kept is None else len(kept))]
+        res = formatta_esiti(esiti, failing, includi_batch=False)
+        columns = res.columns if columns is None else columns
+        failing_rows = res.assign(_cf=df_chunk['cf_pulito'].to_numpy()[failing])
+        kept = failing_rows if kept is None else _keep_failing(kept, failing_rows, max_error_rows)
+        per_child = _merge_per_child(per_child, _aggregate_per_child(df_chunk, 'cf_pulito')[1])
+        if on_progress is not None:
+            on_progress(riepilogo['righe'])
+
+    if per_child is None: # Nessuna riga nel file
+        return pd.DataFrame(), False, riepilogo
+
+    # --- Controlli per bambino sui totali dell'intero file ---
+    historical = historical_lookup(per_child.index.tolist()) if historical_lookup is not None else None
+    batch_errors, child_msg, child_err, over_cap = _child_checks(per_child['righe'], per_child.get('fse'), historical)
+    riepilogo['bambini'] = len(per_child)
+    riepilogo['cf_duplicati'] = len(batch_errors)
+    riepilogo['bambini_oltre_cap'] = int(over_cap.sum())
+
+    # --- Secondo passaggio (solo se serve): righe dei bambini oltre il cap ---
+    if over_cap.any():
+        cap_error_per_cf = dict(zip(per_child.index[over_cap], child_err[:-1][over_cap]))
+        for df_chunk, _, _ in _iter_chunks(source, chunk_rows):
+            rows_over_cap = df_chunk['cf_pulito'].isin(cap_error_per_cf).to_numpy()
+            if not rows_over_cap.any():
+                continue
+            sub = df_chunk[rows_over_cap]
+            res = formatta_esiti(valida_esiti_compatti(sub, **VALIDATION_KWARGS_CONTROLLORE,
+                                                       age_reference_date=age_reference_date, batch_checks=False)[0])
+            row_errors = res['Errori Bloccanti'].to_numpy(dtype=object)
+            riepilogo['righe_con_errori'] += int((row_errors == "Nessuno").sum()) # Righe che falliscono solo per il cap
+            cap_err = sub['cf_pulito'].map(cap_error_per_cf).to_numpy(dtype=object)
+            res['Errori Bloccanti'] = _append_cap_errors(row_errors, cap_err)
+            kept = _keep_failing(kept, res.assign(_cf=sub['cf_pulito'].to_numpy()), max_error_rows)
+
+    # Esito del cap (anche con lo storico) per le righe conservate, dal totale del loro bambino
+    kept = kept.reset_index(drop=True)
+    kept[COL_CAP] = child_msg[per_child.index.get_indexer(kept['_cf'])] if len(kept) else []
+    df_results = _results_with_batch_rows(kept.drop(columns='_cf')[list(columns)], batch_errors)
+    has_blocking_errors = bool(batch_errors) or riepilogo['righe_con_errori'] > 0
+    return df_results, has_blocking_errors, riepilogo
+
+#cartella/utils/stream_validation.py
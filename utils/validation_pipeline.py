@@ -0,0 +1,141 @@
+#cartella/utils/validation_pipeline.py
+"""
+Pipeline completa lettura -> pre-processing -> validazione di un file di trasmissione, con cache
+per contenuto condivisa da tutto il processo (tutte le sessioni e gli utenti).
+La chiave è il digest del contenuto più i parametri che cambiano l'esito (formato del file, data di
+riferimento per l'età, limiti delle regole): un comune che ricarica lo stesso file non paga di nuovo
+parsing e controlli per riga. In cache ci sono i dati parsati e gli esiti compatti per riga (casi e
+valori dei controlli, senza messaggi: vedi formatta_esiti in common_utils); i controlli per
+bambino sono rifatti (un groupby) con lo storico FSE letto a ogni chiamata, che cambia quando altre
+trasmissioni vengono salvate; a storico invariato si riusa il risultato della chiamata precedente.
+La cache è un LRU limitato dalla memoria occupata (PIPELINE_CACHE_MAX_BYTES), non dal numero di voci.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date
+from io import BytesIO, StringIO
+from typing import Callable, Union
+
+import pandas as pd
+
+from utils.common_utils import preprocess_controllore_df, valida_esiti_compatti, aggiungi_esiti_bambini
+from utils.stream_validation import CSV_CONTROLLORE_KWARGS, VALIDATION_KWARGS_CONTROLLORE
+from utils.validation_rules import get_regole
+
+PIPELINE_CACHE_MAX_BYTES = 256 * 1024 * 1024 # Memoria massima delle voci in cache (stima con memory_usage(deep=True))
+
+# Formato del file -> (argomenti di read_csv, pre-processing, argomenti di run_detailed_validations)
+PIPELINE_FORMATI = {
+    'controllore': (CSV_CONTROLLORE_KWARGS, preprocess_controllore_df, VALIDATION_KWARGS_CONTROLLORE),
+}
+
+_pipeline_cache = OrderedDict() # chiave -> (voce, byte occupati), dalla meno alla più recente
+_pipeline_cache_bytes = 0
+_pipeline_cache_lock = threading.Lock()
+_pipeline_stats = {'hit': 0, 'miss': 0, 'evicted': 0}
+
+def digest_contenuto(contenuto: Union[bytes, str]) -> str:
+    """Digest del contenuto (testo codificato in UTF-8)."""
+    if isinstance(contenuto, str):
+        contenuto = contenuto.encode('utf-8')
+    return hashlib.blake2b(contenuto, digest_size=20).hexdigest()
+
+def _cache_get(chiave: tuple) -> Union[dict, None]:
+    with _pipeline_cache_lock:
+        elemento = _pipeline_cache.get(chiave)
+        if elemento is None:
+            _pipeline_stats['miss'] += 1
+            return None
+        _pipeline_cache.move_to_end(chiave)
+        _pipeline_stats['hit'] += 1
+        return elemento[0]
+
+def _cache_put(chiave: tuple, voce: dict, dimensione: int):
+    global _pipeline_cache_bytes
+    if dimensione > PIPELINE_CACHE_MAX_BYTES:
+        return # Una voce più grande dell'intera cache non si conserva
+    with _pipeline_cache_lock:
+        if chiave in _pipeline_cache: # Calcolata in parallelo da un'altra sessione
+            return
+        _pipeline_cache[chiave] = (voce, dimensione)
+        _pipeline_cache_bytes += dimensione
+        while _pipeline_cache_bytes > PIPELINE_CACHE_MAX_BYTES:
+            _, (_, dim_rimossa) = _pipeline_cache.popitem(last=False)
+            _pipeline_cache_bytes -= dim_rimossa
+            _pipeline_stats['evicted'] += 1
+
+def pipeline_cache_info() -> dict:
+    """Voci, byte occupati e contatori (hit, miss, voci rimosse) della cache."""
+    with _pipeline_cache_lock:
+        return {'voci': len(_pipeline_cache), 'byte': _pipeline_cache_bytes, 'max_byte': PIPELINE_CACHE_MAX_BYTES, **_pipeline_stats}
+
+def clear_pipeline_cache():
+    global _pipeline_cache_bytes
+    with _pipeline_cache_lock:
+        _pipeline_cache.clear()
+        _pipeline_cache_bytes = 0
+
+def parse_e_valida_righe(contenuto: Union[bytes, str], formato_file: str = 'controllore',
+                         age_reference_date: Union[date, None] = None, parallel: bool = True) -> tuple[dict, int]:
+    """
+    Lettura, pre-processing e controlli per riga (senza quelli per bambino, che dipendono dallo
+    storico FSE: vedi aggiungi_esiti_bambini), senza passare dalla cache.
+    Usata da valida_contenuto e da utils/batch_ingest.py (nei processi del pool).
+    Returns:
+        dict: 'df', 'esiti' (compatti), 'formato_date', 'colonne_valuta_mancanti'.
+        int: memoria occupata stimata, in byte (per il limite della cache).
+    Solleva le eccezioni di read_csv (es. pd.errors.EmptyDataError, ParserError).
+    """
+    csv_kwargs, preprocess, validation_kwargs = PIPELINE_FORMATI[formato_file]
+    sorgente = StringIO(contenuto) if isinstance(contenuto, str) else BytesIO(contenuto)
+    df, formato_date, colonne_valuta_mancanti = preprocess(pd.read_csv(sorgente, **csv_kwargs))
+    esiti, _ = valida_esiti_compatti(df, **validation_kwargs, age_reference_date=age_reference_date,
+                                     batch_checks=False, parallel=parallel)
+    voce = {'df': df, 'esiti': esiti, 'formato_date': formato_date, 'colonne_valuta_mancanti': colonne_valuta_mancanti}
+    # Degli esiti contano solo gli array: i valori object (CF, nomi, date) sono quelli di df
+    dimensione = int(df.memory_usage(deep=True).sum() + sum(v.nbytes for v in esiti['righe'].values()))
+    return voce, dimensione
+
+def valida_contenuto(
+    contenuto: Union[bytes, str],
+    formato_file: str = 'controllore', # Chiave di PIPELINE_FORMATI
+    historical_lookup: Union[Callable[[list], dict], None] = None, # Es. db.get_fse_totali_per_cf
+    age_reference_date: Union[date, None] = None,
+    parallel: bool = True # Regole per riga su più processi per file molto grandi (PARALLEL_SOGLIA_RIGHE)
+) -> tuple[pd.DataFrame, dict, bool, dict]:
+    """
+    Legge, pre-processa e valida il contenuto di un file (byte o testo), riusando la cache se lo
+    stesso contenuto è già stato elaborato con gli stessi parametri.
+    Returns:
+        pd.DataFrame: dati parsati (come preprocess_controllore_df). Condiviso con la cache: non modificarlo.
+        dict: esiti compatti della validazione, come valida_esiti_compatti (da formattare con
+              formatta_esiti / pagina_esiti per le righe da mostrare). Condiviso con la cache.
+        bool: True se ci sono errori bloccanti, False altrimenti.
+        dict: 'formato_date', 'colonne_valuta_mancanti', 'digest' e 'da_cache' (True se dalla cache).
+    Solleva le eccezioni di read_csv (es. pd.errors.EmptyDataError, ParserError) come la lettura diretta.
+    """
+    digest = digest_contenuto(contenuto)
+    parametri_regole = tuple((nome, tuple(sorted(p.items()))) for nome, p in get_regole()['parametri'].items())
+    chiave = (digest, formato_file, age_reference_date, parametri_regole)
+    voce = _cache_get(chiave)
+    da_cache = voce is not None
+    if voce is None:
+        voce, dimensione = parse_e_valida_righe(contenuto, formato_file, age_reference_date, parallel)
+        _cache_put(chiave, voce, dimensione)
+
+    # Controlli per bambino con lo storico attuale
+    df = voce['df']
+    cf_col = PIPELINE_FORMATI[formato_file][2]['cf_col_clean']
+    historical = historical_lookup(df[cf_col].unique().tolist()) if historical_lookup is not None else None
+    ultimo = voce.get('ultimo_batch') # Storico invariato rispetto all'ultima chiamata: stesso risultato
+    if ultimo is not None and ultimo[0] == historical:
+        esiti, has_blocking_errors = ultimo[1], ultimo[2]
+    else:
+        esiti, has_blocking_errors = aggiungi_esiti_bambini(voce['esiti'], df, cf_col, historical)
+        voce['ultimo_batch'] = (historical, esiti, has_blocking_errors)
+    info = {'formato_date': voce['formato_date'], 'colonne_valuta_mancanti': voce['colonne_valuta_mancanti'],
+            'digest': digest, 'da_cache': da_cache}
+    return df, esiti, has_blocking_errors, info
+
+#cartella/utils/validation_pipeline.py
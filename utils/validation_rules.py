@@ -0,0 +1,253 @@
+#cartella/utils/validation_rules.py
+"""
+Registro delle regole di validazione sugli importi (D=A+B+C, contributo FSE, controlli formali 5%,
+cap FSE per bambino). Ogni regola è dichiarata una sola volta con i suoi parametri di default
+(i limiti degli avvisi correnti); i valori effettivi si leggono da REGOLE_FILE, così un nuovo
+avviso regionale che cambia un limite richiede solo di modificare il file.
+Al caricamento ogni regola è "compilata" in funzioni su colonne intere (array numpy):
+i parametri sono risolti una volta e la valutazione costa un passaggio per batch, non per riga.
+Le funzioni compilate non dipendono da pandas né dai nomi delle colonne del DataFrame:
+ricevono un dizionario di array e restituiscono un caso (intero piccolo) per elemento; i messaggi
+si compongono a parte, dai casi, solo per gli elementi che servono.
+"""
+import os
+from typing import Callable, Union
+
+import numpy as np
+import yaml
+from yaml.loader import SafeLoader
+
+REGOLE_FILE = 'regole_validazione.yaml' # Accanto a config.yaml; se manca valgono i default del registro
+
+# Nome regola -> colonna dei risultati che alimenta, parametri di default, compilatore.
+# L'ordine di dichiarazione è l'ordine dei messaggi in 'Errori Bloccanti'.
+REGISTRO_REGOLE = {}
+
+def regola(nome: str, colonna_esito: str, **parametri_default):
+    """Decoratore che registra il compilatore di una regola con i suoi parametri di default."""
+    def registra(compilatore: Callable[[dict], dict]) -> Callable[[dict], dict]:
+        REGISTRO_REGOLE[nome] = {'colonna': colonna_esito, 'parametri': parametri_default, 'compila': compilatore}
+        return compilatore
+    return registra
+
+def _round2(values: np.ndarray) -> np.ndarray:
+    """
+    Equivalente vettoriale di round(x, 2) di Python. rint(x*100)/100 coincide con round()
+    tranne quando x*100 cade (entro l'errore di arrotondamento) su un ,5: solo quei casi,
+    e i valori enormi o non finiti, vengono arrotondati con round() di Python.
+    """
+    with np.errstate(all='ignore'):
+        scaled = values * 100.0
+        rounded = np.rint(scaled) / 100.0
+        borderline = ~np.isfinite(scaled) | (np.abs(scaled) >= 1e9) | (np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    if borderline.any():
+        rounded[borderline] = [round(v, 2) for v in values[borderline].tolist()]
+    return rounded
+
+def _fmt2(values: np.ndarray) -> np.ndarray:
+    # Come f"{v:.2f}", come array object per comporre i messaggi con l'operatore +
+    return np.array([f"{v:.2f}" for v in values.tolist()], dtype=object)
+
+def fmt_limite(valore: float) -> str:
+    # Limite come appare nei messaggi: 300.0 -> "300", 2.5 -> "2.5"
+    return f"{valore:g}"
+
+# --- Regole ---
+# Colonne in ingresso alle regole per riga: 'A' (contributo FSE), 'B' (altri contributi),
+# 'C' (quota retta destinatario), 'D' (totale retta), 'settimane' (int64), 'dichiarato'
+# (controlli formali, NaN se non numerico/mancante) ed eventualmente 'dichiarato_input' (valore
+# originale, object; se manca nei messaggi compare 'dichiarato').
+# Ogni compilatore restituisce 'valuta' (colonne -> caso per elemento, int8, e i valori calcolati che
+# servono ai messaggi), 'messaggi' (casi e valori, anche solo di alcune righe -> testo) ed 'errori'.
+# 'errori' sono i casi che rendono la regola non superata. Il motore conserva casi e valori, compatti;
+# il testo si genera solo per le righe mostrate o esportate.
+
+@regola('somma_retta', 'Esito D=A+B+C')
+def _compila_somma_retta(p: dict) -> dict:
+    OK, DIVERSA = 0, 1
+
+    def valuta(c: dict) -> tuple[np.ndarray, dict]:
+        calc_sum = _round2(c['A'] + c['B'] + c['C'])
+        return np.where(np.isclose(c['D'], calc_sum), OK, DIVERSA).astype(np.int8), {'somma': calc_sum}
+
+    def messaggi(caso: np.ndarray, c: dict) -> np.ndarray:
+        val_a, val_b, val_c, val_d, calc_sum = c['A'], c['B'], c['C'], c['D'], c['somma']
+        msg = np.empty(len(caso), dtype=object)
+        ok = caso == OK
+        msg[ok] = "✅ OK (D=" + _fmt2(val_d[ok]) + ")"
+        ko = ~ok
+        msg[ko] = ("❌ Tot.Retta D=" + _fmt2(val_d[ko]) + " ≠ Somma A+B+C=" + _fmt2(calc_sum[ko]) +
+                   " (A=" + _fmt2(val_a[ko]) + ", B=" + _fmt2(val_b[ko]) + ", C=" + _fmt2(val_c[ko]) + ")")
+        return msg
+    return {'valuta': valuta, 'messaggi': messaggi, 'errori': (DIVERSA,)}
+
+@regola('contributo_fse', 'Esito Regole Contr.FSE', cap_settimanale=100.0, cap_riga=300.0, tolleranza=0.0001)
+def _compila_contributo_fse(p: dict) -> dict:
+    # Non negativo, <= cap_riga per riga, 0 se settimane = 0, <= min(costo/sett., cap_settimanale) * settimane
+    ENTRO_MASSIMO, ZERO_SETTIMANE, NEGATIVO, OLTRE_CAP_RIGA, SETTIMANE_ZERO_KO, OLTRE_MASSIMO = range(6)
+    limite_riga = p['cap_riga'] + p['tolleranza']
+    cap_settimanale, tolleranza = p['cap_settimanale'], p['tolleranza']
+    msg_cap_riga = f" supera il limite assoluto di {fmt_limite(p['cap_riga'])}€ per singola riga."
+    msg_cap_settimanale = f" e cap {fmt_limite(cap_settimanale)}€))"
+
+    def valuta(c: dict) -> tuple[np.ndarray, dict]:
+        val_a, val_d, weeks = c['A'], c['D'], c['settimane']
+        n = len(val_a)
+        # I casi sono valutati nello stesso ordine di check_contribution_rules
+        negative = val_a < 0
+        over_row_cap = ~negative & (val_a > limite_riga)
+        zero_weeks = ~negative & ~over_row_cap & (weeks == 0)
+        zero_weeks_ko = zero_weeks & ~np.isclose(val_a, 0.0)
+        with_weeks = ~negative & ~over_row_cap & ~zero_weeks
+        cost_per_week = np.where(weeks > 0, _round2(np.divide(val_d, weeks, out=np.zeros(n), where=weeks > 0)), 0.0)
+        max_weekly = np.minimum(cost_per_week, cap_settimanale)
+        expected = _round2(max_weekly * weeks)
+        over_expected = with_weeks & (val_a > (expected + tolleranza))
+        caso = np.select([negative, over_row_cap, zero_weeks_ko, zero_weeks, over_expected],
+                         [NEGATIVO, OLTRE_CAP_RIGA, SETTIMANE_ZERO_KO, ZERO_SETTIMANE, OLTRE_MASSIMO],
+                         default=ENTRO_MASSIMO).astype(np.int8)
+        return caso, {'massimo': expected, 'massimo_settimanale': max_weekly, 'costo_settimanale': cost_per_week}
+
+    def messaggi(caso: np.ndarray, c: dict) -> np.ndarray:
+        val_a, weeks, expected = c['A'], c['settimane'], c['massimo']
+        msg = np.empty(len(caso), dtype=object)
+        sel = caso == NEGATIVO
+        msg[sel] = "❌ Contr. FSE (A)=" + _fmt2(val_a[sel]) + " non può essere negativo."
+        sel = caso == OLTRE_CAP_RIGA
+        msg[sel] = "❌ Contr. FSE (A)=" + _fmt2(val_a[sel]) + msg_cap_riga
+        sel = caso == SETTIMANE_ZERO_KO
+        msg[sel] = "❌ Contr. FSE (A)=" + _fmt2(val_a[sel]) + " > 0 ma N. settimane è 0."
+        msg[caso == ZERO_SETTIMANE] = "✅ OK (0 settimane, Contr. FSE=0)"
+        sel = caso == OLTRE_MASSIMO
+        msg[sel] = ("❌ Contr. FSE (A)=" + _fmt2(val_a[sel]) + " supera il massimo calcolabile per N. settimane (" +
+                    _fmt2(expected[sel]) + " = " + weeks[sel].astype(str).astype(object) + " sett. * " +
+                    _fmt2(c['massimo_settimanale'][sel]) + "€/sett. (min tra costo/sett: " + _fmt2(c['costo_settimanale'][sel]) +
+                    msg_cap_settimanale)
+        sel = caso == ENTRO_MASSIMO
+        msg[sel] = "✅ OK (Contr.FSE=" + _fmt2(val_a[sel]) + " ≤ Max calcolato=" + _fmt2(expected[sel]) + ")"
+        return msg
+    return {'valuta': valuta, 'messaggi': messaggi, 'errori': (NEGATIVO, OLTRE_CAP_RIGA, SETTIMANE_ZERO_KO, OLTRE_MASSIMO)}
+
+@regola('controlli_formali', 'Esito Contr.Formali', percentuale=0.05)
+def _compila_controlli_formali(p: dict) -> dict:
+    CORRISPONDE, NON_NUMERICO, DIVERSO = 0, 1, 2
+    percentuale = p['percentuale']
+    calcolato = f"Calcolato {fmt_limite(percentuale * 100)}%="
+
+    def valuta(c: dict) -> tuple[np.ndarray, dict]:
+        # Come check_controlli_formali: un FSE NaN vale 0, un dichiarato NaN non è un errore
+        fse = np.nan_to_num(c['A'], nan=0.0, posinf=np.inf, neginf=-np.inf)
+        calculated = _round2(fse * percentuale)
+        declared = c['dichiarato']
+        declared_missing = np.isnan(declared)
+        caso = np.where(declared_missing, NON_NUMERICO, np.where(np.isclose(declared, calculated), CORRISPONDE, DIVERSO))
+        return caso.astype(np.int8), {'calcolato': calculated}
+
+    def messaggi(caso: np.ndarray, c: dict) -> np.ndarray:
+        declared, calculated = c['dichiarato'], c['calcolato']
+        declared_inputs = c.get('dichiarato_input', declared).astype(str).astype(object)
+        msg = np.empty(len(caso), dtype=object)
+        sel = caso == NON_NUMERICO
+        msg[sel] = ("ℹ️ " + calcolato + _fmt2(calculated[sel]) + " (Valore dich./fornito '" +
+                    declared_inputs[sel] + "' non numerico o mancante)")
+        sel = caso == CORRISPONDE
+        msg[sel] = ("✅ OK (Dich./Fornito (" + declared_inputs[sel] + ")=" + _fmt2(declared[sel]) +
+                    ", " + calcolato + _fmt2(calculated[sel]) + ")")
+        sel = caso == DIVERSO
+        msg[sel] = ("❌ Dich./Fornito (" + declared_inputs[sel] + ")=" + _fmt2(declared[sel]) +
+                    " ≠ " + calcolato + _fmt2(calculated[sel]))
+        return msg
+    return {'valuta': valuta, 'messaggi': messaggi, 'errori': (DIVERSO,)}
+
+@regola('cap_bambino', 'Verifica Cap FSE per Bambino (batch)', cap=300.0, tolleranza=0.0001)
+def _compila_cap_bambino(p: dict) -> dict:
+    # Per bambino, non per riga: 'fse_batch' (totale nel batch) e 'fse_storico' (già registrato, o None)
+    ENTRO_CAP, SUPERATO = 0, 1
+    limite = p['cap'] + p['tolleranza']
+    etichetta = f"❌ Superato cap {fmt_limite(p['cap'])}€"
+
+    def valuta(c: dict) -> tuple[np.ndarray, dict]:
+        batch, storico = c['fse_batch'], c.get('fse_storico')
+        totale = batch if storico is None else batch + storico
+        return np.where(totale > limite, SUPERATO, ENTRO_CAP).astype(np.int8), {'fse_totale': totale}
+
+    def messaggi(caso: np.ndarray, c: dict) -> np.ndarray:
+        batch, storico, totale = c['fse_batch'], c.get('fse_storico'), c['fse_totale']
+        msg = np.full(len(caso), '✅ OK', dtype=object)
+        for g in np.flatnonzero(caso == SUPERATO).tolist():
+            if storico is None:
+                msg[g] = f"{etichetta} ({totale[g]:.2f}€ totali nel batch)"
+            else:
+                msg[g] = f"{etichetta} ({totale[g]:.2f}€ totali: batch {batch[g]:.2f}€ + storico {storico[g]:.2f}€ già registrati)"
+        if storico is not None:
+            for g in np.flatnonzero(caso == ENTRO_CAP).tolist():
+                msg[g] = f"✅ OK (batch {batch[g]:.2f}€ + storico {storico[g]:.2f}€ = {totale[g]:.2f}€)"
+        return msg
+    return {'valuta': valuta, 'messaggi': messaggi, 'errori': (SUPERATO,)}
+
+REGOLE_PER_RIGA = ['somma_retta', 'contributo_fse', 'controlli_formali']
+
+# --- Caricamento e compilazione ---
+
+def _parametri_da_file(percorso: str) -> dict:
+    """Sezione 'regole' del file (nome regola -> parametri), validata contro il registro."""
+    with open(percorso, encoding='utf-8') as f:
+        contenuto = yaml.load(f, Loader=SafeLoader) or {}
+    sezione = (contenuto.get('regole') or {}) if isinstance(contenuto, dict) else None
+    if not isinstance(sezione, dict):
+        raise ValueError(f"'{percorso}': la sezione 'regole' deve essere un elenco nome_regola: parametri.")
+    for nome, parametri in sezione.items():
+        if nome not in REGISTRO_REGOLE:
+            raise ValueError(f"'{percorso}': regola '{nome}' sconosciuta (disponibili: {', '.join(REGISTRO_REGOLE)}).")
+        for chiave, valore in (parametri or {}).items():
+            if chiave not in REGISTRO_REGOLE[nome]['parametri']:
+                raise ValueError(f"'{percorso}': parametro '{chiave}' non previsto per la regola '{nome}'.")
+            if isinstance(valore, bool) or not isinstance(valore, (int, float)) or valore < 0:
+                raise ValueError(f"'{percorso}': {nome}.{chiave} deve essere un numero non negativo (trovato {valore!r}).")
+    return sezione
+
+def compila_regole(parametri: Union[dict, None] = None) -> dict:
+    """
+    Compila tutte le regole del registro con i parametri indicati (nome regola -> {parametro: valore};
+    quelli non indicati restano ai default).
+    Returns:
+        dict: 'parametri' (nome -> parametri effettivi), 'compilate' (nome -> {'valuta', 'messaggi', 'errori'}).
+    """
+    parametri = parametri or {}
+    regole = {'parametri': {}, 'compilate': {}}
+    for nome, voce in REGISTRO_REGOLE.items():
+        effettivi = {k: float(v) for k, v in {**voce['parametri'], **(parametri.get(nome) or {})}.items()}
+        regole['parametri'][nome] = effettivi
+        regole['compilate'][nome] = voce['compila'](effettivi)
+    return regole
+
+def carica_regole(percorso: Union[str, None] = None) -> dict:
+    """Regole compilate con i parametri di percorso (default REGOLE_FILE; i default del registro se il file non esiste)."""
+    percorso = percorso or REGOLE_FILE
+    return compila_regole(_parametri_da_file(percorso) if os.path.exists(percorso) else None)
+
+_REGOLE_CACHE = {} # percorso -> (mtime del file o None, regole compilate)
+
+def get_regole(percorso: Union[str, None] = None) -> dict:
+    """
+    Regole compilate per percorso, ricompilate solo se il file cambia (mtime): i motori di validazione
+    la chiamano una volta per batch. Un file non valido solleva ValueError (o yaml.YAMLError).
+    """
+    percorso = percorso or REGOLE_FILE
+    try:
+        mtime = os.stat(percorso).st_mtime_ns
+    except OSError:
+        mtime = None
+    cached = _REGOLE_CACHE.get(percorso)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    regole = carica_regole(percorso)
+    _REGOLE_CACHE[percorso] = (mtime, regole)
+    return regole
+
+def regole_per_parametri(parametri: dict) -> dict:
+    """Regole compilate con parametri già effettivi (es. quelli salvati con degli esiti compatti)."""
+    regole = get_regole()
+    return regole if regole['parametri'] == parametri else compila_regole(parametri)
+
+#cartella/utils/validation_rules.py